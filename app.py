@@ -1,25 +1,47 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, g, send_from_directory
+from flask import (Flask, render_template, request, redirect, url_for, flash, g, send_from_directory,
+                   session, jsonify, Response, stream_with_context, abort, has_request_context)
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_wtf.csrf import CSRFProtect, CSRFError
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import NotFound
 from werkzeug.middleware.proxy_fix import ProxyFix
 import requests
+from urllib3.exceptions import ConnectTimeoutError
 import secrets
+import random
 import string
 import os
 from dotenv import load_dotenv
 import pytesseract
-from PIL import Image
+from PIL import Image, features
 import io
 import re
 import difflib
+import math
+import bisect
+from array import array
+from decimal import Decimal, ROUND_HALF_UP
 import pdfplumber
 import psycopg2
 import psycopg2.extras
 import uuid
+import hashlib
+import mimetypes
+import threading
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import time
+from datetime import date, datetime, timedelta
 import cv2
 import numpy as np
 import logging
+import sys
+import csv
+import json
+import click
 logging.basicConfig(
     level=logging.INFO,
     format='[%(asctime)s] %(levelname)s in %(module)s: %(message)s'
@@ -28,6 +50,14 @@ logging.basicConfig(
 load_dotenv()
 # Use DATABASE_URL if provided (Render) otherwise local sqlite file (dev)
 DATABASE_URL = os.environ.get('DATABASE_URL')  # e.g. postgres://...
+# Hosted Postgres needs TLS; local servers (tests, dev) usually don't offer it.
+DATABASE_SSLMODE = os.environ.get('DATABASE_SSLMODE', 'require')
+
+
+def connect_db():
+    """New connection to DATABASE_URL."""
+    return psycopg2.connect(DATABASE_URL, sslmode=DATABASE_SSLMODE)
+
 
 app = Flask(__name__)
 
@@ -70,6 +100,8 @@ login_manager.init_app(app)
 def handle_csrf_error(e):
     """Show a friendly message instead of a raw 400 when a CSRF token is
     missing or expired (e.g. the user left a form open too long)."""
+    if request.is_json:
+        return jsonify({'error': 'Your session expired. Please reload the page.'}), 400
     flash("Your session expired. Please try again.")
     return redirect(request.referrer or url_for('index'))
 
@@ -101,32 +133,217 @@ def generate_invite_code(cursor, length=8):
             return code
 
 
+# ── Supabase Auth HTTP client ────────────────────────────────────────────────
+# One pooled keep-alive session for all GoTrue calls, so login/register/
+# resend/recover don't each pay DNS + TCP + TLS setup. Failures where the
+# request never reached GoTrue are retried a bounded number of times with
+# jittered backoff; a circuit breaker fails fast while the service is down.
+# Signup, recover and resend are POSTs that mustn't run twice, so a failure
+# that may come after GoTrue got the request (a 504, a connection dropped
+# mid-request) is only retried for idempotent methods.
+
+SUPABASE_TIMEOUT = float(os.environ.get('SUPABASE_TIMEOUT', 10))       # seconds per attempt
+SUPABASE_MAX_RETRIES = int(os.environ.get('SUPABASE_MAX_RETRIES', 2))
+SUPABASE_GATEWAY_STATUSES = (502, 503, 504)
+# Statuses where the request never reached GoTrue, retried for any method.
+SUPABASE_RETRY_STATUSES = (502, 503)
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 8))  # per worker, as in gunicorn.conf.py
+
+
+class Histogram:
+    """Thread-safe latency histogram with cumulative Prometheus-style buckets
+    (seconds)."""
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.sum += seconds
+            for k, upper in enumerate(self.buckets):
+                if seconds <= upper:
+                    self.counts[k] += 1
+
+    def snapshot(self):
+        """{'buckets': [(upper, cumulative_count)], 'count', 'sum'}"""
+        with self._lock:
+            return {'buckets': list(zip(self.buckets, self.counts)),
+                    'count': self.count, 'sum': self.sum}
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and rejects calls for
+    `cooldown` seconds; then lets a single trial call through (half-open),
+    which closes it on success or re-opens it on failure."""
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+def _new_auth_session():
+    s = requests.Session()
+    # pool_maxsize matches gunicorn's thread count (WEB_THREADS), so
+    # concurrent logins don't fall back to throwaway connections.
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=WEB_THREADS)
+    s.mount('https://', adapter)
+    s.mount('http://', adapter)
+    return s
+
+
+_auth_http = _new_auth_session()
+_auth_breaker = CircuitBreaker(
+    threshold=int(os.environ.get('SUPABASE_BREAKER_THRESHOLD', 5)),
+    cooldown=float(os.environ.get('SUPABASE_BREAKER_COOLDOWN', 30)),
+)
+auth_latency = {}  # endpoint path (no query string) -> Histogram
+_auth_latency_lock = threading.Lock()
+
+
+def _observe_latency(registry, lock, key, seconds, buckets=Histogram.BUCKETS):
+    """Observe into registry[key], creating the Histogram on first use."""
+    with lock:
+        hist = registry.get(key)
+        if hist is None:
+            hist = registry[key] = Histogram(buckets)
+    hist.observe(seconds)
+
+
+def _observe_auth_latency(endpoint, seconds):
+    _observe_latency(auth_latency, _auth_latency_lock, endpoint, seconds)
+
+
+def _retry_delay(attempt):
+    """Exponential backoff with full jitter: 0..(0.25s * 2^attempt)."""
+    return random.uniform(0, 0.25 * (2 ** attempt))
+
+
+def _never_sent(error):
+    """Whether a requests.ConnectionError happened while connecting, before
+    any of the request was sent."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0] if error.args else None, 'reason', None)
+    return isinstance(reason, ConnectTimeoutError)  # includes NewConnectionError
+
+
 def supabase_auth(method, path, **kwargs):
     """Call Supabase's GoTrue REST API. Returns (status_code, json_body).
     Returns a synthetic 503 if Supabase isn't configured or unreachable, so
     callers can always treat the result as (status, dict)."""
     if not SUPABASE_URL or not SUPABASE_ANON_KEY:
         return 503, {"error_description": "Auth service not configured."}
+    unavailable = 503, {"error_description": "Auth service unavailable."}
+    if not _auth_breaker.allow():
+        logging.warning("Supabase auth circuit open; failing fast.")
+        return unavailable
     headers = {
         'apikey': SUPABASE_ANON_KEY,
         'Authorization': f'Bearer {SUPABASE_ANON_KEY}',
         'Content-Type': 'application/json',
     }
     headers.update(kwargs.pop('headers', {}))
-    try:
-        resp = requests.request(method, f'{SUPABASE_URL}/auth/v1{path}', headers=headers, timeout=10, **kwargs)
-        return resp.status_code, resp.json()
-    except Exception as e:
-        logging.error(f"Supabase auth request failed: {e}")
-        return 503, {"error_description": "Auth service unavailable."}
+    endpoint = path.split('?', 1)[0]
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    retry_statuses = SUPABASE_GATEWAY_STATUSES if idempotent else SUPABASE_RETRY_STATUSES
+
+    for attempt in range(SUPABASE_MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(_retry_delay(attempt - 1))
+        start = time.perf_counter()
+        try:
+            resp = _auth_http.request(method, f'{SUPABASE_URL}/auth/v1{path}', headers=headers,
+                                      timeout=SUPABASE_TIMEOUT, **kwargs)
+        except requests.ConnectionError as e:
+            logging.warning(f"Supabase auth connection failed (attempt {attempt + 1}): {e}")
+            if idempotent or _never_sent(e):
+                continue
+            break
+        except Exception as e:
+            logging.error(f"Supabase auth request failed: {e}")
+            _auth_breaker.record_failure()
+            return unavailable
+        finally:
+            _observe_auth_latency(endpoint, time.perf_counter() - start)
+
+        if resp.status_code in SUPABASE_GATEWAY_STATUSES:
+            logging.warning(f"Supabase auth returned {resp.status_code} (attempt {attempt + 1})")
+            if resp.status_code in retry_statuses:
+                continue
+            break
+        _auth_breaker.record_success()
+        try:
+            return resp.status_code, resp.json()
+        except ValueError:
+            return resp.status_code, {}
+
+    _auth_breaker.record_failure()
+    return unavailable
+
+
+# How long a session may rebuild the user from its cached identity before the
+# users table is consulted again.
+SESSION_USER_TTL = float(os.environ.get('SESSION_USER_TTL', 300))  # seconds
 
 
 @login_manager.user_loader
 def load_user(user_id):
+    """Rebuild the logged-in User. The signed session caches the user's group
+    and the household roster_version it was checked against; while that
+    version is current and the user is still on the (cached) roster, no users
+    query is needed. A membership change bumps the version, so e.g. a removed
+    member falls back to the DB within the roster cache TTL."""
+    ident = session.get('identity')
+    if (ident and ident.get('id') == user_id
+            and time.time() - ident.get('at', 0) < SESSION_USER_TTL):
+        version, members = _load_roster(ident['group_id'])
+        if version == ident['ver']:
+            for m in members:
+                if m['id'] == user_id:
+                    return User(user_id, m['name'], ident['group_id'])
+
     cursor = get_cursor()
     cursor.execute('SELECT id, name, group_id FROM users WHERE id = %s', (user_id,))
     row = cursor.fetchone()
-    return User(row['id'], row['name'], row['group_id']) if row else None
+    if not row:
+        session.pop('identity', None)
+        return None
+    session['identity'] = {'id': row['id'], 'group_id': row['group_id'],
+                           'ver': roster_version(row['group_id']), 'at': time.time()}
+    return User(row['id'], row['name'], row['group_id'])
 
 @app.route("/login", methods=["GET", "POST"])
 def login():
@@ -237,6 +454,7 @@ def register():
             'INSERT INTO users (id, name, email, auth_uid, group_id, joined_at) VALUES (%s, %s, %s, %s, %s, NOW())',
             (user_id, username, email, user.get('id'), group_id)
         )
+        bump_roster_version(cursor, group_id)
         db.commit()
         flash("Account created! Check your email for a confirmation link before logging in.", "success")
         return redirect(url_for("login"))
@@ -295,6 +513,7 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
     """
+    pg_groups_alter_roster_version = "ALTER TABLE groups ADD COLUMN IF NOT EXISTS roster_version INTEGER NOT NULL DEFAULT 0;"
     pg_users_alter_group = "ALTER TABLE users ADD COLUMN IF NOT EXISTS group_id INTEGER REFERENCES groups(id);"
     pg_users_alter_joined_at = "ALTER TABLE users ADD COLUMN IF NOT EXISTS joined_at TIMESTAMP DEFAULT '2000-01-01';"
     pg_receipts_alter_group = "ALTER TABLE receipts ADD COLUMN IF NOT EXISTS group_id INTEGER REFERENCES groups(id);"
@@ -310,6 +529,19 @@ def init_db():
             FOREIGN KEY (payer_id) REFERENCES users(id)
         );
     """
+    # Maintained per-receipt summaries (see _apply_summary_deltas). Added
+    # without defaults first so existing rows stay NULL until backfilled.
+    pg_receipts_summary = [
+        "ALTER TABLE receipts ADD COLUMN IF NOT EXISTS item_count INTEGER;",
+        "ALTER TABLE receipts ADD COLUMN IF NOT EXISTS shared_cents BIGINT;",
+        "ALTER TABLE receipts ADD COLUMN IF NOT EXISTS excluded_cents BIGINT;",
+        "ALTER TABLE receipts ADD COLUMN IF NOT EXISTS assignee_cents JSONB;",
+        "ALTER TABLE receipts ALTER COLUMN item_count SET DEFAULT 0;",
+        "ALTER TABLE receipts ALTER COLUMN shared_cents SET DEFAULT 0;",
+        "ALTER TABLE receipts ALTER COLUMN excluded_cents SET DEFAULT 0;",
+        "ALTER TABLE receipts ALTER COLUMN assignee_cents SET DEFAULT '{}'::jsonb;",
+    ]
+    pg_items_receipt_index = "CREATE INDEX IF NOT EXISTS items_receipt_id_idx ON items (receipt_id);"
     pg_items = """
         CREATE TABLE IF NOT EXISTS items (
             id SERIAL PRIMARY KEY,
@@ -343,14 +575,39 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
     """
-
+    # Per-group monthly balance snapshots (see compact_balance_snapshots). A
+    # months row marks the month as compacted; deleting it drops its user rows.
+    pg_snapshot_months = """
+        CREATE TABLE IF NOT EXISTS balance_snapshot_months (
+            group_id INTEGER NOT NULL REFERENCES groups(id),
+            month DATE NOT NULL,
+            shared_total_cents BIGINT NOT NULL DEFAULT 0,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (group_id, month)
+        );
+    """
+    pg_snapshots = """
+        CREATE TABLE IF NOT EXISTS balance_snapshots (
+            group_id INTEGER NOT NULL,
+            month DATE NOT NULL,
+            user_id TEXT NOT NULL REFERENCES users(id),
+            personal_cents BIGINT NOT NULL DEFAULT 0,
+            shared_cents BIGINT NOT NULL DEFAULT 0,
+            paid_cents BIGINT NOT NULL DEFAULT 0,
+            settle_paid_cents BIGINT NOT NULL DEFAULT 0,
+            settle_received_cents BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (group_id, month, user_id),
+            FOREIGN KEY (group_id, month) REFERENCES balance_snapshot_months (group_id, month) ON DELETE CASCADE
+        );
+    """
 
     with app.app_context():
         if DATABASE_URL:
             # Use psycopg2 to create tables in Postgres
-            conn = psycopg2.connect(DATABASE_URL, sslmode='require')
+            conn = connect_db()
             cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
             cur.execute(pg_groups)
+            cur.execute(pg_groups_alter_roster_version)
             cur.execute(pg_users)
             cur.execute(pg_users_alter)
             cur.execute(pg_users_alter_email)
@@ -361,8 +618,13 @@ def init_db():
             cur.execute(pg_receipts)
             cur.execute(pg_receipts_alter_group)
             cur.execute(pg_items)
+            cur.execute(pg_items_receipt_index)
+            for stmt in pg_receipts_summary:
+                cur.execute(stmt)
             cur.execute(pg_overrides)
             cur.execute(pg_setup_tokens)
+            cur.execute(pg_snapshot_months)
+            cur.execute(pg_snapshots)
             # default users (use ON CONFLICT DO NOTHING)
             cur.execute("INSERT INTO users (id, name) VALUES (%s, %s) ON CONFLICT (id) DO NOTHING", ('eser', 'Eser'))
             cur.execute("INSERT INTO users (id, name) VALUES (%s, %s) ON CONFLICT (id) DO NOTHING", ('david', 'David'))
@@ -380,24 +642,257 @@ def init_db():
                 cur.execute("UPDATE users SET group_id = %s WHERE group_id IS NULL", (default_group_id,))
                 cur.execute("UPDATE receipts SET group_id = %s WHERE group_id IS NULL", (default_group_id,))
 
+            # Backfill receipt summaries for rows that predate them.
+            cur.execute("SELECT id FROM receipts WHERE item_count IS NULL OR assignee_cents IS NULL")
+            _refresh_receipt_summaries(cur, [r['id'] for r in cur.fetchall()])
+
             conn.commit()
             cur.close()
             conn.close()
 
 
+# ── Instrumentation ──────────────────────────────────────────────────────────
+# Every request records its route latency and how many statements it ran
+# (through TimedCursor) and how long they took; span() times pipeline stages
+# (OCR, PDF rendering, memory, ...). Per request this shows up in a
+# Server-Timing header (for signed-in users, or everyone with SERVER_TIMING=1)
+# and a log line for slow requests; across requests in Prometheus histograms
+# on /metrics (only served when METRICS_TOKEN is set and presented).
+# PROFILE_SLOW_MS turns on a sampling profiler that writes folded stacks
+# (flamegraph.pl / speedscope input) of requests slower than that to
+# PROFILE_DIR.
+
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '1000'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+SERVER_TIMING = os.getenv('SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', '0'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+route_latency = {}        # url rule -> Histogram
+route_queries = {}        # url rule -> Histogram of statements per request
+span_latency = {}         # span name -> Histogram
+db_query_latency = Histogram()
+_metrics_lock = threading.Lock()
+
+
+_span_capture = threading.local()  # .spans: list collecting this thread's spans, if set
+
+
+@contextmanager
+def span(name):
+    """Time a block: always into span_latency[name], and into the current
+    request's spans (for Server-Timing) when there is one."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def record_span(name, elapsed):
+    """Record a span measured elsewhere (e.g. in an OCR process)."""
+    _observe_latency(span_latency, _metrics_lock, name, elapsed)
+    if has_request_context() and 'spans' in g:
+        g.spans.append((name, elapsed))
+    captured = getattr(_span_capture, 'spans', None)
+    if captured is not None:
+        captured.append((name, elapsed))
+
+
+class TimedCursor(psycopg2.extras.RealDictCursor):
+    """RealDictCursor that counts and times each statement (execute_values
+    pages and COPY included) against the current request."""
+
+    def _timed(self, run, query):
+        start = time.perf_counter()
+        try:
+            return run()
+        finally:
+            elapsed = time.perf_counter() - start
+            db_query_latency.observe(elapsed)
+            if has_request_context() and 'query_count' in g:
+                g.query_count += 1
+                g.query_time += elapsed
+                if g.query_log is not None:
+                    g.query_log.append(query if isinstance(query, str) else query.decode())
+
+    def execute(self, query, vars=None):
+        return self._timed(lambda: super(TimedCursor, self).execute(query, vars), query)
+
+    def executemany(self, query, vars_list):
+        return self._timed(lambda: super(TimedCursor, self).executemany(query, vars_list), query)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(lambda: super(TimedCursor, self).copy_expert(sql, file, size), sql)
+
+
+def fold_stack(frame):
+    """A frame's stack in folded form: 'outer;...;inner', one entry per
+    function as 'name (file)'."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    """One daemon thread that samples the stacks of registered threads every
+    `interval` seconds into per-thread Counters of folded stacks."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = {}  # thread id -> Counter
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._active[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name='sampling-profiler')
+                self._thread.start()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._active.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, counts in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        counts[fold_stack(frame)] += 1
+
+
+_profiler = SamplingProfiler(PROFILE_INTERVAL) if PROFILE_SLOW_MS > 0 else None
+
+
+def _dump_profile(samples, elapsed_ms):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    endpoint = (request.endpoint or 'unknown').replace('.', '_')
+    path = os.path.join(PROFILE_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}-{endpoint}-{elapsed_ms:.0f}ms.folded')
+    with open(path, 'w') as f:
+        for stack, count in samples.most_common():
+            f.write(f'{stack} {count}\n')
+    logging.info(f"Profile of slow {request.method} {request.path} written to {path}")
+
+
+@app.before_request
+def _start_request_timing():
+    g.request_start = time.perf_counter()
+    g.query_count = 0
+    g.query_time = 0.0
+    g.query_log = [] if app.config.get('RECORD_QUERIES') else None
+    g.spans = []
+    if _profiler is not None:
+        _profiler.start(threading.get_ident())
+
+
+@app.after_request
+def _finish_request_timing(response):
+    if 'request_start' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_start
+    samples = _profiler.stop(threading.get_ident()) if _profiler is not None else None
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    _observe_latency(route_latency, _metrics_lock, rule, elapsed)
+    _observe_latency(route_queries, _metrics_lock, rule, g.query_count, QUERY_COUNT_BUCKETS)
+
+    if SERVER_TIMING or current_user.is_authenticated:
+        timings = [f'app;dur={elapsed * 1000:.1f}',
+                   f'db;dur={g.query_time * 1000:.1f};desc="{g.query_count} queries"']
+        timings += [f'{name.replace(" ", "_")};dur={seconds * 1000:.1f}' for name, seconds in g.spans]
+        response.headers['Server-Timing'] = ', '.join(timings)
+
+    elapsed_ms = elapsed * 1000
+    if elapsed_ms >= SLOW_REQUEST_MS:
+        spans = ', '.join(f'{name}={seconds * 1000:.0f}ms' for name, seconds in g.spans)
+        logging.info(f"Slow request {request.method} {request.path}: {elapsed_ms:.0f}ms, "
+                     f"{g.query_count} queries ({g.query_time * 1000:.0f}ms)" + (f", {spans}" if spans else ""))
+    if samples and elapsed_ms >= PROFILE_SLOW_MS:
+        _dump_profile(samples, elapsed_ms)
+    return response
+
+
+def prometheus_histogram(name, help_text, histograms, label=None):
+    """Prometheus text exposition of Histograms: `histograms` is one
+    Histogram, or {label value: Histogram} when `label` is given."""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    series = histograms.items() if label else [(None, histograms)]
+    for value, hist in sorted(series, key=lambda kv: str(kv[0])):
+        snap = hist.snapshot()
+        base = f'{label}="{_prometheus_escape(value)}",' if label else ''
+        for upper, count in snap['buckets']:
+            lines.append(f'{name}_bucket{{{base}le="{upper}"}} {count}')
+        lines.append(f'{name}_bucket{{{base}le="+Inf"}} {snap["count"]}')
+        labels = f'{{{base.rstrip(",")}}}' if label else ''
+        lines.append(f'{name}_sum{labels} {snap["sum"]}')
+        lines.append(f'{name}_count{labels} {snap["count"]}')
+    return lines
+
+
+def _prometheus_escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint."""
+    if not METRICS_TOKEN or not secrets.compare_digest(
+            request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        abort(404)
+    lines = []
+    lines += prometheus_histogram('splight_request_duration_seconds', 'Request latency by route.',
+                                  dict(route_latency), 'route')
+    lines += prometheus_histogram('splight_request_queries', 'SQL statements per request by route.',
+                                  dict(route_queries), 'route')
+    lines += prometheus_histogram('splight_db_query_duration_seconds', 'SQL statement latency.',
+                                  db_query_latency)
+    lines += prometheus_histogram('splight_stage_duration_seconds', 'Pipeline stage latency.',
+                                  dict(span_latency), 'stage')
+    lines += prometheus_histogram('splight_auth_request_duration_seconds', 'Supabase Auth latency by endpoint.',
+                                  dict(auth_latency), 'endpoint')
+    lines += prometheus_histogram('splight_upload_first_receipt_seconds',
+                                  'Streamed upload: submit to first receipt shown.', upload_first_receipt)
+    lines += prometheus_histogram('splight_upload_queue_wait_seconds',
+                                  'Upload files: queued to extraction started, by household.',
+                                  dict(upload_queue_wait), 'household')
+    lines += ['# HELP splight_upload_queue_depth Upload files waiting for a worker.',
+              '# TYPE splight_upload_queue_depth gauge',
+              f'splight_upload_queue_depth {_upload_scheduler.queued()}',
+              '# HELP splight_upload_rejected_total Uploads answered with 429, by reason.',
+              '# TYPE splight_upload_rejected_total counter']
+    lines += [f'splight_upload_rejected_total{{reason="{reason}"}} {count}'
+              for reason, count in sorted(upload_rejected.items())]
+    lines += ['# HELP splight_thumbnail_cache_bytes Bytes in the thumbnail disk cache.',
+              '# TYPE splight_thumbnail_cache_bytes gauge',
+              f'splight_thumbnail_cache_bytes {_thumb_cache.total_bytes if _thumb_cache else 0}']
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
 def get_db():
     if 'db' not in g:
-        conn = psycopg2.connect(DATABASE_URL, sslmode='require')
+        conn = connect_db()
         g.db = conn
     return g.db
 def get_cursor():
     db = get_db()
-    return db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    return db.cursor(cursor_factory=TimedCursor)
 
 
 @app.teardown_appcontext
 def close_db(e=None):
     """Close DB connection at request end."""
+    for group_id in g.pop('stale_rosters', ()):
+        with _roster_cache_lock:
+            _roster_cache.pop(group_id, None)
     db = g.pop('db', None)
     if db is not None:
         try:
@@ -406,15 +901,103 @@ def close_db(e=None):
             pass
 
 
+# ── Household roster ─────────────────────────────────────────────────────────
+# Nearly every page needs the current household's members (validation of
+# assignments, templates, balances). The roster is loaded once per request
+# (kept on g) and shared across requests through a short-TTL process cache.
+# Membership changes call bump_roster_version(), which increments
+# groups.roster_version and drops the cached copy; other worker processes
+# pick the change up when their TTL expires.
+
+ROSTER_CACHE_TTL = float(os.environ.get('ROSTER_CACHE_TTL', 30))  # seconds
+_roster_cache = {}  # group_id -> (expires_at, roster_version, members)
+_roster_cache_lock = threading.Lock()
+
+
+def get_roster(group_id):
+    """Members of a household, ordered by name: [{id, name, joined_at, email,
+    auth_uid}]. Shared between callers - treat as read-only."""
+    return _load_roster(group_id)[1]
+
+
+def roster_version(group_id):
+    """groups.roster_version as of the (cached) roster."""
+    return _load_roster(group_id)[0]
+
+
+def _load_roster(group_id):
+    """(roster_version, members) for a household, via g and the process cache."""
+    if group_id is None:
+        return 0, []
+    rosters = g.setdefault('rosters', {})
+    if group_id in rosters:
+        return rosters[group_id]
+
+    now = time.monotonic()
+    with _roster_cache_lock:
+        cached = _roster_cache.get(group_id)
+    if cached and cached[0] > now:
+        version, members = cached[1], cached[2]
+    else:
+        cursor = get_cursor()
+        cursor.execute(
+            'SELECT gr.roster_version, u.id, u.name, u.joined_at, u.email, u.auth_uid '
+            'FROM groups gr LEFT JOIN users u ON u.group_id = gr.id '
+            'WHERE gr.id = %s ORDER BY u.name',
+            (group_id,)
+        )
+        rows = cursor.fetchall()
+        version = rows[0]['roster_version'] if rows else 0
+        members = [{'id': r['id'], 'name': r['name'], 'joined_at': r['joined_at'],
+                    'email': r['email'], 'auth_uid': r['auth_uid']}
+                   for r in rows if r['id'] is not None]
+        return _cache_roster(group_id, version, members)
+    rosters[group_id] = (version, members)
+    return rosters[group_id]
+
+
+def _cache_roster(group_id, version, members):
+    """Keep a freshly read roster on g and in the process cache."""
+    with _roster_cache_lock:
+        _roster_cache[group_id] = (time.monotonic() + ROSTER_CACHE_TTL, version, members)
+    g.setdefault('rosters', {})[group_id] = (version, members)
+    return version, members
+
+
+def roster_ids(group_id):
+    """Set of member ids of a household (valid payers/assignees)."""
+    return {m['id'] for m in get_roster(group_id)}
+
+
+def bump_roster_version(cursor, group_id):
+    """Record a membership change. Call in the same transaction as the change;
+    the process cache is dropped now and again at request teardown (after the
+    commit), so no request can re-cache the pre-commit roster."""
+    cursor.execute(
+        'UPDATE groups SET roster_version = roster_version + 1 WHERE id = %s',
+        (group_id,)
+    )
+    _forget_roster(group_id)
+    g.setdefault('stale_rosters', set()).add(group_id)
+
+
+def _forget_roster(group_id):
+    with _roster_cache_lock:
+        _roster_cache.pop(group_id, None)
+    g.get('rosters', {}).pop(group_id, None)
+    snapshots = g.get('group_snapshots', {})
+    for key in [key for key in snapshots if key[0] == group_id]:
+        del snapshots[key]
+
+
 @app.context_processor
 def inject_all_users():
     """Make the list of the current user's household members available to every template."""
     try:
         if not current_user.is_authenticated:
             return {'all_users': []}
-        cursor = get_cursor()
-        cursor.execute('SELECT id, name FROM users WHERE group_id = %s ORDER BY name', (current_user.group_id,))
-        return {'all_users': cursor.fetchall()}
+        return {'all_users': [{'id': m['id'], 'name': m['name']}
+                              for m in get_roster(current_user.group_id)]}
     except Exception:
         return {'all_users': []}
 
@@ -498,18 +1081,46 @@ def _price_to_float(price_str):
 # but a multi-column layout that OCR-style line parsing can't handle. Each vendor
 # gets a coordinate-based parser, chosen by a detector on the extracted text.
 
+class LayoutIndex:
+    """Items (word dicts or rows) of one page sorted by their 'top', so a
+    parser can ask for what lies in a vertical band with two bisections
+    instead of scanning the page for every anchor.
+
+    near() returns a superset: the band widened by LAYOUT_SLACK, in input
+    order. Callers keep their exact coordinate test on the result, so a
+    parser gives the same output as a full scan, ties included."""
+    LAYOUT_SLACK = 1.0
+
+    def __init__(self, items):
+        order = sorted(range(len(items)), key=lambda k: items[k]['top'])
+        self._tops = [items[k]['top'] for k in order]
+        self._order = order
+        self._items = items
+
+    def near(self, top, above, below):
+        """Items with top in [top - above, top + below] (plus slack)."""
+        lo = bisect.bisect_left(self._tops, top - above - self.LAYOUT_SLACK)
+        hi = bisect.bisect_right(self._tops, top + below + self.LAYOUT_SLACK)
+        return [self._items[k] for k in sorted(self._order[lo:hi])]
+
+
 def _cluster_name_rows(words, x_lo, x_hi, size_min):
     """Cluster the body words in a column into visual rows (by vertical position),
     each joined left-to-right. Used to reassemble product names."""
     toks = [w for w in words if w.get('size', 0) >= size_min and x_lo <= w['x0'] <= x_hi]
     rows = []
+    row_keys = []  # round(top) of each row's first word; ascending, like rows
     for w in sorted(toks, key=lambda w: (round(w['top']), w['x0'])):
-        for r in rows:
+        # A row within 4px has round(top) >= round(w.top) - 4.5, and rows are
+        # created in round(top) order: only that suffix can match.
+        start = bisect.bisect_left(row_keys, round(w['top']) - 5)
+        for r in rows[start:]:
             if abs(r['top'] - w['top']) <= 4:
                 r['w'].append(w)
                 break
         else:
             rows.append({'top': w['top'], 'w': [w]})
+            row_keys.append(round(w['top']))
     return [{'top': r['top'],
              'text': ' '.join(x['text'] for x in sorted(r['w'], key=lambda x: x['x0']))}
             for r in sorted(rows, key=lambda r: r['top'])]
@@ -531,16 +1142,16 @@ def parse_picnic_words(pages_words):
     line (so wrapped 2nd name lines are included)."""
     items = []
     for words in pages_words:
-        smalls = [w for w in words if w['text'].isdigit() and w.get('size', 0) < 12 and w['x0'] > 393]
+        smalls = LayoutIndex([w for w in words if w['text'].isdigit() and w.get('size', 0) < 12 and w['x0'] > 393])
         clusters = []
         for w in words:
             if w['text'].isdigit() and w.get('size', 0) >= 12 and w['x0'] > 350:
-                cand = [s for s in smalls if -3 <= (s['top'] - w['top']) <= 9]
+                cand = [s for s in smalls.near(w['top'], 3, 9) if -3 <= (s['top'] - w['top']) <= 9]
                 cents = int(min(cand, key=lambda s: abs(s['top'] - w['top']))['text']) if cand else 0
                 clusters.append({'top': w['top'], 'price': int(w['text']) + cents / 100.0})
         clusters.sort(key=lambda c: c['top'])
 
-        name_rows = _cluster_name_rows(words, 230, 380, 7.5)
+        name_rows = LayoutIndex(_cluster_name_rows(words, 230, 380, 7.5))
 
         # Everything from the first totals/deposit label (Pfand, Zwischensumme,
         # Gesamtbetrag, MwSt) downward is not a grocery item.
@@ -559,7 +1170,7 @@ def parse_picnic_words(pages_words):
             if k + 1 < len(clusters) and 0 < clusters[k + 1]['top'] - c['top'] <= 30:
                 final = clusters[k + 1]['price']
                 used[k + 1] = True
-            names = sorted((nr for nr in name_rows if c['top'] - 15 <= nr['top'] <= c['top'] + 6),
+            names = sorted((nr for nr in name_rows.near(c['top'], 15, 6) if c['top'] - 15 <= nr['top'] <= c['top'] + 6),
                            key=lambda nr: nr['top'])
             desc = ' '.join(nr['text'] for nr in names).strip()
             if not any(ch.isalpha() for ch in desc):
@@ -573,11 +1184,187 @@ def parse_picnic_pdf(pdf):
     return parse_picnic_words([pg.extract_words(extra_attrs=['size']) for pg in pdf.pages])
 
 
-# Registry of (detector, parser) for digital PDFs. First matching detector wins;
-# if none match, we fall back to OCR-style parse_bill_text on the plain text.
-DIGITAL_PDF_PARSERS = [
-    (lambda text: 'picnic' in text.lower() or 'dein bon' in text.lower(), parse_picnic_pdf),
-]
+# ── Vendor parsers ───────────────────────────────────────────────────────────
+# Receipts from known vendors get their own parser: parse_pdf for a digital
+# PDF's layout, parse_text for its text (a PDF's text layer or an image's OCR
+# output). Each parser declares fingerprint tokens - lowercase substrings of
+# its first page - a version, bumped whenever its output changes and logged
+# with each extraction, and fixture files under tests/fixtures/vendors/ that
+# the test suite replays. All tokens of all parsers are matched in a single
+# Aho-Corasick pass over the text, so dispatch stays O(text) however many
+# vendors are registered; the parser with the most distinct tokens found
+# wins (ties: the earlier registered). Without a match, or for a source the
+# vendor has no parser for, parse_bill_text handles the text; so it does
+# when the vendor's parser finds no items (a layout it doesn't know yet).
+# Fingerprints are the vendor's own names and domains, never generic
+# receipt words ("bestellnummer", "summe") that other receipts print too.
+
+class VendorParser:
+    def __init__(self, name, version, fingerprints, parse_pdf=None, parse_text=None, fixtures=()):
+        self.name = name
+        self.version = version
+        self.fingerprints = tuple(token.lower() for token in fingerprints)
+        self.parse_pdf = parse_pdf
+        self.parse_text = parse_text
+        self.fixtures = tuple(fixtures)
+
+    def __repr__(self):
+        return f'<VendorParser {self.name}@{self.version}>'
+
+
+class TokenAutomaton:
+    """Aho-Corasick automaton over fixed tokens: matches(text) returns the
+    set of tokens occurring in text, in one pass."""
+
+    def __init__(self, tokens):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [set()]
+        for token in tokens:
+            state = 0
+            for ch in token:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = self._goto[state][ch] = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(set())
+                state = nxt
+            self._out[state].add(token)
+        # Breadth-first: each state's failure link is the longest proper
+        # suffix of its path that is also a path from the root.
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+    def matches(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+VENDOR_PARSERS = []
+_vendor_automaton = None
+
+
+def register_vendor_parser(parser):
+    global _vendor_automaton
+    VENDOR_PARSERS.append(parser)
+    _vendor_automaton = None
+    return parser
+
+
+def detect_vendor(text):
+    """The registered VendorParser whose fingerprints best match text
+    (normally the first page), or None."""
+    global _vendor_automaton
+    automaton = _vendor_automaton
+    if automaton is None:
+        automaton = _vendor_automaton = TokenAutomaton({t for p in VENDOR_PARSERS for t in p.fingerprints})
+    found = automaton.matches((text or '').lower())
+    best, best_score = None, 0
+    for parser in VENDOR_PARSERS:
+        score = sum(1 for token in set(parser.fingerprints) if token in found)
+        if score > best_score:
+            best, best_score = parser, score
+    return best
+
+
+# Supermarket eBons print one line per article ending in its VAT class
+# ("BIO VOLLMILCH 1,19 B"); quantity/weight detail lines, headers and the
+# payment block carry no class letter. Anchoring on it avoids the keyword
+# filter of parse_bill_text (which drops e.g. "BARILLA" for containing "bar").
+# OCR often reads the decimal comma as a period, so both are accepted.
+_VAT_CLASS_LINE = re.compile(
+    r'^(?P<desc>.*?[A-Za-zÄÖÜäöüß].*?)\s+(?P<price>-?\d{1,4}[.,]\d{2})\s*(?:€\s*)?[AB]\s*\*?$')
+
+
+def vat_class_parser(stop_prefixes):
+    """parse_text for an eBon: article lines until a line starting with one
+    of stop_prefixes (the totals). A weighed article prints its name alone
+    and the price on the weight line below ("0,642 kg x 2,99 EUR/kg 1,92 A");
+    it keeps the name."""
+    def parse(text):
+        items = []
+        name_above = None
+        for line in text.split('\n'):
+            line = line.strip()
+            if line.lower().startswith(stop_prefixes):
+                break
+            match = _VAT_CLASS_LINE.match(line)
+            if match:
+                description = match.group('desc').strip()
+                if name_above and description[:1].isdigit():
+                    description = name_above
+                items.append({'description': description,
+                              'price': _price_to_float(match.group('price')), 'is_valid': True})
+                name_above = None
+            else:
+                name_above = line if line[:1].isalpha() and not re.search(r'\d[.,]\d{2}', line) else None
+        return items
+    return parse
+
+
+# Amazon invoices list "quantity  description  line total €" rows.
+_AMAZON_LINE = re.compile(r'^(?P<qty>\d{1,3})\s*x?\s+(?P<desc>.*?[A-Za-zÄÖÜäöüß].*?)\s+(?P<price>\d{1,5},\d{2})\s*€$')
+
+
+def parse_amazon_text(text):
+    items = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if line.lower().startswith(('zwischensumme', 'gesamtpreis', 'rechnungsbetrag')):
+            break
+        match = _AMAZON_LINE.match(line)
+        if match and _price_to_float(match.group('price')) > 0:
+            items.append({'description': match.group('desc').strip(),
+                          'price': _price_to_float(match.group('price')), 'is_valid': True})
+    return items
+
+
+register_vendor_parser(VendorParser(
+    'picnic', '2', ('picnic', 'dein bon'), parse_pdf=parse_picnic_pdf, fixtures=('picnic.json',)))
+register_vendor_parser(VendorParser(
+    'rewe', '2', ('rewe markt', 'rewe ebon', 'rewe.de'),
+    parse_text=vat_class_parser(('summe', 'zu zahlen')), fixtures=('rewe.json',)))
+register_vendor_parser(VendorParser(
+    'lidl', '2', ('lidl', 'lidl plus'),
+    parse_text=vat_class_parser(('zu zahlen', 'summe')), fixtures=('lidl.json',)))
+register_vendor_parser(VendorParser(
+    'edeka', '2', ('edeka', 'edeka zentrale'),
+    parse_text=vat_class_parser(('summe', 'gesamt')), fixtures=('edeka.json',)))
+register_vendor_parser(VendorParser(
+    'amazon', '1', ('amazon.de', 'amazon eu s'),
+    parse_text=parse_amazon_text, fixtures=('amazon.json',)))
+
+
+def parse_receipt_text(text, parser=None):
+    """Items from receipt text, by the vendor's text parser if it has one and
+    it finds any, otherwise by parse_bill_text."""
+    if parser is not None and parser.parse_text is not None:
+        items = parser.parse_text(text)
+        logging.info(f"Vendor parser {parser.name}@{parser.version} (text): {len(items)} items.")
+        if items:
+            return items
+        logging.warning(f"Vendor parser {parser.name}@{parser.version} found no items; using generic parsing.")
+    return parse_bill_text(text)
+
+
+# Longest side, in pixels, of an image handed to Tesseract.
+OCR_MAX_DIM = 1800
 
 
 def preprocess_image(pil_image):
@@ -588,10 +1375,9 @@ def preprocess_image(pil_image):
     # 1. Downscale large photos. OCR time and the deskew step below both
     # scale with pixel count, and phone photos are often far larger than
     # Tesseract needs.
-    max_dim = 1800
     h, w = img.shape[:2]
-    if max(h, w) > max_dim:
-        scale = max_dim / max(h, w)
+    if max(h, w) > OCR_MAX_DIM:
+        scale = OCR_MAX_DIM / max(h, w)
         img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
 
     # 2. Remove noise and improve contrast
@@ -624,116 +1410,187 @@ def preprocess_image(pil_image):
     # Back to PIL
     return Image.fromarray(img)
 
+# ── Money ────────────────────────────────────────────────────────────────────
+# All balance math runs on integer cents. Prices are NUMERIC in Postgres and
+# read as whole cents (ROUND(price * 100)::bigint), so sums are exact and the
+# balances of a household always add up to zero - no float epsilon needed.
+
+def to_cents(amount):
+    """Convert a euro amount (float, Decimal, str or int) to integer cents,
+    rounding half away from zero like Postgres ROUND()."""
+    return int((Decimal(str(amount)) * 100).to_integral_value(ROUND_HALF_UP))
+
+
+def cents_to_euros(cents):
+    """Integer cents -> euro float for templates/JSON (exact to 2 decimals)."""
+    return cents / 100
+
+
+def split_cents(total, n, offset=0):
+    """Split `total` cents into n shares that sum exactly to `total`
+    (largest-remainder method). With equal weights every share has the same
+    remainder, so the leftover cents go to consecutive shares starting at
+    `offset` (mod n) - callers pass the receipt id so no member systematically
+    absorbs the odd cent."""
+    base, extra = divmod(total, n)
+    shares = [base] * n
+    for k in range(extra):
+        shares[(offset + k) % n] += 1
+    return shares
+
+
+def _item_cents(item):
+    """Price of an item in cents. DB reads provide 'price_cents' directly;
+    hand-built items (tests, parsers) may carry a euro 'price' instead."""
+    cents = item.get('price_cents')
+    return cents if cents is not None else to_cents(item['price'])
+
+
 def compute_settlements(balances):
     """Greedy debt simplification: repeatedly match the largest debtor with
-    the largest creditor until all balances are settled."""
-    creditors = sorted((b.copy() for b in balances if b['net'] > 0.005), key=lambda x: -x['net'])
-    debtors = sorted((b.copy() for b in balances if b['net'] < -0.005), key=lambda x: x['net'])
+    the largest creditor until all balances are settled. Works on integer
+    cents ('net_cents' when present, else the euro 'net')."""
+    nets = [(b.get('net_cents') if b.get('net_cents') is not None else to_cents(b['net']), b)
+            for b in balances]
+    creditors = sorted(([c, b] for c, b in nets if c > 0), key=lambda x: -x[0])
+    debtors = sorted(([c, b] for c, b in nets if c < 0), key=lambda x: x[0])
 
     settlements = []
     i, j = 0, 0
     while i < len(debtors) and j < len(creditors):
         debtor = debtors[i]
         creditor = creditors[j]
-        amount = min(-debtor['net'], creditor['net'])
-        if amount > 0.005:
-            settlements.append({
-                'from': debtor['id'],
-                'from_name': debtor['name'],
-                'to': creditor['id'],
-                'to_name': creditor['name'],
-                'amount': round(amount, 2),
-            })
-        debtor['net'] += amount
-        creditor['net'] -= amount
-        if abs(debtor['net']) < 0.005:
+        amount = min(-debtor[0], creditor[0])
+        settlements.append({
+            'from': debtor[1]['id'],
+            'from_name': debtor[1]['name'],
+            'to': creditor[1]['id'],
+            'to_name': creditor[1]['name'],
+            'amount': cents_to_euros(amount),
+        })
+        debtor[0] += amount
+        creditor[0] -= amount
+        if debtor[0] == 0:
             i += 1
-        if abs(creditor['net']) < 0.005:
+        if creditor[0] == 0:
             j += 1
     return settlements
 
 
-def compute_balances(users, receipts, items):
-    """Pure balance math (no DB). Given users (id, name, joined_at), receipts
-    (id, payer_id, receipt_date, is_settlement) and items (price, assigned_to,
-    receipt_id), return {'users': [...], 'shared_total': x, 'settlements': [...]}.
-
-    Shared items are split only among members who had joined by each receipt's
-    date, so adding a member never retroactively changes older receipts.
-
-    Settlement receipts (paybacks) are kept out of the 'personal'/'paid'
-    buckets and tracked separately, so those categories reflect only real
-    consumption/bills. The net owed is identical either way."""
-    acc = {u['id']: {'personal': 0.0, 'shared_owed': 0.0, 'paid': 0.0,
-                     'settle_paid': 0.0, 'settle_received': 0.0} for u in users}
-    total_shared = 0.0
+def _accumulate_balances(users, receipts, items):
+    """Replay receipts into per-member cent accumulators (lists indexed by
+    position in `users`). Every bucket is a plain sum over receipts, so the
+    totals of disjoint receipt sets can simply be added together - which is
+    what lets monthly snapshots stand in for replaying old receipts."""
+    n_users = len(users)
+    index = {u['id']: k for k, u in enumerate(users)}
+    joined = [u['joined_at'] for u in users]
+    acc = {bucket: [0] * n_users for bucket in BALANCE_BUCKETS}
+    personal, shared_owed, paid = acc['personal'], acc['shared'], acc['paid']
+    settle_paid, settle_received = acc['settle_paid'], acc['settle_received']
+    total_shared = 0
+
+    # Bucket items by receipt once instead of rescanning them per receipt.
+    items_by_receipt = {}
+    for item in items:
+        items_by_receipt.setdefault(item['receipt_id'], []).append(
+            (item['assigned_to'], _item_cents(item)))
 
     for receipt in receipts:
         rid = receipt['id']
         rdate = receipt['receipt_date']
-        payer_id = receipt['payer_id']
-        receipt_items = [i for i in items if i['receipt_id'] == rid]
-        receipt_total = sum(i['price'] for i in receipt_items if i['assigned_to'] != 'excluded')
+        payer = index.get(receipt['payer_id'])
+        receipt_items = items_by_receipt.get(rid, ())
+        receipt_total = 0
+        shared_in_receipt = 0
+        for assigned_to, cents in receipt_items:
+            if assigned_to == 'shared':
+                shared_in_receipt += cents
+            if assigned_to != 'excluded':
+                receipt_total += cents
 
         # Settlements are paybacks, not shared spending: the payer paid the
         # amount, the payee received it. Keep them out of personal/paid.
         if receipt.get('is_settlement'):
-            for item in receipt_items:
-                if item['assigned_to'] in acc:
-                    acc[item['assigned_to']]['settle_received'] += item['price']
-            if payer_id in acc:
-                acc[payer_id]['settle_paid'] += receipt_total
+            for assigned_to, cents in receipt_items:
+                k = index.get(assigned_to)
+                if k is not None:
+                    settle_received[k] += cents
+            if payer is not None:
+                settle_paid[payer] += receipt_total
             continue
 
         # Members who had joined by this receipt's date
-        active_ids = [
-            u['id'] for u in users
-            if u['joined_at'] is None or u['joined_at'] <= rdate
-        ]
-        n = len(active_ids) or 1
+        active = [k for k in range(n_users) if joined[k] is None or joined[k] <= rdate]
+        n = len(active) or 1
 
-        shared_in_receipt = sum(i['price'] for i in receipt_items if i['assigned_to'] == 'shared')
         total_shared += shared_in_receipt
-        per_person_shared = shared_in_receipt / n
+        if active:
+            for k, share in zip(active, split_cents(shared_in_receipt, n, rid)):
+                shared_owed[k] += share
+
+        for assigned_to, cents in receipt_items:
+            k = index.get(assigned_to)
+            if k is not None:
+                personal[k] += cents
 
-        for uid in active_ids:
-            acc[uid]['shared_owed'] += per_person_shared
+        if payer is not None:
+            paid[payer] += receipt_total
+        elif receipt['payer_id'] == 'both' and n == 2:
+            for k, share in zip(active, split_cents(receipt_total, 2, rid)):
+                paid[k] += share
 
-        for item in receipt_items:
-            if item['assigned_to'] in acc:
-                acc[item['assigned_to']]['personal'] += item['price']
+    acc['total_shared'] = total_shared
+    return acc
 
-        if payer_id in acc:
-            acc[payer_id]['paid'] += receipt_total
-        elif payer_id == 'both' and n == 2:
-            for uid in active_ids:
-                acc[uid]['paid'] += receipt_total / 2
 
+# Per-member accumulator buckets, in cents (also the balance_snapshots columns).
+BALANCE_BUCKETS = ('personal', 'shared', 'paid', 'settle_paid', 'settle_received')
+
+
+def _balances_from_totals(users, acc):
+    """Shape accumulated cents (see _accumulate_balances) into the result
+    returned by compute_balances."""
     balances = []
-    for u in users:
-        uid = u['id']
-        d = acc[uid]
-        settlement = d['settle_paid'] - d['settle_received']
-        responsibility = d['personal'] + d['shared_owed']
-        net = d['paid'] + settlement - responsibility
+    for k, u in enumerate(users):
+        settlement = acc['settle_paid'][k] - acc['settle_received'][k]
+        responsibility = acc['personal'][k] + acc['shared'][k]
+        net = acc['paid'][k] + settlement - responsibility
         balances.append({
-            'id': uid,
+            'id': u['id'],
             'name': u['name'],
-            'personal_total': round(d['personal'], 2),
-            'shared_share': round(d['shared_owed'], 2),
-            'paid_total': round(d['paid'], 2),
-            'settlement': round(settlement, 2),
-            'responsibility': round(responsibility, 2),
-            'net': round(net, 2),
+            'personal_total': cents_to_euros(acc['personal'][k]),
+            'shared_share': cents_to_euros(acc['shared'][k]),
+            'paid_total': cents_to_euros(acc['paid'][k]),
+            'settlement': cents_to_euros(settlement),
+            'responsibility': cents_to_euros(responsibility),
+            'net': cents_to_euros(net),
+            'net_cents': net,
         })
 
     return {
         'users': balances,
-        'shared_total': round(total_shared, 2),
+        'shared_total': cents_to_euros(acc['total_shared']),
         'settlements': compute_settlements(balances),
     }
 
 
+def compute_balances(users, receipts, items):
+    """Pure balance math (no DB). Given users (id, name, joined_at), receipts
+    (id, payer_id, receipt_date, is_settlement) and items (price or
+    price_cents, assigned_to, receipt_id), return
+    {'users': [...], 'shared_total': x, 'settlements': [...]}.
+
+    Shared items are split only among members who had joined by each receipt's
+    date, so adding a member never retroactively changes older receipts. The
+    split is exact to the cent (see split_cents).
+
+    Settlement receipts (paybacks) are kept out of the 'personal'/'paid'
+    buckets and tracked separately, so those categories reflect only real
+    consumption/bills. The net owed is identical either way."""
+    return _balances_from_totals(users, _accumulate_balances(users, receipts, items))
+
+
 def is_settlement_filename(filename):
     """A receipt is a settlement (payback) if it was created by the Settle-up
     button ('Settlement') or the Manual Payment screen ('Manual_...')."""
@@ -742,39 +1599,461 @@ def is_settlement_filename(filename):
 
 
 def calculate_balances_detailed(group_id):
-    """Fetch a group's users/receipts/items from the DB and compute balances."""
-    cursor = get_cursor()
+    """Compute a group's balances by replaying all of its receipts (from the
+    group snapshot: the roster with join dates, and each receipt's
+    per-assignee sums from the receipt summaries)."""
+    receipts = load_group_snapshot(group_id).receipt_rows()
+    return compute_balances(get_roster(group_id), receipts, _summary_items(get_cursor(), receipts))
+
+
+
+# ── Monthly balance snapshots ────────────────────────────────────────────────
+# Replaying every receipt is the only way to get a balance, which limits
+# /balances to the all-time view. Closed months are compacted into per-member
+# rows (cents per BALANCE_BUCKETS bucket). Because the buckets are plain sums,
+# "balance as of X" is the sum of the snapshot rows before X's month plus a
+# replay of the small tail of receipts not covered by a snapshot. Any write to
+# a receipt drops the snapshot of that receipt's month (_invalidate_snapshots);
+# the compactor rebuilds it later. Both take a per-group advisory lock so
+# they can't interleave.
+
+SNAPSHOT_COMPACT_INTERVAL = int(os.environ.get('SNAPSHOT_COMPACT_INTERVAL', 6 * 3600))  # seconds, 0 = off
+
+SNAPSHOT_LOCK_CLASS = 7301  # first key of the per-group pg_advisory_xact_lock (see _lock_group_snapshots)
+
+RECEIPT_DATE_SQL = 'COALESCE(bill_date, upload_date)'
+RECEIPT_MONTH_SQL = f"date_trunc('month', {RECEIPT_DATE_SQL})::date"
+
+
+def _month_start(d):
+    """First day of the month containing date/datetime d, as a date."""
+    return date(d.year, d.month, 1)
+
+
+def _empty_totals(n_users):
+    acc = {bucket: [0] * n_users for bucket in BALANCE_BUCKETS}
+    acc['total_shared'] = 0
+    return acc
+
+
+def _add_totals(into, acc):
+    """Add one set of accumulated cents into another (same user order)."""
+    for bucket in BALANCE_BUCKETS:
+        col = into[bucket]
+        for k, v in enumerate(acc[bucket]):
+            col[k] += v
+    into['total_shared'] += acc['total_shared']
+    return into
 
-    # Users with their join dates (founding members default to '2000-01-01')
+
+def accumulate_by_month(users, receipts, items):
+    """Pure helper: {month_start: accumulated cents} for each month that has
+    receipts. Summing the months gives the same totals as one full replay."""
+    by_month = {}
+    month_of = {}
+    for r in receipts:
+        month = _month_start(r['receipt_date'])
+        month_of[r['id']] = month
+        by_month.setdefault(month, ([], []))[0].append(r)
+    for item in items:
+        month = month_of.get(item['receipt_id'])
+        if month is not None:
+            by_month[month][1].append(item)
+    return {month: _accumulate_balances(users, rs, its) for month, (rs, its) in by_month.items()}
+
+
+def _load_receipts_and_items(cursor, where, params):
+    """Receipts matching `where` (a SQL condition on receipts) with their
+    per-assignee sums as pseudo-items in integer cents (see _summary_items),
+    shaped for _accumulate_balances."""
     cursor.execute(
-        'SELECT id, name, joined_at FROM users WHERE group_id = %s ORDER BY name',
-        (group_id,)
+        f'SELECT id, payer_id, filename, {RECEIPT_DATE_SQL} AS receipt_date, assignee_cents '
+        f'FROM receipts WHERE {where}',
+        params
+    )
+    receipts = [ReceiptRecord(r['id'], r['payer_id'], r['filename'], r['receipt_date'], r['assignee_cents'])
+                for r in cursor.fetchall()]
+    return receipts, _summary_items(cursor, receipts)
+
+
+def _lock_group_snapshots(cursor, group_id):
+    """Serialize snapshot writes and invalidations of a group until the end
+    of the transaction. Without it the compactor could read a month, a
+    writer commit a change there (its DELETE finding no snapshot yet), and
+    the compactor then insert a snapshot of the old data."""
+    cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', (SNAPSHOT_LOCK_CLASS, group_id))
+
+
+def compact_balance_snapshots(cursor, group_id):
+    """Snapshot every closed month (before the current one) of this group that
+    has receipts but no snapshot yet. Returns the number of months written.
+    Runs incrementally: untouched months are never recomputed. Call in a
+    transaction: it holds the group's snapshot lock until the commit."""
+    _lock_group_snapshots(cursor, group_id)
+    cursor.execute(
+        f'SELECT DISTINCT {RECEIPT_MONTH_SQL} AS month FROM receipts '
+        f"WHERE group_id = %s AND {RECEIPT_DATE_SQL} < date_trunc('month', CURRENT_DATE) "
+        'EXCEPT SELECT month FROM balance_snapshot_months WHERE group_id = %s',
+        (group_id, group_id)
     )
+    months = [r['month'] for r in cursor.fetchall()]
+    if not months:
+        return 0
+
+    cursor.execute('SELECT id, name, joined_at FROM users WHERE group_id = %s ORDER BY name', (group_id,))
     users = cursor.fetchall()
+    receipts, items = _load_receipts_and_items(
+        cursor, f'group_id = %s AND {RECEIPT_MONTH_SQL} = ANY(%s)', (group_id, months))
+
+    for month, acc in accumulate_by_month(users, receipts, items).items():
+        cursor.execute(
+            'INSERT INTO balance_snapshot_months (group_id, month, shared_total_cents) VALUES (%s, %s, %s)',
+            (group_id, month, acc['total_shared'])
+        )
+        psycopg2.extras.execute_values(
+            cursor,
+            'INSERT INTO balance_snapshots (group_id, month, user_id, '
+            + ', '.join(f'{b}_cents' for b in BALANCE_BUCKETS) + ') VALUES %s',
+            [(group_id, month, u['id'], *(acc[b][k] for b in BALANCE_BUCKETS))
+             for k, u in enumerate(users)]
+        )
+    return len(months)
+
+
+def _invalidate_snapshots(cursor, group_id, receipt_id=None):
+    """Drop the snapshot month a receipt falls in (or all of a group's
+    snapshots when receipt_id is None). Call in the same transaction as any
+    write that changes a receipt, its date, or its items; it takes the
+    group's snapshot lock, so a running compaction of the group finishes
+    (and is then deleted here) or waits for this commit."""
+    _lock_group_snapshots(cursor, group_id)
+    if receipt_id is None:
+        cursor.execute('DELETE FROM balance_snapshot_months WHERE group_id = %s', (group_id,))
+    else:
+        cursor.execute(
+            'DELETE FROM balance_snapshot_months WHERE group_id = %s AND month = '
+            f'(SELECT {RECEIPT_MONTH_SQL} FROM receipts WHERE id = %s)',
+            (group_id, receipt_id)
+        )
+
 
-    # All receipts with their effective date for membership cutoff
+def _snapshot_totals(cursor, group_id, users, before_month):
+    """Sum of all snapshot rows strictly before `before_month` (None = all)."""
+    acc = _empty_totals(len(users))
+    before_month = before_month or date.max
+    index = {u['id']: k for k, u in enumerate(users)}
     cursor.execute(
-        'SELECT id, payer_id, filename, COALESCE(bill_date, upload_date) AS receipt_date '
-        'FROM receipts WHERE group_id = %s',
-        (group_id,)
+        'SELECT user_id, ' + ', '.join(f'SUM({b}_cents) AS {b}' for b in BALANCE_BUCKETS)
+        + ' FROM balance_snapshots WHERE group_id = %s AND month < %s GROUP BY user_id',
+        (group_id, before_month)
     )
-    receipts = cursor.fetchall()
-    for r in receipts:
-        r['is_settlement'] = is_settlement_filename(r['filename'])
+    for row in cursor.fetchall():
+        k = index.get(row['user_id'])
+        if k is not None:
+            for b in BALANCE_BUCKETS:
+                acc[b][k] += int(row[b])
+    cursor.execute(
+        'SELECT COALESCE(SUM(shared_total_cents), 0) AS s FROM balance_snapshot_months '
+        'WHERE group_id = %s AND month < %s',
+        (group_id, before_month)
+    )
+    acc['total_shared'] = int(cursor.fetchone()['s'])
+    return acc
+
+
+def _tail_receipts(cursor, group_id, as_of=None):
+    """Receipts up to as_of (inclusive) that no usable snapshot covers."""
+    end = as_of + timedelta(days=1) if as_of else date.max
+    snap_end = _month_start(as_of) if as_of else date.max
+    return _load_receipts_and_items(
+        cursor,
+        f'group_id = %s AND {RECEIPT_DATE_SQL} < %s AND NOT EXISTS ('
+        'SELECT 1 FROM balance_snapshot_months m WHERE m.group_id = receipts.group_id '
+        f'AND m.month = {RECEIPT_MONTH_SQL} AND m.month < %s)',
+        (group_id, end, snap_end)
+    )
+
 
-    # All items for this group
+def get_balances_as_of(group_id, as_of=None):
+    """Balances as of a date (inclusive), or all-time when as_of is None.
+    Same result as calculate_balances_detailed, but reads snapshot sums plus
+    only the receipts no snapshot covers (all-time: the group snapshot of
+    unsnapshotted months, shared with get_monthly_spending)."""
+    cursor = get_cursor()
+    if as_of:
+        users = [u for u in get_roster(group_id) if u['joined_at'] is None or u['joined_at'].date() <= as_of]
+        acc = _snapshot_totals(cursor, group_id, users, _month_start(as_of))
+        receipts, items = _tail_receipts(cursor, group_id, as_of)
+    else:
+        receipts = load_group_snapshot(group_id, scope='unsnapshotted').receipt_rows()
+        users = get_roster(group_id)
+        acc = _snapshot_totals(cursor, group_id, users, None)
+        items = _summary_items(cursor, receipts)
+    _add_totals(acc, _accumulate_balances(users, receipts, items))
+    return _balances_from_totals(users, acc)
+
+
+def get_monthly_spending(group_id, months=12):
+    """Spending per month for the last `months` months (oldest first):
+    [{'month', 'paid_total', 'shared_total', 'by_user': {uid: responsibility}}].
+    Settlements are not spending and are left out."""
+    cursor = get_cursor()
+    tail = load_group_snapshot(group_id, scope='unsnapshotted').receipt_rows()
+    users = get_roster(group_id)
+    since = _month_start(date.today())
+    for _ in range(months - 1):
+        since = _month_start(since - timedelta(days=1))
+
+    per_month = {}
     cursor.execute(
-        'SELECT i.price, i.assigned_to, i.receipt_id FROM items i '
-        'JOIN receipts r ON r.id = i.receipt_id WHERE r.group_id = %s',
-        (group_id,)
+        'SELECT m.month, m.shared_total_cents, s.user_id, '
+        + ', '.join(f's.{b}_cents' for b in BALANCE_BUCKETS)
+        + ' FROM balance_snapshot_months m JOIN balance_snapshots s '
+        'ON s.group_id = m.group_id AND s.month = m.month '
+        'WHERE m.group_id = %s AND m.month >= %s',
+        (group_id, since)
     )
-    items = cursor.fetchall()
-    for item in items:
-        item['price'] = float(item['price'])
+    index = {u['id']: k for k, u in enumerate(users)}
+    for row in cursor.fetchall():
+        acc = per_month.setdefault(row['month'], _empty_totals(len(users)))
+        acc['total_shared'] = row['shared_total_cents']
+        k = index.get(row['user_id'])
+        if k is not None:
+            for b in BALANCE_BUCKETS:
+                acc[b][k] += row[f'{b}_cents']
+
+    receipts = [r for r in tail if _month_start(r['receipt_date']) >= since]
+    items = _summary_items(cursor, receipts)
+    for month, acc in accumulate_by_month(users, receipts, items).items():
+        _add_totals(per_month.setdefault(month, _empty_totals(len(users))), acc)
+
+    return [{
+        'month': month,
+        'month_end': _month_start(month + timedelta(days=31)) - timedelta(days=1),
+        'paid_total': cents_to_euros(sum(acc['paid'])),
+        'shared_total': cents_to_euros(acc['total_shared']),
+        'by_user': {u['id']: cents_to_euros(acc['personal'][k] + acc['shared'][k])
+                    for k, u in enumerate(users)},
+    } for month, acc in sorted(per_month.items())]
+
+
+def compact_all_snapshots():
+    """Compact snapshots for every group on a dedicated connection. Used by
+    the background compactor and the `flask compact-snapshots` command."""
+    conn = connect_db()
+    try:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute('SELECT id FROM groups')
+        written = 0
+        for row in cur.fetchall():
+            written += compact_balance_snapshots(cur, row['id'])
+            conn.commit()
+        return written
+    finally:
+        conn.close()
+
+
+@app.cli.command('compact-snapshots')
+def compact_snapshots_command():
+    """Write monthly balance snapshots for all closed months."""
+    print(f"Wrote {compact_all_snapshots()} month snapshot(s).")
+
+
+def _snapshot_compactor_loop():
+    while True:
+        try:
+            written = compact_all_snapshots()
+            if written:
+                logging.info(f"Snapshot compactor wrote {written} month(s).")
+        except Exception:
+            logging.exception("Snapshot compaction failed")
+        time.sleep(SNAPSHOT_COMPACT_INTERVAL)
+
+
+def start_snapshot_compactor():
+    """Run the compactor in a daemon thread (one per worker process). Safe to
+    run concurrently: compactions and invalidations of a group take its
+    snapshot lock (_lock_group_snapshots), so a snapshot is never built from
+    data an edit has since changed, and the month primary key makes a
+    duplicate write fail and roll back rather than double count."""
+    if DATABASE_URL and SNAPSHOT_COMPACT_INTERVAL > 0:
+        threading.Thread(target=_snapshot_compactor_loop, name='snapshot-compactor', daemon=True).start()
+
+
+# ── Group snapshots ──────────────────────────────────────────────────────────
+# History, balances and the assignment memory read the same household data:
+# the roster, the receipts and (history, memory) their items. A GroupSnapshot
+# fetches all of it in one statement - a single row of array_agg columns -
+# and is kept on g, so a request reads those rows once whichever of them it
+# renders; the roster it brings along seeds get_roster. A snapshot is the
+# state as of its first use in the request (write routes redirect, so
+# nothing reads one after a change in the same request).
+
+RECEIPT_COLUMNS = ('id', 'upload_date', 'payer_id', 'filename', 'bill_date', 'total', 'assignee_cents',
+                   'receipt_date')
+ITEM_COLUMNS = ('id', 'receipt_id', 'description', 'price_cents', 'assigned_to')
+MEMBER_COLUMNS = ('id', 'name', 'joined_at', 'email', 'auth_uid')
+
+# Which receipts a snapshot holds: all of them, or only those in months
+# without a balance snapshot (what /balances replays).
+SNAPSHOT_SCOPES = {
+    'all': '',
+    'unsnapshotted': ('AND NOT EXISTS (SELECT 1 FROM balance_snapshot_months m '
+                      f'WHERE m.group_id = receipts.group_id AND m.month = {RECEIPT_MONTH_SQL})'),
+}
+
+
+# Integer columns are held as array('q'): 8 bytes a value instead of a
+# pointer to an int object.
+INT_COLUMNS = frozenset({'id', 'receipt_id', 'price_cents'})
+
+
+class Record:
+    """Base of the compact row records: __slots__ instead of a dict per row.
+    Fields read as record.field, or as record['field'] / record.get('field')
+    like the dict rows the pure helpers (compute_balances, ...) also take."""
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{f}={getattr(self, f)!r}' for f in self.__slots__)})"
+
+
+class ReceiptRecord(Record):
+    """A receipt as the balance math reads it (see _accumulate_balances)."""
+    __slots__ = ('id', 'payer_id', 'filename', 'receipt_date', 'assignee_cents', 'is_settlement')
+
+    def __init__(self, id, payer_id, filename, receipt_date, assignee_cents):
+        self.id = id
+        self.payer_id = payer_id
+        self.filename = filename
+        self.receipt_date = receipt_date
+        self.assignee_cents = assignee_cents
+        self.is_settlement = is_settlement_filename(filename)
+
+
+class ItemRecord(Record):
+    """An item in cents; also the per-assignee receipt sums of
+    _summary_items (no id or description)."""
+    __slots__ = ITEM_COLUMNS
+
+    def __init__(self, id, receipt_id, description, price_cents, assigned_to):
+        self.id = id
+        self.receipt_id = receipt_id
+        self.description = description
+        self.price_cents = price_cents
+        self.assigned_to = assigned_to
 
-    return compute_balances(users, receipts, items)
+    @property
+    def price(self):
+        return cents_to_euros(self.price_cents)
 
 
+class ReceiptItems:
+    """One receipt's items in a GroupSnapshot: positions into the item
+    columns, read as ItemRecords while iterating - nothing per item is kept
+    in between."""
+    __slots__ = ('columns', 'positions')
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.positions = array('q')
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        cols = [self.columns[c] for c in ITEM_COLUMNS]
+        for k in self.positions:
+            yield ItemRecord(*(col[k] for col in cols))
+
+    def __getitem__(self, index):
+        k = self.positions[index]
+        return ItemRecord(*(self.columns[c][k] for c in ITEM_COLUMNS))
+
+
+class GroupSnapshot:
+    """A household's receipts and items as parallel columns in id order
+    (snapshot.receipts['payer_id'][k] is the payer of the k-th receipt);
+    INT_COLUMNS are arrays, the rest lists. items is None unless loaded with
+    items=True."""
+
+    def __init__(self, group_id, scope, receipts, items):
+        self.group_id = group_id
+        self.scope = scope
+        self.receipts = self._compact(receipts)
+        self.items = self._compact(items) if items is not None else None
+
+    @staticmethod
+    def _compact(columns):
+        return {name: array('q', values) if name in INT_COLUMNS else values for name, values in columns.items()}
+
+    def __len__(self):
+        return len(self.receipts['id'])
+
+    def receipt_rows(self):
+        """Receipts as ReceiptRecords (as _load_receipts_and_items returns them)."""
+        cols = self.receipts
+        return [ReceiptRecord(*fields) for fields in zip(
+            cols['id'], cols['payer_id'], cols['filename'], cols['receipt_date'], cols['assignee_cents'])]
+
+
+def _group_snapshot_sql(items, scope):
+    receipts = (f'SELECT {", ".join(RECEIPT_COLUMNS[:-1])}, {RECEIPT_DATE_SQL} AS receipt_date '
+                f'FROM receipts WHERE group_id = %(group_id)s {SNAPSHOT_SCOPES[scope]}')
+    members = ', '.join(f'array_agg({c} ORDER BY name) AS m_{c}' for c in MEMBER_COLUMNS)
+    receipt_cols = ', '.join(f'array_agg({c} ORDER BY id) AS r_{c}' for c in RECEIPT_COLUMNS)
+    sql = (f'WITH rs AS ({receipts}) '
+           'SELECT gr.roster_version, m.*, r.*' + (', i.*' if items else '') + ' FROM groups gr '
+           f'CROSS JOIN (SELECT {members} FROM users WHERE group_id = %(group_id)s) m '
+           f'CROSS JOIN (SELECT {receipt_cols} FROM rs) r ')
+    if items:
+        item_exprs = {'id': 'i.id', 'receipt_id': 'i.receipt_id', 'description': 'i.description',
+                      'price_cents': 'ROUND(i.price * 100)::bigint', 'assigned_to': 'i.assigned_to'}
+        item_cols = ', '.join(f'array_agg({item_exprs[c]} ORDER BY i.id) AS i_{c}' for c in ITEM_COLUMNS)
+        sql += f'CROSS JOIN (SELECT {item_cols} FROM items i JOIN rs ON rs.id = i.receipt_id) i '
+    return sql + 'WHERE gr.id = %(group_id)s'
+
+
+def load_group_snapshot(group_id, items=False, scope='all'):
+    """The request's GroupSnapshot of a household (see SNAPSHOT_SCOPES),
+    loaded on first use. Asking for items after a snapshot without them was
+    loaded reloads it with items."""
+    snapshots = g.setdefault('group_snapshots', {})
+    snapshot = snapshots.get((group_id, scope))
+    if snapshot is not None and (snapshot.items is not None or not items):
+        return snapshot
+
+    with span('group_snapshot'):
+        cursor = get_cursor()
+        cursor.execute(_group_snapshot_sql(items, scope), {'group_id': group_id})
+        row = cursor.fetchone() or {}
+
+    def column(prefix, name):
+        return row.get(f'{prefix}_{name}') or []
+
+    snapshot = GroupSnapshot(
+        group_id, scope,
+        {c: column('r', c) for c in RECEIPT_COLUMNS},
+        {c: column('i', c) for c in ITEM_COLUMNS} if items else None)
+    snapshots[(group_id, scope)] = snapshot
+    if row and group_id not in g.setdefault('rosters', {}):
+        members = [dict(zip(MEMBER_COLUMNS, values))
+                   for values in zip(*(column('m', c) for c in MEMBER_COLUMNS))]
+        _cache_roster(group_id, row['roster_version'], members)
+    return snapshot
+
 
 @app.route('/')
 @login_required
@@ -782,72 +2061,345 @@ def index():
     """Main route to upload a bill."""
     return render_template('index.html')
 
+# A receipt is a page or two; a long PDF is most likely the wrong file (a
+# bank statement) and would cost minutes of CPU.
+MAX_PDF_PAGES = int(os.getenv('MAX_PDF_PAGES', '10'))
+# Scanned pages are rendered for OCR at up to SCANNED_PDF_DPI, but no larger
+# than OCR_MAX_DIM on the long side: preprocess_image would throw the extra
+# pixels away (an A4 page renders at ~154 DPI).
+SCANNED_PDF_DPI = int(os.getenv('SCANNED_PDF_DPI', '200'))
 OCR_CONFIG = r'--oem 3 --psm 4 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyzÄÖÜäöüß€%.,:-/ '
 
 
-def _process_one_file(file):
-    """Extract items from a single uploaded receipt. Returns a result dict or
-    None on error. Images go through OCR; PDFs use their text layer, routed to a
-    vendor-specific digital parser when one matches, else OCR-style parsing."""
-    file_bytes = file.read()
-    ext = file.filename.rsplit('.', 1)[-1].lower()
-    unique_filename = str(uuid.uuid4())
+def scan_resolution(page):
+    """DPI to render a scanned PDF page at for OCR (see SCANNED_PDF_DPI)."""
+    return min(SCANNED_PDF_DPI, OCR_MAX_DIM * 72 / max(page.width, page.height))
+
+
+# ── Upload storage ───────────────────────────────────────────────────────────
+# Previews are stored once per content: downscaled to display width, encoded
+# as WebP (JPEG if this Pillow lacks WebP) and named by the SHA-256 of the
+# encoded bytes, so re-uploading a receipt reuses the same file. Saved
+# receipts reference their previews in receipts.image_path (comma-separated
+# names); `flask gc-uploads` deletes files nothing references once they are
+# older than UPLOAD_RETENTION_HOURS (abandoned uploads, deleted receipts).
+
+PREVIEW_MAX_WIDTH = int(os.getenv('PREVIEW_MAX_WIDTH', '1200'))
+PREVIEW_QUALITY = int(os.getenv('PREVIEW_QUALITY', '80'))
+PREVIEW_FORMAT = 'webp' if features.check('webp') else 'jpeg'
+PREVIEW_EXT = {'webp': 'webp', 'jpeg': 'jpg'}[PREVIEW_FORMAT]
+PREVIEW_NAME_RE = re.compile(r'^[0-9a-f]{40}\.(webp|jpg)$')
+UPLOAD_RETENTION_HOURS = float(os.getenv('UPLOAD_RETENTION_HOURS', '24'))
+
+
+def encode_preview(img):
+    """Downscale a PIL image to preview width and encode it. Returns bytes."""
+    img = img.convert('L' if img.mode in ('1', 'L', 'LA', 'I', 'I;16') else 'RGB')
+    if img.width > PREVIEW_MAX_WIDTH:
+        img = img.resize((PREVIEW_MAX_WIDTH, round(img.height * PREVIEW_MAX_WIDTH / img.width)),
+                         Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, PREVIEW_FORMAT.upper(), quality=PREVIEW_QUALITY)
+    return buf.getvalue()
+
+
+def store_preview(img):
+    """Store a preview by content hash and return its file name. An existing
+    copy is kept (and its mtime refreshed, so GC treats it as recent)."""
+    data = encode_preview(img)
+    name = f'{hashlib.sha256(data).hexdigest()[:40]}.{PREVIEW_EXT}'
+    path = os.path.join(app.config['UPLOAD_FOLDER'], name)
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return name
+
+
+def preview_names(image_path):
+    """The preview file names referenced by a receipts.image_path value."""
+    return [n for n in (image_path or '').split(',') if PREVIEW_NAME_RE.match(n)]
+
+
+def orphaned_uploads(folder, referenced, cutoff):
+    """Files in `folder` not in `referenced` and last modified before the
+    `cutoff` timestamp (dotfiles are left alone)."""
+    orphans = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if (entry.is_file() and not entry.name.startswith('.') and entry.name not in referenced
+                    and entry.stat().st_mtime < cutoff):
+                orphans.append(entry.name)
+    return orphans
+
+
+def gc_uploads(cursor, retention_hours=UPLOAD_RETENTION_HOURS, dry_run=False):
+    """Delete unreferenced upload files older than the retention window.
+    Returns (count, bytes) removed (or that would be, for a dry run)."""
+    cursor.execute('SELECT image_path FROM receipts WHERE image_path IS NOT NULL')
+    referenced = {n for row in cursor.fetchall() for n in preview_names(row['image_path'])}
+    folder = app.config['UPLOAD_FOLDER']
+    count = freed = 0
+    for name in orphaned_uploads(folder, referenced, time.time() - retention_hours * 3600):
+        path = os.path.join(folder, name)
+        try:
+            size = os.path.getsize(path)
+            if not dry_run:
+                os.remove(path)
+        except FileNotFoundError:
+            continue
+        count += 1
+        freed += size
+    return count, freed
+
+
+@app.cli.command('gc-uploads')
+@click.option('--hours', type=float, default=UPLOAD_RETENTION_HOURS, show_default=True,
+              help='Keep unreferenced files younger than this.')
+@click.option('--dry-run', is_flag=True, help='Only report what would be deleted.')
+def gc_uploads_command(hours, dry_run):
+    """Delete upload previews no receipt references."""
+    conn = connect_db()
+    try:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        count, freed = gc_uploads(cur, hours, dry_run)
+    finally:
+        conn.close()
+    print(f"{'Would delete' if dry_run else 'Deleted'} {count} file(s), {freed / 1024 / 1024:.1f} MB.")
+
+
+class ReceiptExtractionError(Exception):
+    """A file that couldn't be turned into a receipt; the message is
+    user-facing."""
+
+
+def _prepare_for_ocr(img):
+    """Preprocess an image for OCR and store that as its preview.
+    Returns (processed image, preview file name)."""
+    with span('preprocess_image'):
+        processed_img = preprocess_image(img)
+    with span('store_preview'):
+        return processed_img, store_preview(processed_img)
+
+
+def _run_ocr(processed_img):
+    logging.info("Running OCR on image...")
+    with span('tesseract'):
+        text = pytesseract.image_to_string(processed_img, lang='deu+eng', config=OCR_CONFIG)
+    logging.info("OCR complete.")
+    return text
+
+
+def _extract_receipt(filename, file_bytes, on_stage=None):
+    """Extract items from one receipt file. Images go through OCR; PDFs use
+    their text layer, and OCR for pages that have none (scans). PDFs over
+    MAX_PDF_PAGES are refused before any page is read. A vendor recognized
+    on the (first page) text gets its own parser (see detect_vendor),
+    anything else OCR-style parsing. on_stage(stage) is called as the work
+    progresses ('received', 'preprocessed', 'ocr'). Touches neither the
+    request nor the session, so it can run on a worker thread. Returns a
+    result dict with the rendered preview file names in 'image_files'; raises
+    ReceiptExtractionError."""
+    stage = on_stage or (lambda name: None)
+    ext = filename.rsplit('.', 1)[-1].lower()
     extracted_text = ""
     image_files = []          # rendered preview page(s), in order
     parsed_items = None       # set directly when a digital parser handles it
+    vendor = None
 
-    date_match = re.search(r'\d{4}-\d{2}-\d{2}', file.filename)
+    date_match = re.search(r'\d{4}-\d{2}-\d{2}', filename)
     bill_date = date_match.group(0) if date_match else 'Unknown Date'
-    logging.info(f"Processing upload: {file.filename} ({len(file_bytes)/1024:.1f} KB)")
+    logging.info(f"Processing upload: {filename} ({len(file_bytes)/1024:.1f} KB)")
+    stage('received')
 
     try:
         if ext in ('png', 'jpg', 'jpeg', 'gif'):
-            img = Image.open(io.BytesIO(file_bytes))
-            processed_img = preprocess_image(img)
-            name = f"{unique_filename}.png"
-            processed_img.save(os.path.join(app.config['UPLOAD_FOLDER'], name))
-            image_files.append(name)
-            logging.info("Running OCR on image...")
-            extracted_text = pytesseract.image_to_string(processed_img, lang='deu+eng', config=OCR_CONFIG)
-            logging.info("OCR complete.")
+            processed_img, preview = _prepare_for_ocr(Image.open(io.BytesIO(file_bytes)))
+            image_files.append(preview)
+            stage('preprocessed')
+            extracted_text = _run_ocr(processed_img)
+            vendor = detect_vendor(extracted_text)
+            stage('ocr')
         elif ext == 'pdf':
             with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        extracted_text += page_text + "\n--PAGE BREAK--\n"
-                # Render every page for the preview (not just the first).
-                for i, page in enumerate(pdf.pages):
-                    name = f"{unique_filename}_p{i}.png"
-                    page.to_image(resolution=150).save(os.path.join(app.config['UPLOAD_FOLDER'], name))
-                    image_files.append(name)
-                # Route to a vendor-specific digital parser if one matches.
-                for detector, parser in DIGITAL_PDF_PARSERS:
-                    if detector(extracted_text):
-                        parsed_items = parser(pdf)
-                        logging.info(f"Digital PDF parser matched: {len(parsed_items)} items.")
-                        break
-                logging.info(f"PDF processed ({len(pdf.pages)} pages).")
+                pages = pdf.pages
+                if not pages:
+                    raise ReceiptExtractionError(f"{filename} has no pages.")
+                if len(pages) > MAX_PDF_PAGES:
+                    raise ReceiptExtractionError(
+                        f"{filename} has {len(pages)} pages, but a receipt can have at most "
+                        f"{MAX_PDF_PAGES}. Is this the right file?")
+                # The vendor is recognized from page 1 alone; a digital
+                # layout parser reads the words itself, so the other pages'
+                # text is only extracted when it is needed.
+                with span('pdf_text'):
+                    texts = [pages[0].extract_text() or '']
+                vendor = detect_vendor(texts[0])
+                if vendor is not None and vendor.parse_pdf is not None:
+                    with span('pdf_render'):
+                        for page in pages:
+                            image_files.append(store_preview(page.to_image(resolution=150).original))
+                    stage('preprocessed')
+                    with span('digital_parser'):
+                        parsed_items = vendor.parse_pdf(pdf)
+                    logging.info(f"Vendor parser {vendor.name}@{vendor.version} (pdf): {len(parsed_items)} items.")
+                    if not parsed_items:
+                        logging.warning(f"Vendor parser {vendor.name}@{vendor.version} found no items; "
+                                        "using generic parsing.")
+                        with span('pdf_text'):
+                            texts += [page.extract_text() or '' for page in pages[1:]]
+                        extracted_text = ''.join(text + "\n--PAGE BREAK--\n" for text in texts if text)
+                        parsed_items = None
+                    stage('ocr')
+                else:
+                    with span('pdf_text'):
+                        texts += [page.extract_text() or '' for page in pages[1:]]
+                    # Pages without a text layer are scans: OCR them like photos.
+                    scans = {}
+                    with span('pdf_render'):
+                        for k, page in enumerate(pages):
+                            if texts[k].strip():
+                                image_files.append(store_preview(page.to_image(resolution=150).original))
+                            else:
+                                scans[k], preview = _prepare_for_ocr(
+                                    page.to_image(resolution=scan_resolution(page)).original)
+                                image_files.append(preview)
+                    stage('preprocessed')
+                    for k, processed_img in scans.items():
+                        texts[k] = _run_ocr(processed_img)
+                    if scans:
+                        logging.info(f"OCR'd {len(scans)} scanned page(s).")
+                        if 0 in scans:
+                            vendor = detect_vendor(texts[0])
+                    extracted_text = ''.join(text + "\n--PAGE BREAK--\n" for text in texts if text)
+                    stage('ocr')
+                logging.info(f"PDF processed ({len(pages)} pages).")
         else:
-            flash(f'Unsupported file type: {ext}')
-            return None
+            raise ReceiptExtractionError(f'Unsupported file type: {ext}')
+    except ReceiptExtractionError:
+        raise
     except Exception as e:
-        logging.exception(f"Error processing {file.filename}")
-        flash(f"Couldn't process {file.filename}. Make sure it's a valid image or PDF.")
-        return None
+        logging.exception(f"Error processing {filename}")
+        raise ReceiptExtractionError(
+            f"Couldn't process {filename}. Make sure it's a valid image or PDF.") from e
 
     if parsed_items is None:
-        parsed_items = parse_bill_text(extracted_text)
+        with span('parse_text'):
+            parsed_items = parse_receipt_text(extracted_text, vendor)
 
     return {
-        'filename': file.filename,
+        'filename': filename,
         'bill_date': bill_date,
         'parsed_items': parsed_items,
         'total_sum': round(sum(i['price'] for i in parsed_items), 2),
-        'image_paths': [url_for('uploaded_file', filename=n) for n in image_files],
+        'image_files': image_files,
     }
 
 
+def _with_image_paths(receipt):
+    """Add the URLs of an extracted receipt's preview files."""
+    receipt = dict(receipt)
+    receipt['image_paths'] = [url_for('uploaded_file', filename=n) for n in receipt['image_files']]
+    receipt['thumb_paths'] = [url_for('uploaded_thumbnail', filename=n, w=THUMB_PREVIEW_WIDTH)
+                              for n in receipt['image_files']]
+    return receipt
+
+
+# ── OCR processes ────────────────────────────────────────────────────────────
+# Extraction is CPU-bound: image preprocessing, pdfminer's pure-Python layout
+# analysis, preview encoding. Inside the threaded web worker it holds the GIL,
+# so light pages (history, balances) queue behind every upload. With
+# OCR_PROCESSES > 0 it runs in a pool of that many separate processes and the
+# web thread only waits for the result; stages are then reported when the
+# file is done, and the spans measured in the OCR process are recorded here.
+# The processes are spawned rather than forked from the threaded server, and
+# skip the app's startup work (see the bottom of this file).
+
+OCR_PROCESSES = int(os.getenv('OCR_PROCESSES', '0'))
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+
+def _get_ocr_pool():
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ProcessPoolExecutor(max_workers=OCR_PROCESSES,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _ocr_pool
+
+
+def _reset_ocr_pool(pool):
+    """Drop a pool whose process died, so the next upload starts a new one."""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is pool:
+            _ocr_pool = None
+    pool.shutdown(wait=False)
+
+
+def _extract_in_ocr_process(filename, file_bytes):
+    """Runs in an OCR process. Returns (started_at, result, stages, spans)."""
+    started_at = time.time()
+    stages = []
+    _span_capture.spans = []
+    try:
+        receipt = _extract_receipt(filename, file_bytes, on_stage=stages.append)
+        return started_at, receipt, stages, _span_capture.spans
+    finally:
+        _span_capture.spans = None
+
+
+def run_extraction(filename, file_bytes, on_stage=None):
+    """_extract_receipt, in the OCR process pool when OCR_PROCESSES is set.
+    The time a file waited for a free OCR process is recorded as the
+    'ocr_queue' span."""
+    if OCR_PROCESSES <= 0:
+        return _extract_receipt(filename, file_bytes, on_stage)
+    pool = _get_ocr_pool()
+    submitted_at = time.time()
+    try:
+        started_at, receipt, stages, spans = pool.submit(_extract_in_ocr_process, filename, file_bytes).result()
+    except BrokenProcessPool as e:
+        logging.exception(f"OCR process died while processing {filename}")
+        _reset_ocr_pool(pool)
+        raise ReceiptExtractionError(f"Couldn't process {filename}. Please try again.") from e
+    record_span('ocr_queue', max(0.0, started_at - submitted_at))
+    for name, elapsed in spans:
+        record_span(name, elapsed)
+    for stage in stages:
+        (on_stage or (lambda name: None))(stage)
+    return receipt
+
+
+def _extract_for_request(filename, file_bytes):
+    """run_extraction on an upload worker for a waiting /upload request.
+    Returns (receipt, spans), the spans going into the request's
+    Server-Timing (see _collect_receipt)."""
+    _span_capture.spans = []
+    try:
+        return run_extraction(filename, file_bytes), _span_capture.spans
+    finally:
+        _span_capture.spans = None
+
+
+def _collect_receipt(future):
+    """The receipt of a queued _extract_for_request. Returns a result dict
+    or None on error (flashed)."""
+    try:
+        receipt, spans = future.result()
+    except ReceiptExtractionError as e:
+        flash(str(e))
+        return None
+    if 'spans' in g:
+        g.spans.extend(spans)
+    return _with_image_paths(receipt)
+
+
 def _match_key(description):
     """Normalize an item description for matching: lowercase, strip everything
     that isn't a letter or digit. This absorbs OCR spacing/punctuation noise
@@ -862,31 +2414,29 @@ def get_memory_entries(group_id):
     """Return per-item recommendation entries for this household, combining what
     was learned from history with any user-pinned overrides. Each entry:
     {match_key, display, count, learned, override, effective}."""
+    with span('memory'):
+        return _memory_entries(group_id)
+
+
+def _memory_entries(group_id):
+    items = load_group_snapshot(group_id, items=True).items
     cursor = get_cursor()
-    cursor.execute('SELECT id, name FROM users WHERE group_id = %s', (group_id,))
-    members = cursor.fetchall()
-    valid = {m['id'] for m in members}
+    valid = roster_ids(group_id)
     valid.add('shared')
 
     # Learn from history: aggregate assignments and pick a display label per key.
-    cursor.execute(
-        'SELECT i.description, i.assigned_to, i.id FROM items i '
-        'JOIN receipts r ON r.id = i.receipt_id WHERE r.group_id = %s',
-        (group_id,)
-    )
     stats = {}  # key -> {'count', 'assign': {assigned_to: (cnt, recent)}, 'disp': {text: (cnt, recent)}}
-    for row in cursor.fetchall():
-        key = _match_key(row['description'])
+    for description, a, item_id in zip(items['description'], items['assigned_to'], items['id']):
+        key = _match_key(description)
         if not key:
             continue
         s = stats.setdefault(key, {'count': 0, 'assign': {}, 'disp': {}})
         s['count'] += 1
-        a = row['assigned_to']
         cnt, rec = s['assign'].get(a, (0, 0))
-        s['assign'][a] = (cnt + 1, max(rec, row['id']))
-        text = (row['description'] or '').strip()
+        s['assign'][a] = (cnt + 1, max(rec, item_id))
+        text = (description or '').strip()
         dcnt, drec = s['disp'].get(text, (0, 0))
-        s['disp'][text] = (dcnt + 1, max(drec, row['id']))
+        s['disp'][text] = (dcnt + 1, max(drec, item_id))
 
     # Load overrides
     cursor.execute(
@@ -936,10 +2486,12 @@ def get_assignment_memory(group_id):
     return {e['match_key']: e['effective'] for e in get_memory_entries(group_id)}
 
 
-def _apply_assignment_memory(receipts, group_id):
+def _apply_assignment_memory(receipts, group_id, memory=None):
     """Pre-fill each parsed item's suggested assignment from memory, using an
-    exact match_key first and falling back to a fuzzy match for OCR variance."""
-    memory = get_assignment_memory(group_id)
+    exact match_key first and falling back to a fuzzy match for OCR variance.
+    memory: a get_assignment_memory() result to reuse, if already loaded."""
+    if memory is None:
+        memory = get_assignment_memory(group_id)
     keys = list(memory.keys())
     for receipt in receipts:
         for item in receipt['parsed_items']:
@@ -964,18 +2516,636 @@ def upload_bill():
         flash('No files selected.')
         return redirect(request.url)
 
-    receipts = [r for r in (_process_one_file(f) for f in files) if r is not None]
+    group_id = current_user.group_id
+    try:
+        with _waiting_upload(group_id), admit_upload(group_id, len(files)):
+            futures = _upload_scheduler.submit_many(
+                group_id, [(_extract_for_request, (f.filename, f.read())) for f in files])
+            receipts = [r for r in (_collect_receipt(future) for future in futures) if r is not None]
+    except UploadRejected as e:
+        return _reject_upload(e, as_json=False)
     if not receipts:
         return redirect(url_for('index'))
+    _remember_previews(n for r in receipts for n in r['image_files'])
 
     _apply_assignment_memory(receipts, current_user.group_id)
     return render_template('bill_details.html', receipts=receipts)
 
+
+# ── Upload admission ─────────────────────────────────────────────────────────
+# Receipt extraction is the one expensive thing the app does, and households
+# upload in bursts. Two guards keep one household's batch from taking the
+# server away from everyone else:
+#  - a token bucket per household: UPLOAD_RATE_PER_MIN files per minute with
+#    bursts of UPLOAD_BURST; an upload that doesn't fit is answered with 429
+#    and a Retry-After (one turned away by the checks below gets its tokens
+#    back);
+#  - a fair scheduler instead of a FIFO pool: admitted files wait in one
+#    queue per household and the UPLOAD_WORKERS threads take them
+#    round-robin across households, so a 30-receipt batch interleaves with
+#    other households' uploads instead of queueing them behind it. The
+#    queues are bounded in total (UPLOAD_QUEUE_MAX) and per household
+#    (UPLOAD_QUEUE_PER_GROUP); a full queue is also a 429.
+# Plain /upload requests extract on the same workers and wait for the result,
+# which holds a web thread; a household may have UPLOAD_WAITING_PER_GROUP of
+# those at a time. Like the upload jobs, all of this lives in the process
+# (the app runs as one worker).
+
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', '2'))
+UPLOAD_RATE_PER_MIN = float(os.getenv('UPLOAD_RATE_PER_MIN', '20'))
+UPLOAD_BURST = int(os.getenv('UPLOAD_BURST', '30'))
+UPLOAD_QUEUE_MAX = int(os.getenv('UPLOAD_QUEUE_MAX', '100'))
+UPLOAD_QUEUE_PER_GROUP = int(os.getenv('UPLOAD_QUEUE_PER_GROUP', '40'))
+UPLOAD_WAITING_PER_GROUP = int(os.getenv('UPLOAD_WAITING_PER_GROUP', '2'))
+QUEUE_WAIT_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+upload_queue_wait = {}    # household -> Histogram of seconds from queued to started
+upload_rejected = Counter()  # reason -> uploads answered with 429
+
+
+class UploadRejected(Exception):
+    """An upload was not admitted; retry_after is a hint in whole seconds."""
+
+    def __init__(self, message, retry_after, reason):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.reason = reason
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+
+    def take(self, n=1):
+        """Take n tokens if they are there. Returns 0 on success, else the
+        seconds until they will be. A request larger than the bucket costs
+        the whole bucket, so it is admitted when the bucket is full."""
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        n = min(n, self.burst)
+        if self.tokens >= n:
+            self.tokens -= n
+            return 0.0
+        return (n - self.tokens) / self.rate
+
+    def refund(self, n=1):
+        """Give back tokens taken for a request that was turned away later."""
+        self.tokens = min(self.burst, self.tokens + min(n, self.burst))
+
+
+class RateLimiter:
+    """A TokenBucket per key, created full on first use."""
+
+    def __init__(self, per_minute, burst, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, n=1):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, self.clock)
+            return bucket.take(n)
+
+    def refund(self, key, n=1):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.refund(n)
+
+
+class FairScheduler:
+    """Runs calls on `workers` daemon threads, taking queued calls
+    round-robin across keys (one per key per turn). submit() returns
+    Futures, or raises UploadRejected when the queues are full."""
+
+    def __init__(self, workers, max_queued, max_queued_per_key, on_wait=None, name='upload'):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_queued_per_key = max_queued_per_key
+        self.on_wait = on_wait or (lambda key, seconds: None)
+        self.name = name
+        self._queues = OrderedDict()   # key -> deque of (queued_at, future, fn, args); the next turn is first
+        self._queued = 0
+        self._service = 5.0            # moving average of seconds per call, for Retry-After
+        self._threads = []
+        self._cond = threading.Condition()
+
+    def submit(self, key, fn, *args):
+        return self.submit_many(key, [(fn, args)])[0]
+
+    def submit_many(self, key, calls):
+        """Queue all of calls ([(fn, args)]) for key, or none of them."""
+        with self._cond:
+            queue = self._queues.get(key, ())
+            if self._queued + len(calls) > self.max_queued:
+                raise UploadRejected('The server is busy processing receipts. Please try again shortly.',
+                                     self._service * self._queued / self.workers, 'queue_full')
+            if len(queue) + len(calls) > self.max_queued_per_key:
+                raise UploadRejected('Your household already has many receipts being processed. '
+                                     'Please wait for those to finish.',
+                                     self._service * len(queue), 'household_queue_full')
+            queue = self._queues.setdefault(key, deque())
+            now = time.monotonic()
+            futures = []
+            for fn, args in calls:
+                future = Future()
+                queue.append((now, future, fn, args))
+                futures.append(future)
+            self._queued += len(calls)
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, daemon=True,
+                                          name=f'{self.name}-{len(self._threads)}')
+                thread.start()
+                self._threads.append(thread)
+            self._cond.notify(len(calls))
+            return futures
+
+    def queued(self, key=None):
+        with self._cond:
+            return self._queued if key is None else len(self._queues.get(key, ()))
+
+    def _next(self):
+        with self._cond:
+            while not self._queues:
+                self._cond.wait()
+            key, queue = self._queues.popitem(last=False)
+            item = queue.popleft()
+            if queue:
+                self._queues[key] = queue   # back of the line
+            self._queued -= 1
+            return key, item
+
+    def _work(self):
+        while True:
+            key, (queued_at, future, fn, args) = self._next()
+            started = time.monotonic()
+            self.on_wait(key, started - queued_at)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            with self._cond:
+                self._service = 0.8 * self._service + 0.2 * (time.monotonic() - started)
+
+
+def _observe_queue_wait(group_id, seconds):
+    _observe_latency(upload_queue_wait, _metrics_lock, str(group_id), seconds, QUEUE_WAIT_BUCKETS)
+
+
+_upload_limiter = RateLimiter(UPLOAD_RATE_PER_MIN, UPLOAD_BURST)
+_upload_scheduler = FairScheduler(UPLOAD_WORKERS, UPLOAD_QUEUE_MAX, UPLOAD_QUEUE_PER_GROUP,
+                                  on_wait=_observe_queue_wait)
+_upload_waiting = Counter()  # household -> plain /upload requests waiting for their files
+_upload_waiting_lock = threading.Lock()
+
+
+@contextmanager
+def admit_upload(group_id, n_files):
+    """Charge n_files to the household's rate limit; raises UploadRejected.
+    The charge is refunded if the block then rejects the upload (queue full),
+    so a 429 never costs the household tokens."""
+    retry_after = _upload_limiter.take(group_id, n_files)
+    if retry_after:
+        raise UploadRejected("You're uploading receipts faster than they can be processed. "
+                             "Please try again in a moment.", retry_after, 'rate_limited')
+    try:
+        yield
+    except UploadRejected:
+        _upload_limiter.refund(group_id, n_files)
+        raise
+
+
+def _reject_upload(e, as_json):
+    """429 for a rejected upload: JSON for the streamed upload, else the
+    upload page with the message flashed."""
+    with _metrics_lock:
+        upload_rejected[e.reason] += 1
+    logging.info(f"Upload rejected ({e.reason}) for household {current_user.group_id}")
+    if as_json:
+        response = jsonify(error=str(e))
+    else:
+        flash(str(e), 'error')
+        response = Response(render_template('index.html'))
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+@contextmanager
+def _waiting_upload(group_id):
+    """Hold one of the household's UPLOAD_WAITING_PER_GROUP slots."""
+    with _upload_waiting_lock:
+        if _upload_waiting[group_id] >= UPLOAD_WAITING_PER_GROUP:
+            raise UploadRejected('Another upload from your household is still being processed. '
+                                 'Please wait for it to finish.', 5, 'household_busy')
+        _upload_waiting[group_id] += 1
+    try:
+        yield
+    finally:
+        with _upload_waiting_lock:
+            _upload_waiting[group_id] -= 1
+            if not _upload_waiting[group_id]:
+                del _upload_waiting[group_id]
+
+
+# ── Streamed uploads ─────────────────────────────────────────────────────────
+# The upload page posts files to /upload/async, which queues one extraction
+# per file on the upload scheduler and returns a job id. The review page then follows
+# /upload/job/<id>/events (Server-Sent Events): per-file stages as they
+# happen, and each receipt's rendered block as soon as that file is done, so
+# the first receipt shows up after the fastest file rather than the slowest.
+# Jobs live in this process (the app runs as one threaded worker) and expire
+# after UPLOAD_JOB_TTL seconds.
+
+UPLOAD_JOB_TTL = int(os.getenv('UPLOAD_JOB_TTL', '900'))
+UPLOAD_STAGES = ('received', 'preprocessed', 'ocr', 'parsed', 'memory')
+SSE_KEEPALIVE = 15
+
+_upload_jobs = {}
+_upload_jobs_lock = threading.Lock()
+# Headline metric: submit -> first receipt on screen.
+upload_first_receipt = Histogram(buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0))
+
+
+class UploadJob:
+    """Event log of one streamed upload batch. Workers append events; readers
+    wait on the condition and can resume from any position, so an
+    EventSource reconnect (Last-Event-ID) misses nothing."""
+
+    def __init__(self, user_id, group_id, filenames):
+        self.id = secrets.token_urlsafe(16)
+        self.user_id = user_id
+        self.group_id = group_id
+        self.filenames = filenames
+        self.created = time.monotonic()
+        self.events = []
+        self.pending = len(filenames)
+        self.first_receipt = None  # seconds from submit to the first receipt sent
+        self.previews = set()      # preview files this job produced
+        self._cond = threading.Condition()
+
+    def emit(self, index, stage, **data):
+        with self._cond:
+            self.events.append({'file': index, 'stage': stage,
+                                'elapsed': round(time.monotonic() - self.created, 3), **data})
+            if stage in ('parsed', 'failed'):
+                self.pending -= 1
+            self._cond.notify_all()
+
+    def wait(self, position, timeout):
+        """Events from `position` on, blocking up to `timeout` for new ones.
+        Returns (events, finished)."""
+        with self._cond:
+            if len(self.events) <= position and self.pending:
+                self._cond.wait(timeout)
+            return self.events[position:], not self.pending
+
+
+def _run_upload_file(job, index, filename, file_bytes):
+    try:
+        receipt = run_extraction(filename, file_bytes, on_stage=lambda stage: job.emit(index, stage))
+    except ReceiptExtractionError as e:
+        job.emit(index, 'failed', error=str(e))
+    except Exception:
+        logging.exception(f"Error processing {filename}")
+        job.emit(index, 'failed', error=f"Couldn't process {filename}.")
+    else:
+        job.previews.update(receipt['image_files'])
+        job.emit(index, 'parsed', receipt=receipt)
+
+
+def _start_upload_job(user_id, group_id, files):
+    """files: [(filename, bytes)]. Queues the extraction and returns the job;
+    raises UploadRejected if the household's queue is full."""
+    job = UploadJob(user_id, group_id, [name for name, _ in files])
+    _upload_scheduler.submit_many(group_id, [(_run_upload_file, (job, index, filename, file_bytes))
+                                             for index, (filename, file_bytes) in enumerate(files)])
+    with _upload_jobs_lock:
+        now = time.monotonic()
+        for stale in [j for j in _upload_jobs.values() if now - j.created > UPLOAD_JOB_TTL]:
+            del _upload_jobs[stale.id]
+        _upload_jobs[job.id] = job
+    return job
+
+
+def _user_job_has_preview(user_id, filename):
+    with _upload_jobs_lock:
+        return any(job.user_id == user_id and filename in job.previews for job in _upload_jobs.values())
+
+
+def _get_upload_job(job_id):
+    with _upload_jobs_lock:
+        job = _upload_jobs.get(job_id)
+    if job is None or job.user_id != current_user.id:
+        abort(404)
+    return job
+
+
+def sse_message(event, data, event_id=None):
+    """One Server-Sent Events message."""
+    head = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{head}event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def _upload_event_stream(job, position):
+    """SSE stream of a job from `position`. Parsed receipts get assignment
+    memory applied and are rendered here (that needs the request context)."""
+    memory = None
+    while True:
+        events, finished = job.wait(position, SSE_KEEPALIVE)
+        if not events:
+            if finished:
+                yield sse_message('done', {'first_receipt': job.first_receipt,
+                                           'elapsed': round(time.monotonic() - job.created, 3)})
+                return
+            yield ': keep-alive\n\n'
+            continue
+        for event in events:
+            if event['stage'] == 'parsed':
+                if memory is None:
+                    memory = get_assignment_memory(job.group_id)
+                receipt = _with_image_paths(event['receipt'])
+                receipt['parsed_items'] = [dict(item) for item in receipt['parsed_items']]
+                _apply_assignment_memory([receipt], job.group_id, memory)
+                html = render_template('_receipt_block.html', receipt=receipt, ri=event['file'],
+                                       multiple=len(job.filenames) > 1)
+                if job.first_receipt is None:
+                    job.first_receipt = round(time.monotonic() - job.created, 3)
+                    upload_first_receipt.observe(job.first_receipt)
+                    logging.info(f"Upload {job.id}: first receipt after {job.first_receipt:.2f}s "
+                                 f"({len(job.filenames)} file(s))")
+                yield sse_message('receipt', {'file': event['file'], 'stage': 'memory',
+                                              'elapsed': event['elapsed'], 'html': html}, position)
+            else:
+                yield sse_message('stage', event, position)
+            position += 1
+
+
+@app.route('/upload/async', methods=['POST'])
+@login_required
+def upload_async():
+    """Start a streamed upload; the files are read here, processed in the
+    background."""
+    files = [(f.filename, f.read()) for f in request.files.getlist('bill_image') if f.filename]
+    if not files:
+        return jsonify(error='No files selected.'), 400
+    try:
+        with admit_upload(current_user.group_id, len(files)):
+            job = _start_upload_job(current_user.id, current_user.group_id, files)
+    except UploadRejected as e:
+        return _reject_upload(e, as_json=True)
+    return jsonify(job_id=job.id, url=url_for('upload_job', job_id=job.id))
+
+
+@app.route('/upload/job/<job_id>')
+@login_required
+def upload_job(job_id):
+    """Review page of a streamed upload; receipts are filled in as they finish."""
+    job = _get_upload_job(job_id)
+    return render_template('bill_details.html', receipts=[], job=job, upload_stages=UPLOAD_STAGES)
+
+
+@app.route('/upload/job/<job_id>/events')
+@login_required
+def upload_job_events(job_id):
+    job = _get_upload_job(job_id)
+    try:
+        position = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        position = 0
+    return Response(stream_with_context(_upload_event_stream(job, position)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# ── Serving uploads ──────────────────────────────────────────────────────────
+# Preview files are write-once and named by content hash, so the name is the
+# ETag and browsers may cache them for a year without revalidating. They stay
+# private: a preview is served only to its uploader while it's pending review
+# (session, or their streamed upload job) or to members of a household whose
+# receipt references it. UPLOAD_SENDFILE=x-accel (with an nginx internal
+# location at UPLOAD_ACCEL_PREFIX) or x-sendfile hands the bytes to the proxy.
+
+UPLOAD_SENDFILE = os.getenv('UPLOAD_SENDFILE', '').lower()
+UPLOAD_ACCEL_PREFIX = os.getenv('UPLOAD_ACCEL_PREFIX', '/_uploads/')
+UPLOAD_MAX_AGE = 365 * 24 * 3600
+PENDING_PREVIEWS_MAX = 50
+app.config['USE_X_SENDFILE'] = UPLOAD_SENDFILE == 'x-sendfile'
+
+
+def _remember_previews(names):
+    """Let this session view previews it just uploaded (before they're saved)."""
+    pending = session.get('pending_previews', []) + list(names)
+    session['pending_previews'] = pending[-PENDING_PREVIEWS_MAX:]
+
+
+def _can_view_upload(filename):
+    if filename in session.get('pending_previews', ()):
+        return True
+    if _user_job_has_preview(current_user.id, filename):
+        # A streamed receipt reaches the session only through the review
+        # page fetching its preview (the event stream's headers are already
+        # sent); remember it there so it outlives the job.
+        _remember_previews([filename])
+        return True
+    cursor = get_cursor()
+    cursor.execute(
+        "SELECT 1 FROM receipts WHERE group_id = %s AND %s = ANY(string_to_array(image_path, ',')) LIMIT 1",
+        (current_user.group_id, filename)
+    )
+    return cursor.fetchone() is not None
+
+
+def _cache_forever(response):
+    response.cache_control.private = True
+    response.cache_control.max_age = UPLOAD_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+
+def _send_upload(relative_path, etag):
+    """Send a write-once file under the UPLOAD_FOLDER with caching headers,
+    or hand it to the proxy (see UPLOAD_SENDFILE)."""
+    if UPLOAD_SENDFILE == 'x-accel':
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+        else:
+            if not os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], relative_path)):
+                abort(404)
+            response = app.response_class(mimetype=mimetypes.guess_type(relative_path)[0])
+            response.headers['X-Accel-Redirect'] = UPLOAD_ACCEL_PREFIX + relative_path
+        response.set_etag(etag)
+        return _cache_forever(response)
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], relative_path, etag=etag,
+                                   max_age=UPLOAD_MAX_AGE, conditional=True)
+    return _cache_forever(response)
+
+
 @app.route('/uploads/<filename>')
 @login_required
 def uploaded_file(filename):
-    """Securely serves uploaded files from the UPLOAD_FOLDER."""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """Serves a preview from the UPLOAD_FOLDER to members allowed to see it."""
+    if not PREVIEW_NAME_RE.match(filename) or not _can_view_upload(filename):
+        abort(404)
+    return _send_upload(filename, filename.rsplit('.', 1)[0])
+
+
+# ── Thumbnails ───────────────────────────────────────────────────────────────
+# /uploads/<name>/thumb?w=N serves a smaller copy of a preview, with N snapped
+# to THUMB_WIDTHS so only a few variants exist. Thumbnails are rendered on a
+# small thread pool, concurrent requests for the same one share a single
+# render, and results live in an LRU disk cache (UPLOAD_FOLDER/thumbs) capped
+# at THUMB_CACHE_BYTES. Like previews, a thumbnail never changes once made.
+# If rendering fails or times out, or the thumbnail is evicted before it's
+# sent, the full preview is served instead.
+
+THUMB_WIDTHS = (160, 320, 480, 640)
+THUMB_DIR = 'thumbs'
+THUMB_CACHE_BYTES = int(os.getenv('THUMB_CACHE_BYTES', str(64 * 1024 * 1024)))
+THUMB_WORKERS = int(os.getenv('THUMB_WORKERS', '2'))
+THUMB_RENDER_TIMEOUT = 30
+# Review-page previews show at 200 CSS px; 480 stays sharp on 2x screens.
+THUMB_PREVIEW_WIDTH = 480
+
+
+def snap_thumb_width(requested):
+    """The smallest configured width >= requested (the largest if none)."""
+    for width in THUMB_WIDTHS:
+        if requested <= width:
+            return width
+    return THUMB_WIDTHS[-1]
+
+
+class ThumbnailCache:
+    """LRU set of files in one directory, evicting least recently used files
+    once their total size exceeds `budget` bytes. Recency starts from file
+    mtimes, so the order survives restarts roughly."""
+
+    def __init__(self, folder, budget):
+        self.folder = folder
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # name -> size, least recent first
+        self._total = 0
+        os.makedirs(folder, exist_ok=True)
+        entries = [e for e in os.scandir(folder) if e.is_file() and not e.name.endswith('.tmp')]
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            self._files[entry.name] = entry.stat().st_size
+            self._total += entry.stat().st_size
+
+    def get(self, name):
+        """Path of a cached file (marking it recently used), or None."""
+        with self._lock:
+            if name not in self._files:
+                return None
+            self._files.move_to_end(name)
+        return os.path.join(self.folder, name)
+
+    def put(self, name, data):
+        path = os.path.join(self.folder, name)
+        tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._total += len(data) - self._files.pop(name, 0)
+            self._files[name] = len(data)
+            while self._total > self.budget and len(self._files) > 1:
+                old, size = self._files.popitem(last=False)
+                self._total -= size
+                try:
+                    os.remove(os.path.join(self.folder, old))
+                except FileNotFoundError:
+                    pass
+        return path
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            return self._total
+
+
+_thumb_pool = ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix='thumb')
+_thumb_cache = None
+_thumb_inflight = {}
+_thumb_lock = threading.Lock()
+
+
+def _get_thumb_cache():
+    global _thumb_cache
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], THUMB_DIR)
+    with _thumb_lock:
+        if _thumb_cache is None or _thumb_cache.folder != folder:
+            _thumb_cache = ThumbnailCache(folder, THUMB_CACHE_BYTES)
+        return _thumb_cache
+
+
+def render_thumbnail(source_path, width):
+    """Encoded bytes of the image at source_path scaled down to `width`."""
+    with Image.open(source_path) as img:
+        img.load()
+        img.thumbnail((width, width * 10), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, PREVIEW_FORMAT.upper(), quality=PREVIEW_QUALITY)
+        return buf.getvalue()
+
+
+def get_thumbnail(filename, width):
+    """Name of the cached thumbnail (under THUMB_DIR), rendering it once even
+    when many requests ask at the same time."""
+    cache = _get_thumb_cache()
+    stem, ext = filename.rsplit('.', 1)
+    name = f'{stem}_w{width}.{ext}'
+    if cache.get(name):
+        return name
+    with _thumb_lock:
+        future = _thumb_inflight.get(name)
+        if future is None:
+            source = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            future = _thumb_pool.submit(lambda: cache.put(name, render_thumbnail(source, width)))
+            _thumb_inflight[name] = future
+            future.add_done_callback(lambda f: _thumb_inflight.pop(name, None))
+    future.result(timeout=THUMB_RENDER_TIMEOUT)
+    return name
+
+
+@app.route('/uploads/<filename>/thumb')
+@login_required
+def uploaded_thumbnail(filename):
+    width = snap_thumb_width(request.args.get('w', THUMB_WIDTHS[1], type=int))
+    if not PREVIEW_NAME_RE.match(filename) or not _can_view_upload(filename):
+        abort(404)
+    if not os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], filename)):
+        abort(404)
+    try:
+        name = get_thumbnail(filename, width)
+        return _send_upload(f'{THUMB_DIR}/{name}', name.rsplit('.', 1)[0])
+    except NotFound:
+        pass  # evicted from the cache between rendering and sending
+    except Exception:
+        logging.exception(f"Couldn't render the {width}px thumbnail of {filename}")
+    return _thumbnail_fallback(filename)
+
+
+def _thumbnail_fallback(filename):
+    """The full preview in place of a thumbnail, not cached under the
+    thumbnail's URL so the next request tries the thumbnail again."""
+    response = _send_upload(filename, filename.rsplit('.', 1)[0])
+    response.cache_control.immutable = False
+    response.cache_control.max_age = 0
+    response.cache_control.no_cache = True
+    return response
 
 
 @app.route('/save_details', methods=['POST'])
@@ -991,15 +3161,17 @@ def save_details():
         # Valid assignment targets are only members of the current household,
         # plus the special 'shared'/'excluded' markers. This stops a tampered
         # form from crediting or assigning items to users in other groups.
-        cursor.execute('SELECT id FROM users WHERE group_id = %s', (current_user.group_id,))
-        valid_user_ids = {row['id'] for row in cursor.fetchall()}
+        valid_user_ids = roster_ids(current_user.group_id)
 
         for ri in range(receipt_count):
             pfx = f'r{ri}_'
+            if f'{pfx}filename' not in request.form:
+                continue  # a file that failed in a streamed upload
             payer_id = request.form[f'{pfx}payer_id']
             filename = request.form.get(f'{pfx}filename')
             raw_date = request.form.get(f'{pfx}bill_date')
             bill_date = None if (not raw_date or raw_date == 'Unknown Date') else raw_date
+            image_path = ','.join(preview_names(request.form.get(f'{pfx}image_files'))) or None
 
             if payer_id not in valid_user_ids:
                 db.rollback()
@@ -1007,11 +3179,12 @@ def save_details():
                 return redirect(url_for('index'))
 
             cursor.execute(
-                'INSERT INTO receipts (payer_id, filename, bill_date, group_id) VALUES (%s, %s, %s, %s) RETURNING id',
-                (payer_id, filename, bill_date, current_user.group_id)
+                'INSERT INTO receipts (payer_id, filename, bill_date, group_id, image_path) '
+                'VALUES (%s, %s, %s, %s, %s) RETURNING id',
+                (payer_id, filename, bill_date, current_user.group_id, image_path)
             )
             receipt_id = cursor.fetchone()['id']
-            total = 0.0
+            deltas, item_rows = [], []
 
             for key, value in request.form.items():
                 if not key.startswith(pfx):
@@ -1037,13 +3210,16 @@ def save_details():
                     price_str = request.form.get(f'{pfx}item_price_{idx}')
                 if desc and price_str:
                     price = float(price_str)
-                    total += price
-                    cursor.execute(
-                        'INSERT INTO items (receipt_id, description, price, assigned_to) VALUES (%s, %s, %s, %s)',
-                        (receipt_id, desc, price, assigned_to)
-                    )
+                    deltas.append((receipt_id, assigned_to, to_cents(price), 1))
+                    item_rows.append((receipt_id, desc, price, assigned_to))
 
-            cursor.execute('UPDATE receipts SET total = %s WHERE id = %s', (total, receipt_id))
+            # One statement for all of the receipt's items.
+            psycopg2.extras.execute_values(
+                cursor, 'INSERT INTO items (receipt_id, description, price, assigned_to) VALUES %s',
+                item_rows, page_size=1000
+            )
+            _apply_summary_deltas(cursor, deltas)
+            _invalidate_snapshots(cursor, current_user.group_id, receipt_id)
 
         db.commit()
         msg = f'{receipt_count} bills saved! Check the amounts below.' if receipt_count > 1 else 'Bill saved! Check the amounts below.'
@@ -1060,9 +3236,18 @@ def save_details():
 @app.route('/balances')
 @login_required
 def balances():
-    """Displays the final calculated balances."""
-    balances_data = calculate_balances_detailed(current_user.group_id)
-    return render_template('balances.html', balance=balances_data)
+    """Displays the calculated balances, all-time or as of ?as_of=YYYY-MM-DD,
+    plus spending per month for the history chart."""
+    as_of = None
+    raw_as_of = request.args.get('as_of', '').strip()
+    if raw_as_of:
+        try:
+            as_of = date.fromisoformat(raw_as_of)
+        except ValueError:
+            flash('Invalid date.')
+    balances_data = get_balances_as_of(current_user.group_id, as_of)
+    monthly = get_monthly_spending(current_user.group_id)
+    return render_template('balances.html', balance=balances_data, as_of=as_of, monthly=monthly)
 
 
 @app.route('/settle', methods=['POST'])
@@ -1078,8 +3263,7 @@ def settle():
         to_id = request.form.get('to_id')
         amount = float(request.form.get('amount', 0))
 
-        cursor.execute('SELECT id FROM users WHERE group_id = %s', (current_user.group_id,))
-        valid_user_ids = {row['id'] for row in cursor.fetchall()}
+        valid_user_ids = roster_ids(current_user.group_id)
         if from_id not in valid_user_ids or to_id not in valid_user_ids or from_id == to_id:
             flash('Invalid settlement.')
             return redirect(url_for('balances'))
@@ -1097,6 +3281,8 @@ def settle():
             'INSERT INTO items (receipt_id, description, price, assigned_to) VALUES (%s, %s, %s, %s)',
             (receipt_id, 'Settlement payment', amount, to_id)
         )
+        _apply_summary_deltas(cursor, [(receipt_id, to_id, to_cents(amount), 1)])
+        _invalidate_snapshots(cursor, current_user.group_id, receipt_id)
         db.commit()
         flash('Settlement recorded.')
     except Exception as e:
@@ -1111,9 +3297,7 @@ def settle():
 def memory_page():
     """View and edit the assignment recommendations learned from history."""
     entries = get_memory_entries(current_user.group_id)
-    cursor = get_cursor()
-    cursor.execute('SELECT id, name FROM users WHERE group_id = %s ORDER BY name', (current_user.group_id,))
-    members = cursor.fetchall()
+    members = get_roster(current_user.group_id)
     return render_template('memory.html', entries=entries, members=members)
 
 
@@ -1132,8 +3316,7 @@ def memory_set():
 
         db = get_db()
         cursor = get_cursor()
-        cursor.execute('SELECT id FROM users WHERE group_id = %s', (current_user.group_id,))
-        valid = {row['id'] for row in cursor.fetchall()}
+        valid = roster_ids(current_user.group_id)
         if assigned_to != 'shared' and assigned_to not in valid:
             flash('Invalid assignment.')
             return redirect(url_for('memory_page'))
@@ -1177,77 +3360,99 @@ def memory_reset():
     return redirect(url_for('memory_page'))
 
 
-def get_bill_history(sort_by='upload_date', group_id=None):
-    cursor = get_cursor()
+# Sort keys of the history page; newest/largest first, unknown values first
+# (like ORDER BY ... DESC in Postgres).
+HISTORY_SORTS = ('upload_date', 'bill_date', 'total')
 
-    cursor.execute('SELECT id, name FROM users WHERE group_id = %s ORDER BY name', (group_id,))
-    user_ids = [u['id'] for u in cursor.fetchall()]
 
-    # Define the mapping of sort keys to SQL columns
-    # We use a whitelist approach here to prevent SQL injection
-    sort_options = {
-        'upload_date': 'upload_date DESC',
-        'bill_date': 'bill_date DESC',
-        'total': 'total DESC'
-    }
-    order_clause = sort_options.get(sort_by, 'upload_date DESC')
-    # Use the dynamic order clause
-    query = f'SELECT id, upload_date, payer_id, filename, bill_date, total FROM receipts WHERE group_id = %s ORDER BY {order_clause}'
-    cursor.execute(query, (group_id,))
-    receipts = cursor.fetchall()
-
-    # Fetch all items for these receipts in a single query (avoids N+1),
-    # then group them by receipt_id in memory.
-    receipt_ids = [r['id'] for r in receipts]
-    items_by_receipt = {rid: [] for rid in receipt_ids}
-    if receipt_ids:
-        cursor.execute(
-            'SELECT id, receipt_id, description, price, assigned_to FROM items WHERE receipt_id = ANY(%s) ORDER BY id',
-            (receipt_ids,)
-        )
-        for row in cursor.fetchall():
-            items_by_receipt[row['receipt_id']].append(
-                {'id': row['id'], 'description': row['description'],
-                 'assigned_to': row['assigned_to'], 'price': float(row['price'])}
-            )
+def get_bill_history(sort_by='upload_date', group_id=None):
+    snapshot = load_group_snapshot(group_id, items=True)
+    return bill_history(snapshot, [u['id'] for u in get_roster(group_id)], sort_by)
+
+
+def bill_history(snapshot, user_ids, sort_by='upload_date'):
+    """Shape a GroupSnapshot loaded with items into the history page's
+    receipts (newest first by sort_by). Their items are ReceiptItems views
+    of the snapshot's columns."""
+    cols, item_cols = snapshot.receipts, snapshot.items
+
+    # Group the items by receipt in one pass over the receipt_id column.
+    items_by_receipt = {rid: ReceiptItems(item_cols) for rid in cols['id']}
+    for k, rid in enumerate(item_cols['receipt_id']):
+        items_by_receipt[rid].positions.append(k)
+
+    # Per-receipt, per-assignee sums come from the maintained receipt
+    # summaries, so Python only shapes them (no per-member rescans of each
+    # receipt's items); receipts not yet backfilled are summed from their items.
+    cents_by_receipt = {}
+    for rid, cents in zip(cols['id'], cols['assignee_cents']):
+        if cents is None:
+            cents = {}
+            for item in items_by_receipt[rid]:
+                cents[item.assigned_to] = cents.get(item.assigned_to, 0) + item.price_cents
+        cents_by_receipt[rid] = cents
+
+    key = cols[sort_by if sort_by in HISTORY_SORTS else 'upload_date']
+    order = sorted(range(len(snapshot)), key=lambda k: (key[k] is None, key[k]), reverse=True)
 
     bills_history = []
-
-    for receipt in receipts:
-        items = items_by_receipt[receipt['id']]
-        totals_by_user = {uid: round(sum(item['price'] for item in items if item['assigned_to'] == uid), 2)
-                           for uid in user_ids}
-        shared_total = sum(item['price'] for item in items if item['assigned_to'] == 'shared')
-        calculated_total = sum(totals_by_user.values()) + shared_total
+    for k in order:
+        rid, upload_date, filename, bill_date = (cols[c][k] for c in ('id', 'upload_date', 'filename', 'bill_date'))
         # Settlements (Settle-up button or Manual Payment) are paybacks, not
         # scanned bills — flag them so the UI can label/filter them separately.
-        is_settlement = is_settlement_filename(receipt['filename'])
         bills_history.append({
-            'id': receipt['id'],
-            'upload_date': receipt['upload_date'].strftime('%Y-%m-%d %H:%M') if receipt['upload_date'] else "N/A",
-            'filename': receipt['filename'],
-            'is_settlement': is_settlement,
-            'date': receipt['bill_date'] if receipt['bill_date'] else "Unknown",
-            'payer': receipt['payer_id'],
-            'items': items,
-            'totals_by_user': totals_by_user,
-            'shared_total': round(shared_total, 2),
-            'total': round(calculated_total, 2)
+            'id': rid,
+            'upload_date': upload_date.strftime('%Y-%m-%d %H:%M') if upload_date else "N/A",
+            'filename': filename,
+            'is_settlement': is_settlement_filename(filename),
+            'date': bill_date if bill_date else "Unknown",
+            'payer': cols['payer_id'][k],
+            'items': items_by_receipt[rid],
+            **receipt_totals(cents_by_receipt[rid], user_ids),
         })
 
     return bills_history
 
 
+# Histories longer than this render in the lean client-side mode by default
+# (?view=full / ?view=compact force either mode).
+HISTORY_COMPACT_THRESHOLD = int(os.environ.get('HISTORY_COMPACT_THRESHOLD', 100))
+
+
+def history_payload(bills_history):
+    """Compact JSON-safe form of get_bill_history() for the lean history view:
+    one object per receipt, items as [id, description, price, assigned_to]."""
+    return [{
+        'id': r['id'],
+        'upload_date': r['upload_date'],
+        'filename': r['filename'],
+        'is_settlement': r['is_settlement'],
+        'date': r['date'].isoformat() if hasattr(r['date'], 'isoformat') else '',
+        'payer': r['payer'],
+        'totals_by_user': r['totals_by_user'],
+        'shared_total': r['shared_total'],
+        'total': r['total'],
+        'items': [[i['id'], i['description'], i['price'], i['assigned_to']] for i in r['items']],
+    } for r in bills_history]
+
+
 @app.route('/history')
 @login_required
 def history():
     # Capture the sort preference from the URL query string (?sort_by=...)
     sort_by = request.args.get('sort_by', 'upload_date')
-    
+    view = request.args.get('view')
+
     # Pass the preference to the data fetcher
     receipts = get_bill_history(sort_by=sort_by, group_id=current_user.group_id)
-    
-    return render_template("history.html", receipts=receipts, current_sort=sort_by)
+
+    # Long histories skip the per-item forms/selects (HTML grows with
+    # items x members) and ship one JSON payload rendered client-side.
+    compact = view == 'compact' or (view != 'full' and len(receipts) > HISTORY_COMPACT_THRESHOLD)
+    if compact:
+        return render_template("history.html", receipts=receipts, current_sort=sort_by,
+                               compact=True, payload=history_payload(receipts))
+    return render_template("history.html", receipts=receipts, current_sort=sort_by, compact=False)
 
 
 @app.route('/update_receipt_date', methods=['POST'])
@@ -1261,11 +3466,14 @@ def update_receipt_date():
         db = get_db()
         cursor = get_cursor()
 
-        # Update the bill_date for the specific receipt
+        # Update the bill_date for the specific receipt. The receipt moves
+        # between months, so both the old and the new month's snapshot go.
+        _invalidate_snapshots(cursor, current_user.group_id, receipt_id)
         cursor.execute(
             'UPDATE receipts SET bill_date = %s WHERE id = %s AND group_id = %s',
             (new_date, receipt_id, current_user.group_id)
         )
+        _invalidate_snapshots(cursor, current_user.group_id, receipt_id)
         db.commit()
         flash(f'Date updated for Receipt #{receipt_id}!')
     except Exception as e:
@@ -1295,8 +3503,7 @@ def add_missing_item():
             return redirect(url_for('history'))
 
         # Assignment must be 'shared' or a member of this household
-        cursor.execute('SELECT id FROM users WHERE group_id = %s', (current_user.group_id,))
-        valid_user_ids = {row['id'] for row in cursor.fetchall()}
+        valid_user_ids = roster_ids(current_user.group_id)
         if assigned_to != 'shared' and assigned_to not in valid_user_ids:
             flash('Invalid item assignment.')
             return redirect(url_for('history'))
@@ -1306,6 +3513,8 @@ def add_missing_item():
             'INSERT INTO items (receipt_id, description, price, assigned_to) VALUES (%s, %s, %s, %s)',
             (receipt_id, description, price, assigned_to)
         )
+        _apply_summary_deltas(cursor, [(receipt_id, assigned_to, to_cents(price), 1)])
+        _invalidate_snapshots(cursor, current_user.group_id, receipt_id)
         db.commit()
         flash('Item added successfully!')
     except Exception as e:
@@ -1315,26 +3524,357 @@ def add_missing_item():
     return redirect(url_for('history'))
 
 
-def _recompute_receipt_total(cursor, receipt_id):
-    """Keep receipts.total in sync after item changes (excludes 'excluded' items)."""
+# ── Receipt summaries ────────────────────────────────────────────────────────
+# Next to receipts.total, every receipt carries maintained summaries of its
+# items: item_count, shared_cents, excluded_cents and assignee_cents (JSONB
+# {assigned_to: cents}, zero sums omitted). Item writes update them in the same
+# transaction - single edits as deltas, bulk changes with a set-based refresh -
+# so history and balances read receipts alone. A NULL summary (not yet
+# backfilled) makes readers fall back to items. `flask check-receipt-summaries`
+# verifies them against items.
+
+def _summary_columns(assignee_cents, item_count):
+    """(assignee_cents JSON, shared, excluded, item_count, total cents)."""
+    return (psycopg2.extras.Json(assignee_cents),
+            assignee_cents.get('shared', 0),
+            assignee_cents.get('excluded', 0),
+            item_count,
+            sum(c for a, c in assignee_cents.items() if a != 'excluded'))
+
+
+def _apply_summary_deltas(cursor, deltas):
+    """Apply item changes to their receipts' summaries without rescanning
+    items. deltas: iterable of (receipt_id, assigned_to, cents, count), e.g.
+    an insert is (+cents, +1), a delete (-cents, -1) and a reassignment one
+    of each."""
+    by_receipt = {}
+    for receipt_id, assigned_to, cents, count in deltas:
+        entry = by_receipt.setdefault(int(receipt_id), [{}, 0])
+        entry[0][assigned_to] = entry[0].get(assigned_to, 0) + cents
+        entry[1] += count
+    if not by_receipt:
+        return
+
+    cursor.execute(
+        'SELECT id, assignee_cents, item_count FROM receipts WHERE id = ANY(%s) FOR UPDATE',
+        (list(by_receipt),)
+    )
+    rows, stale = [], []
+    for row in cursor.fetchall():
+        if row['assignee_cents'] is None or row['item_count'] is None:
+            stale.append(row['id'])
+            continue
+        merged = dict(row['assignee_cents'])
+        delta, count = by_receipt[row['id']]
+        for assigned_to, cents in delta.items():
+            value = merged.get(assigned_to, 0) + cents
+            if value:
+                merged[assigned_to] = value
+            else:
+                merged.pop(assigned_to, None)
+        rows.append((row['id'], *_summary_columns(merged, row['item_count'] + count)))
+    if rows:
+        psycopg2.extras.execute_values(
+            cursor,
+            'UPDATE receipts SET assignee_cents = v.assignee_cents, shared_cents = v.shared, '
+            'excluded_cents = v.excluded, item_count = v.item_count, total = ROUND(v.total / 100.0, 2) '
+            'FROM (VALUES %s) AS v (id, assignee_cents, shared, excluded, item_count, total) '
+            'WHERE receipts.id = v.id',
+            rows,
+            template='(%s, %s::jsonb, %s, %s, %s, %s)'
+        )
+    if stale:
+        _refresh_receipt_summaries(cursor, stale)
+
+
+# Per-receipt aggregates of items, shared by the refresh and the checker.
+_RECEIPT_SUMMARY_AGG_SQL = """
+    SELECT receipt_id,
+           SUM(n)::int AS item_count,
+           COALESCE(jsonb_object_agg(assigned_to, cents) FILTER (WHERE cents <> 0), '{{}}'::jsonb) AS assignee_cents,
+           COALESCE(SUM(cents) FILTER (WHERE assigned_to = 'shared'), 0)::bigint AS shared_cents,
+           COALESCE(SUM(cents) FILTER (WHERE assigned_to = 'excluded'), 0)::bigint AS excluded_cents,
+           COALESCE(SUM(cents) FILTER (WHERE assigned_to <> 'excluded'), 0)::bigint AS total_cents
+    FROM (SELECT receipt_id, assigned_to, COUNT(*) AS n, SUM(ROUND(price * 100))::bigint AS cents
+          FROM items WHERE {where} GROUP BY receipt_id, assigned_to) per
+    GROUP BY receipt_id
+"""
+
+
+def _refresh_receipt_summaries(cursor, receipt_ids):
+    """Recompute summaries (and total) of these receipts from their items in
+    one statement. For bulk changes where deltas aren't known."""
+    receipt_ids = list(receipt_ids)
+    if not receipt_ids:
+        return
+    cursor.execute(
+        f'WITH agg AS ({_RECEIPT_SUMMARY_AGG_SQL.format(where="receipt_id = ANY(%(ids)s)")}) '
+        'UPDATE receipts r SET item_count = COALESCE(agg.item_count, 0), '
+        "assignee_cents = COALESCE(agg.assignee_cents, '{}'::jsonb), "
+        'shared_cents = COALESCE(agg.shared_cents, 0), excluded_cents = COALESCE(agg.excluded_cents, 0), '
+        'total = ROUND(COALESCE(agg.total_cents, 0) / 100.0, 2) '
+        'FROM receipts r2 LEFT JOIN agg ON agg.receipt_id = r2.id '
+        'WHERE r.id = r2.id AND r2.id = ANY(%(ids)s)',
+        {'ids': receipt_ids}
+    )
+
+
+def find_inconsistent_receipt_summaries(cursor):
+    """Ids of receipts whose summary columns disagree with their items."""
     cursor.execute(
-        "SELECT COALESCE(SUM(price), 0) AS t FROM items "
-        "WHERE receipt_id = %s AND assigned_to <> 'excluded'",
-        (receipt_id,)
+        f'WITH agg AS ({_RECEIPT_SUMMARY_AGG_SQL.format(where="TRUE")}) '
+        'SELECT r.id FROM receipts r LEFT JOIN agg ON agg.receipt_id = r.id '
+        'WHERE r.item_count IS DISTINCT FROM COALESCE(agg.item_count, 0) '
+        "OR r.assignee_cents IS DISTINCT FROM COALESCE(agg.assignee_cents, '{}'::jsonb) "
+        'OR r.shared_cents IS DISTINCT FROM COALESCE(agg.shared_cents, 0) '
+        'OR r.excluded_cents IS DISTINCT FROM COALESCE(agg.excluded_cents, 0) '
+        'OR ROUND(r.total * 100) IS DISTINCT FROM COALESCE(agg.total_cents, 0) '
+        'ORDER BY r.id'
     )
-    total = cursor.fetchone()['t']
-    cursor.execute('UPDATE receipts SET total = %s WHERE id = %s', (total, receipt_id))
+    return [row['id'] for row in cursor.fetchall()]
+
+
+@app.cli.command('check-receipt-summaries')
+@click.option('--fix', is_flag=True, help='Recompute the summaries that disagree.')
+def check_receipt_summaries_command(fix):
+    """Verify receipt summary columns against the items table."""
+    conn = connect_db()
+    try:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        bad = find_inconsistent_receipt_summaries(cur)
+        print(f"{len(bad)} receipt(s) with inconsistent summaries"
+              + (f": {', '.join(map(str, bad[:50]))}{' ...' if len(bad) > 50 else ''}" if bad else "."))
+        if bad and fix:
+            _refresh_receipt_summaries(cur, bad)
+            conn.commit()
+            print("Fixed.")
+        elif bad:
+            raise SystemExit(1)
+    finally:
+        conn.close()
+
+
+def _summary_items(cursor, receipts):
+    """Per-(receipt, assignee) pseudo-items (ItemRecords with receipt_id,
+    assigned_to and price_cents) from the receipts' assignee_cents summaries -
+    enough for balance math, without reading items. Receipts without a
+    summary fall back to aggregating their items."""
+    items, missing = [], []
+    for r in receipts:
+        if r['assignee_cents'] is None:
+            missing.append(r['id'])
+            continue
+        for assigned_to, cents in r['assignee_cents'].items():
+            items.append(ItemRecord(None, r['id'], None, cents, assigned_to))
+    for rid, by_assignee in _receipt_assignee_cents(cursor, missing).items():
+        for assigned_to, cents in by_assignee.items():
+            items.append(ItemRecord(None, rid, None, cents, assigned_to))
+    return items
+
 
+def _receipt_assignee_cents(cursor, receipt_ids):
+    """{receipt_id: {assigned_to: cents}} summed in SQL, one row per
+    (receipt, assignee) instead of one per item."""
+    totals = {rid: {} for rid in receipt_ids}
+    if receipt_ids:
+        cursor.execute(
+            'SELECT receipt_id, assigned_to, SUM(ROUND(price * 100))::bigint AS cents '
+            'FROM items WHERE receipt_id = ANY(%s) GROUP BY receipt_id, assigned_to',
+            (list(receipt_ids),)
+        )
+        for row in cursor.fetchall():
+            totals[row['receipt_id']][row['assigned_to']] = row['cents']
+    return totals
+
+
+def receipt_totals(cents_by_assignee, user_ids):
+    """Shape one receipt's per-assignee cents into the totals shown in
+    history: per-member totals, shared total and overall total (members and
+    shared only, so items of removed members or 'excluded' don't count)."""
+    totals_by_user = {uid: cents_to_euros(cents_by_assignee.get(uid, 0)) for uid in user_ids}
+    shared_cents = cents_by_assignee.get('shared', 0)
+    total_cents = sum(cents_by_assignee.get(uid, 0) for uid in user_ids) + shared_cents
+    return {'totals_by_user': totals_by_user, 'shared_total': cents_to_euros(shared_cents),
+            'total': cents_to_euros(total_cents)}
+
+
+BATCH_MAX_OPS = 500
+
+
+def _parse_batch_ops(ops, valid_assignees):
+    """Validate a batch of item operations. Returns (ops, error). Ops apply in
+    order; the final state per item wins (a delete beats an earlier reassign).
+
+      {"op": "reassign", "item_id", "assigned_to"}
+      {"op": "delete",   "item_id"}
+      {"op": "add",      "receipt_id", "description", "price", "assigned_to"}
+      {"op": "redate",   "receipt_id", "bill_date": "YYYY-MM-DD"}
+    """
+    if not isinstance(ops, list) or not ops:
+        return None, 'No operations given.'
+    if len(ops) > BATCH_MAX_OPS:
+        return None, f'Too many operations (max {BATCH_MAX_OPS}).'
+    parsed = []
+    for n, op in enumerate(ops):
+        try:
+            kind = op['op']
+            if kind in ('reassign', 'delete'):
+                entry = {'op': kind, 'item_id': int(op['item_id'])}
+                if kind == 'reassign':
+                    entry['assigned_to'] = op['assigned_to']
+                    if entry['assigned_to'] not in valid_assignees and entry['assigned_to'] not in ('shared', 'excluded'):
+                        return None, f'Operation {n + 1}: invalid assignment.'
+            elif kind == 'add':
+                entry = {'op': kind, 'receipt_id': int(op['receipt_id']),
+                         'description': str(op['description']).strip(),
+                         'price_cents': to_cents(op['price']), 'assigned_to': op['assigned_to']}
+                if not entry['description']:
+                    return None, f'Operation {n + 1}: description is required.'
+                if entry['assigned_to'] not in valid_assignees and entry['assigned_to'] != 'shared':
+                    return None, f'Operation {n + 1}: invalid assignment.'
+            elif kind == 'redate':
+                entry = {'op': kind, 'receipt_id': int(op['receipt_id']),
+                         'bill_date': date.fromisoformat(op['bill_date'])}
+            else:
+                return None, f'Operation {n + 1}: unknown op {kind!r}.'
+        except (KeyError, TypeError, ValueError, ArithmeticError):
+            return None, f'Operation {n + 1} is malformed.'
+        parsed.append(entry)
+    return parsed, None
+
+
+@app.route('/history/batch', methods=['POST'])
+@login_required
+def history_batch():
+    """Apply many item edits (reassign, delete, add, re-date) in one
+    transaction. Each affected receipt's total is recomputed once. Returns only
+    the changed rows plus the new totals of the affected receipts."""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'Expected a JSON object with "ops".'}), 400
+    group_id = current_user.group_id
+    ops, error = _parse_batch_ops(body.get('ops'), roster_ids(group_id))
+    if error:
+        return jsonify({'error': error}), 400
+
+    db = get_db()
+    cursor = get_cursor()
+    try:
+        # Ownership of every referenced item and receipt, in two queries.
+        item_ids = list({op['item_id'] for op in ops if 'item_id' in op})
+        existing = {}
+        if item_ids:
+            # Locked (in id order, so batches can't deadlock): the deltas
+            # below are computed from these rows.
+            cursor.execute(
+                'SELECT i.id, i.receipt_id, i.assigned_to, ROUND(i.price * 100)::bigint AS price_cents '
+                'FROM items i JOIN receipts r ON r.id = i.receipt_id '
+                'WHERE i.id = ANY(%s) AND r.group_id = %s ORDER BY i.id FOR UPDATE OF i',
+                (item_ids, group_id)
+            )
+            existing = {row['id']: row for row in cursor.fetchall()}
+        receipt_of = {i: row['receipt_id'] for i, row in existing.items()}
+        receipt_ids = list({op['receipt_id'] for op in ops if 'receipt_id' in op})
+        if receipt_ids:
+            cursor.execute('SELECT id FROM receipts WHERE id = ANY(%s) AND group_id = %s',
+                           (receipt_ids, group_id))
+            if len(cursor.fetchall()) != len(receipt_ids):
+                return jsonify({'error': 'Receipt not found.'}), 404
+        if len(receipt_of) != len(item_ids):
+            return jsonify({'error': 'Item not found.'}), 404
+
+        # Collapse to the final state per item / receipt.
+        reassign, deleted, adds, redates = {}, set(), [], {}
+        for op in ops:
+            if op['op'] == 'reassign' and op['item_id'] not in deleted:
+                reassign[op['item_id']] = op['assigned_to']
+            elif op['op'] == 'delete':
+                deleted.add(op['item_id'])
+                reassign.pop(op['item_id'], None)
+            elif op['op'] == 'add':
+                adds.append(op)
+            elif op['op'] == 'redate':
+                redates[op['receipt_id']] = op['bill_date']
+
+        affected = ({receipt_of[i] for i in reassign} | {receipt_of[i] for i in deleted}
+                    | {op['receipt_id'] for op in adds} | set(redates))
+        for rid in affected:
+            _invalidate_snapshots(cursor, group_id, rid)
+
+        changed, deltas = [], []
+        for i, assigned_to in reassign.items():
+            old = existing[i]
+            deltas += [(old['receipt_id'], old['assigned_to'], -old['price_cents'], -1),
+                       (old['receipt_id'], assigned_to, old['price_cents'], 1)]
+        deltas += [(op['receipt_id'], op['assigned_to'], op['price_cents'], 1) for op in adds]
+        if reassign:
+            psycopg2.extras.execute_values(
+                cursor,
+                'UPDATE items SET assigned_to = v.assigned_to FROM (VALUES %s) AS v (id, assigned_to) '
+                'WHERE items.id = v.id',
+                list(reassign.items())
+            )
+            changed += [{'id': i, 'receipt_id': receipt_of[i], 'assigned_to': a} for i, a in reassign.items()]
+        if deleted:
+            cursor.execute('DELETE FROM items WHERE id = ANY(%s) RETURNING id', (list(deleted),))
+            for row in cursor.fetchall():
+                old = existing[row['id']]
+                deltas.append((old['receipt_id'], old['assigned_to'], -old['price_cents'], -1))
+        if adds:
+            rows = psycopg2.extras.execute_values(
+                cursor,
+                'INSERT INTO items (receipt_id, description, price, assigned_to) VALUES %s '
+                'RETURNING id, receipt_id, description, ROUND(price * 100)::bigint AS price_cents, assigned_to',
+                [(op['receipt_id'], op['description'], Decimal(op['price_cents']) / 100, op['assigned_to'])
+                 for op in adds],
+                fetch=True
+            )
+            changed += [{'id': r['id'], 'receipt_id': r['receipt_id'], 'description': r['description'],
+                         'price': cents_to_euros(r['price_cents']), 'assigned_to': r['assigned_to']}
+                        for r in rows]
+        if redates:
+            psycopg2.extras.execute_values(
+                cursor,
+                'UPDATE receipts SET bill_date = v.bill_date FROM (VALUES %s) AS v (id, bill_date) '
+                'WHERE receipts.id = v.id',
+                list(redates.items()),
+                template='(%s, %s::date)'
+            )
+            for rid in redates:  # the receipt's new month is stale too
+                _invalidate_snapshots(cursor, group_id, rid)
+
+        _apply_summary_deltas(cursor, deltas)
+        user_ids = [m['id'] for m in get_roster(group_id)]
+        cursor.execute('SELECT id, assignee_cents FROM receipts WHERE id = ANY(%s)', (list(affected),))
+        cents_by_receipt = {row['id']: row['assignee_cents'] for row in cursor.fetchall()}
+        # Receipts not backfilled yet (e.g. only re-dated) have no summary:
+        # sum their items, as _summary_items does.
+        cents_by_receipt.update(_receipt_assignee_cents(
+            cursor, [rid for rid, cents in cents_by_receipt.items() if cents is None]))
+        receipts = [{'id': rid, **receipt_totals(cents, user_ids)} for rid, cents in cents_by_receipt.items()]
+        for r in receipts:
+            if r['id'] in redates:
+                r['date'] = redates[r['id']].isoformat()
+        db.commit()
+    except Exception:
+        db.rollback()
+        logging.exception("Error applying history batch")
+        return jsonify({'error': 'Could not save your changes. Please try again.'}), 500
 
-def _item_receipt_in_group(cursor, item_id, group_id):
-    """Return the item's receipt_id if it belongs to this household, else None."""
+    return jsonify({'items': changed, 'deleted': sorted(deleted), 'receipts': receipts})
+
+
+def _item_in_group(cursor, item_id, group_id):
+    """Return the item (receipt_id, assigned_to, price_cents) if it belongs to
+    this household, else None. The row stays locked until the transaction
+    ends, so a concurrent edit waits and then sees the changed item."""
     cursor.execute(
-        'SELECT i.receipt_id FROM items i JOIN receipts r ON r.id = i.receipt_id '
-        'WHERE i.id = %s AND r.group_id = %s',
+        'SELECT i.receipt_id, i.assigned_to, ROUND(i.price * 100)::bigint AS price_cents '
+        'FROM items i JOIN receipts r ON r.id = i.receipt_id '
+        'WHERE i.id = %s AND r.group_id = %s FOR UPDATE OF i',
         (item_id, group_id)
     )
-    row = cursor.fetchone()
-    return row['receipt_id'] if row else None
+    return cursor.fetchone()
 
 
 @app.route('/remove_item', methods=['POST'])
@@ -1345,12 +3885,21 @@ def remove_item():
         item_id = request.form.get('item_id')
         db = get_db()
         cursor = get_cursor()
-        receipt_id = _item_receipt_in_group(cursor, item_id, current_user.group_id)
-        if receipt_id is None:
+        # The summary delta comes from the row this statement deleted: a
+        # second, concurrent removal of the same item deletes nothing.
+        cursor.execute(
+            'DELETE FROM items i USING receipts r '
+            'WHERE i.id = %s AND r.id = i.receipt_id AND r.group_id = %s '
+            'RETURNING i.receipt_id, i.assigned_to, ROUND(i.price * 100)::bigint AS price_cents',
+            (item_id, current_user.group_id)
+        )
+        item = cursor.fetchone()
+        if item is None:
             flash('Item not found.')
             return redirect(url_for('history'))
-        cursor.execute('DELETE FROM items WHERE id = %s', (item_id,))
-        _recompute_receipt_total(cursor, receipt_id)
+        receipt_id = item['receipt_id']
+        _apply_summary_deltas(cursor, [(receipt_id, item['assigned_to'], -item['price_cents'], -1)])
+        _invalidate_snapshots(cursor, current_user.group_id, receipt_id)
         db.commit()
         flash('Item removed.')
     except Exception as e:
@@ -1371,17 +3920,19 @@ def update_item():
         assigned_to = request.form.get('assigned_to')
         db = get_db()
         cursor = get_cursor()
-        receipt_id = _item_receipt_in_group(cursor, item_id, current_user.group_id)
-        if receipt_id is None:
+        item = _item_in_group(cursor, item_id, current_user.group_id)
+        if item is None:
             flash('Item not found.')
             return redirect(url_for('history'))
-        cursor.execute('SELECT id FROM users WHERE group_id = %s', (current_user.group_id,))
-        valid = {row['id'] for row in cursor.fetchall()}
+        receipt_id = item['receipt_id']
+        valid = roster_ids(current_user.group_id)
         if assigned_to not in valid and assigned_to not in ('shared', 'excluded'):
             flash('Invalid assignment.')
             return redirect(url_for('history'))
         cursor.execute('UPDATE items SET assigned_to = %s WHERE id = %s', (assigned_to, item_id))
-        _recompute_receipt_total(cursor, receipt_id)
+        _apply_summary_deltas(cursor, [(receipt_id, item['assigned_to'], -item['price_cents'], -1),
+                                       (receipt_id, assigned_to, item['price_cents'], 1)])
+        _invalidate_snapshots(cursor, current_user.group_id, receipt_id)
         db.commit()
         flash('Item updated.')
     except Exception as e:
@@ -1409,8 +3960,7 @@ def manual_payment():
             bill_date = payment_date_str if payment_date_str else None
 
             # Payer and payee must belong to this household ('shared' allowed for payee)
-            cursor.execute('SELECT id FROM users WHERE group_id = %s', (current_user.group_id,))
-            valid_user_ids = {row['id'] for row in cursor.fetchall()}
+            valid_user_ids = roster_ids(current_user.group_id)
             if payer not in valid_user_ids or (payee != 'shared' and payee not in valid_user_ids):
                 flash('Invalid payer or payee.')
                 return redirect(url_for('manual_payment'))
@@ -1427,6 +3977,8 @@ def manual_payment():
                 'INSERT INTO items (receipt_id, description, price, assigned_to) VALUES (%s, %s, %s, %s)',
                 (receipt_id, description, amount, payee)
             )
+            _apply_summary_deltas(cursor, [(receipt_id, payee, to_cents(amount), 1)])
+            _invalidate_snapshots(cursor, current_user.group_id, receipt_id)
 
             db.commit()
             flash('Manual payment recorded successfully!')
@@ -1455,6 +4007,7 @@ def remove_receipt():
             return redirect(url_for('history'))
 
         # Delete receipt and items
+        _invalidate_snapshots(cursor, current_user.group_id, receipt_id)
         cursor.execute('DELETE FROM items WHERE receipt_id = %s', (receipt_id,))
         cursor.execute('DELETE FROM receipts WHERE id = %s', (receipt_id,))
         db.commit()
@@ -1467,21 +4020,413 @@ def remove_receipt():
 
     return redirect(url_for('history'))
 
+# ── Export ───────────────────────────────────────────────────────────────────
+# /export.csv and /export.ndjson stream the whole history (receipts and their
+# items) from a server-side cursor in fetchmany batches, so memory stays flat
+# however long the history is. Rows come ordered by receipt then item.
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '2000'))
+EXPORT_COLUMNS = ('receipt_id', 'bill_date', 'upload_date', 'payer', 'filename', 'receipt_total',
+                  'item_id', 'description', 'price', 'assigned_to')
+
+_EXPORT_SQL = (
+    'SELECT r.id AS receipt_id, r.bill_date, r.upload_date, r.payer_id, r.filename, '
+    'ROUND(r.total * 100)::bigint AS total_cents, i.id AS item_id, i.description, '
+    'ROUND(i.price * 100)::bigint AS price_cents, i.assigned_to '
+    'FROM receipts r LEFT JOIN items i ON i.receipt_id = r.id '
+    'WHERE r.group_id = %s ORDER BY r.id, i.id'
+)
+
+
+def format_cents(cents):
+    """Exact decimal string for integer cents (no float round-trip)."""
+    if cents is None:
+        return ''
+    sign = '-' if cents < 0 else ''
+    euros, rest = divmod(abs(cents), 100)
+    return f'{sign}{euros}.{rest:02d}'
+
+
+def _iso(value):
+    return value.isoformat() if value else ''
+
+
+def iter_export_rows(cursor, batch_size=EXPORT_BATCH_SIZE):
+    """Yield rows of an executed export query batch by batch."""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def export_csv_lines(rows, names):
+    """CSV text, one line per item (receipts without items get one line with
+    empty item columns). names maps member ids to display names."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow((
+            row['receipt_id'], _iso(row['bill_date']), _iso(row['upload_date']),
+            names.get(row['payer_id'], row['payer_id']), row['filename'],
+            format_cents(row['total_cents']), row['item_id'] or '', row['description'] or '',
+            format_cents(row['price_cents']),
+            names.get(row['assigned_to'], row['assigned_to'] or ''),
+        ))
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+def export_ndjson_lines(rows, names):
+    """One JSON object per receipt with its items nested. Relies on rows being
+    ordered by receipt, so only the current receipt is held in memory."""
+    receipt = None
+    for row in rows:
+        if receipt is None or receipt['id'] != row['receipt_id']:
+            if receipt is not None:
+                yield json.dumps(receipt) + '\n'
+            receipt = {
+                'id': row['receipt_id'],
+                'bill_date': _iso(row['bill_date']) or None,
+                'upload_date': _iso(row['upload_date']) or None,
+                'payer': names.get(row['payer_id'], row['payer_id']),
+                'filename': row['filename'],
+                'total': format_cents(row['total_cents']),
+                'items': [],
+            }
+        if row['item_id'] is not None:
+            receipt['items'].append({
+                'id': row['item_id'],
+                'description': row['description'],
+                'price': format_cents(row['price_cents']),
+                'assigned_to': names.get(row['assigned_to'], row['assigned_to']),
+            })
+    if receipt is not None:
+        yield json.dumps(receipt) + '\n'
+
+
+def _stream_export(group_id, to_lines):
+    """Run the export query on its own connection with a named (server-side)
+    cursor and feed the rows to to_lines(rows, names)."""
+    names = {m['id']: m['name'] for m in get_roster(group_id)}
+    names.update(shared='Shared', excluded='Excluded', both='Both')
+
+    def generate():
+        conn = connect_db()
+        try:
+            cursor = conn.cursor(name='history_export', cursor_factory=TimedCursor)
+            cursor.itersize = EXPORT_BATCH_SIZE
+            cursor.execute(_EXPORT_SQL, (group_id,))
+            yield from to_lines(iter_export_rows(cursor), names)
+            cursor.close()
+        finally:
+            conn.rollback()
+            conn.close()
+
+    return stream_with_context(generate())
+
+
+@app.route('/export.csv')
+@login_required
+def export_csv():
+    filename = f'receipts-{date.today().isoformat()}.csv'
+    return Response(_stream_export(current_user.group_id, export_csv_lines), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+@app.route('/export.ndjson')
+@login_required
+def export_ndjson():
+    filename = f'receipts-{date.today().isoformat()}.ndjson'
+    return Response(_stream_export(current_user.group_id, export_ndjson_lines), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+# ── Import ───────────────────────────────────────────────────────────────────
+# Bulk ingestion of the export formats (spreadsheet migrations, restores).
+# Rows are validated against the roster first - all or nothing - then staged
+# with COPY into temp tables and inserted set-based in one transaction. Receipt
+# totals and summaries are recomputed from the imported items.
+
+IMPORT_MAX_ERRORS = 20
+IMPORT_DEFAULT_FILENAME = 'Import'
+IMPORT_MAX_PRICE_CENTS = 100_000_000  # EUR 1,000,000 either way (discounts are negative)
+
+
+def _import_resolver(members):
+    """Map a payer/assignee cell (member id or name, 'shared', 'excluded';
+    names case-insensitive) to the stored value, or None if unknown."""
+    lookup = {'shared': 'shared', 'excluded': 'excluded'}
+    for m in members:
+        if m['name']:
+            lookup[m['name'].strip().lower()] = m['id']
+    ids = {m['id'] for m in members}
+
+    def resolve(value, allow_special=True):
+        value = str(value or '').strip()
+        if value in ids:
+            return value
+        resolved = lookup.get(value.lower())
+        if resolved in ('shared', 'excluded') and not allow_special:
+            return None
+        return resolved
+
+    return resolve
+
+
+def _parse_import_date(value, kind):
+    value = (value or '').strip()
+    if not value:
+        return None
+    if kind == 'date':
+        return date.fromisoformat(value[:10])
+    return datetime.fromisoformat(value)
+
+
+def _import_records(stream, fmt):
+    """(line number, receipt key, receipt fields, item fields or None) per
+    item row of a CSV export (one line per item) or NDJSON export (one
+    receipt per line with nested items). A line that can't be read yields
+    (line number, None, error message, None)."""
+    if fmt == 'csv':
+        for line_no, row in enumerate(csv.DictReader(stream), start=2):
+            item = None
+            if (row.get('description') or '').strip() or (row.get('price') or '').strip():
+                item = {'description': row.get('description'), 'price': row.get('price'),
+                        'assigned_to': row.get('assigned_to')}
+            yield line_no, row.get('receipt_id') or f'line-{line_no}', row, item
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                receipt = json.loads(line)
+            except ValueError:
+                yield line_no, None, 'not valid JSON', None
+                continue
+            if not isinstance(receipt, dict):
+                yield line_no, None, 'expected a JSON object (one receipt per line)', None
+                continue
+            items = receipt.get('items') or []
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                yield line_no, None, "'items' must be a list of objects", None
+                continue
+            key = receipt.get('id') or f'line-{line_no}'
+            if not items:
+                yield line_no, key, receipt, None
+            for item in items:
+                yield line_no, key, receipt, item
+    else:
+        raise ValueError(f'Unknown import format: {fmt}')
+
+
+def parse_import(stream, fmt, members):
+    """Validate an import file. Returns (receipt_rows, item_rows, errors):
+    receipt_rows are (key, payer_id, filename, bill_date, upload_date) and
+    item_rows (key, description, price, assigned_to) with the price as an
+    exact decimal string, keyed by a dense receipt number. Rows of one receipt
+    share its source receipt id (or come from one NDJSON line)."""
+    resolve = _import_resolver(members)
+    keys, receipt_rows, item_rows, errors = {}, [], [], []
+
+    def error(line_no, message):
+        errors.append(f'Line {line_no}: {message}')
+
+    for line_no, source_key, receipt, item in _import_records(stream, fmt):
+        if len(errors) >= IMPORT_MAX_ERRORS:
+            break
+        if source_key is None:
+            error(line_no, receipt)
+            continue
+        key = keys.get(source_key)
+        if key is None:
+            payer = resolve(receipt.get('payer'), allow_special=False)
+            if payer is None and str(receipt.get('payer') or '').strip().lower() == 'both':
+                # Legacy joint payments export as 'Both'; receipts.payer_id
+                # must be a member, so there is nothing to store it as.
+                error(line_no, "payer 'Both' (a joint payment) can't be imported; set the member who paid")
+                continue
+            if payer is None:
+                error(line_no, f"unknown payer '{receipt.get('payer')}'")
+                continue
+            try:
+                bill_date = _parse_import_date(receipt.get('bill_date'), 'date')
+                upload_date = _parse_import_date(receipt.get('upload_date'), 'datetime')
+            except ValueError:
+                error(line_no, 'invalid date')
+                continue
+            key = keys[source_key] = len(receipt_rows) + 1
+            receipt_rows.append((key, payer, (receipt.get('filename') or '').strip() or IMPORT_DEFAULT_FILENAME,
+                                 bill_date, upload_date))
+        if item is None:
+            continue
+        description = str(item.get('description') or '').strip()
+        assigned_to = resolve(item.get('assigned_to') or 'shared')
+        try:
+            cents = to_cents(str(item.get('price')).strip())
+        except (ArithmeticError, ValueError):   # not a number, NaN, Infinity
+            cents = None
+        if cents is not None and abs(cents) > IMPORT_MAX_PRICE_CENTS:
+            cents = None
+        if not description:
+            error(line_no, 'item without a description')
+        elif cents is None:
+            error(line_no, f"invalid price '{item.get('price')}'")
+        elif assigned_to is None:
+            error(line_no, f"unknown assignee '{item.get('assigned_to')}'")
+        else:
+            item_rows.append((key, description, format_cents(cents), assigned_to))
+    return receipt_rows, item_rows, errors
+
+
+def _copy_value(value):
+    """One field in COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, date):  # datetimes too
+        return value.isoformat()
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def copy_buffer(rows):
+    """StringIO of rows in COPY text format, for cursor.copy_expert."""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write('\t'.join(map(_copy_value, row)))
+        buf.write('\n')
+    buf.seek(0)
+    return buf
+
+
+def import_receipts(cursor, group_id, receipt_rows, item_rows, on_progress=None):
+    """Insert parsed rows (see parse_import) into the group in the current
+    transaction. Returns the new receipt ids."""
+    progress = on_progress or (lambda stage, count: None)
+    cursor.execute(
+        'CREATE TEMP TABLE import_receipts (key INTEGER PRIMARY KEY, id INTEGER, payer_id TEXT, '
+        'filename TEXT, bill_date DATE, upload_date TIMESTAMP) ON COMMIT DROP'
+    )
+    cursor.execute(
+        'CREATE TEMP TABLE import_items (key INTEGER, description TEXT, price NUMERIC, '
+        'assigned_to TEXT) ON COMMIT DROP'
+    )
+    cursor.copy_expert('COPY import_receipts (key, payer_id, filename, bill_date, upload_date) FROM STDIN',
+                       copy_buffer(receipt_rows))
+    progress('staged receipts', len(receipt_rows))
+    cursor.copy_expert('COPY import_items (key, description, price, assigned_to) FROM STDIN',
+                       copy_buffer(item_rows))
+    progress('staged items', len(item_rows))
+
+    # Take real receipt ids from the sequence up front so items can be joined
+    # to them by key, instead of inserting receipts one at a time.
+    cursor.execute("UPDATE import_receipts SET id = nextval(pg_get_serial_sequence('receipts', 'id'))")
+    cursor.execute(
+        'INSERT INTO receipts (id, group_id, payer_id, filename, bill_date, upload_date) '
+        'SELECT id, %s, payer_id, filename, bill_date, COALESCE(upload_date, CURRENT_TIMESTAMP) '
+        'FROM import_receipts ORDER BY key',
+        (group_id,)
+    )
+    cursor.execute(
+        'INSERT INTO items (receipt_id, description, price, assigned_to) '
+        'SELECT r.id, i.description, i.price, i.assigned_to '
+        'FROM import_items i JOIN import_receipts r ON r.key = i.key'
+    )
+    progress('inserted', len(item_rows))
+
+    cursor.execute('SELECT id FROM import_receipts')
+    receipt_ids = [row['id'] for row in cursor.fetchall()]
+    _refresh_receipt_summaries(cursor, receipt_ids)
+    _lock_group_snapshots(cursor, group_id)
+    cursor.execute(
+        f'DELETE FROM balance_snapshot_months WHERE group_id = %s AND month IN '
+        f'(SELECT DISTINCT {RECEIPT_MONTH_SQL} FROM receipts WHERE id = ANY(%s))',
+        (group_id, receipt_ids)
+    )
+    progress('summarised', len(receipt_ids))
+    return receipt_ids
+
+
+def _import_format(filename):
+    ext = os.path.splitext(filename or '')[1].lower()
+    return {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}.get(ext)
+
+
+@app.cli.command('import-receipts')
+@click.argument('group_id', type=int)
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+def import_receipts_command(group_id, path, fmt):
+    """Bulk-import receipts from a CSV/NDJSON export into a household."""
+    fmt = fmt or _import_format(path)
+    if fmt is None:
+        raise click.UsageError('Cannot tell the format from the extension; pass --format.')
+    conn = connect_db()
+    try:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute('SELECT id, name FROM users WHERE group_id = %s', (group_id,))
+        members = cur.fetchall()
+        started = time.perf_counter()
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            receipt_rows, item_rows, errors = parse_import(f, fmt, members)
+        print(f"Parsed {len(receipt_rows)} receipt(s), {len(item_rows)} item(s) "
+              f"in {time.perf_counter() - started:.1f}s.")
+        if errors:
+            print('\n'.join(errors))
+            raise SystemExit(1)
+        import_receipts(cur, group_id, receipt_rows, item_rows,
+                        on_progress=lambda stage, count: print(
+                            f"  {stage}: {count} ({time.perf_counter() - started:.1f}s)"))
+        conn.commit()
+        print("Done.")
+    finally:
+        conn.close()
+
+
+@app.route('/import', methods=['POST'])
+@login_required
+def import_history():
+    upload = request.files.get('file')
+    fmt = _import_format(upload.filename if upload else None)
+    if fmt is None:
+        flash('Choose a .csv or .ndjson export to import.')
+        return redirect(url_for('history'))
+    db = get_db()
+    try:
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        receipt_rows, item_rows, errors = parse_import(stream, fmt, get_roster(current_user.group_id))
+        if errors:
+            flash('Nothing imported. ' + '; '.join(errors[:5]) + (' …' if len(errors) > 5 else ''))
+            return redirect(url_for('history'))
+        cursor = get_cursor()
+        receipt_ids = import_receipts(cursor, current_user.group_id, receipt_rows, item_rows,
+                                      on_progress=lambda stage, count: logging.info(
+                                          f"Import for group {current_user.group_id}: {stage} {count}"))
+        db.commit()
+        flash(f'Imported {len(receipt_ids)} receipt(s) with {len(item_rows)} item(s).')
+    except UnicodeDecodeError:
+        flash('The file is not UTF-8 text.')
+    except Exception:
+        db.rollback()
+        logging.exception("Error importing receipts")
+        flash('Could not import the file. Please try again.')
+    return redirect(url_for('history'))
+
+
 def _render_group(new_link=None, new_link_name=None):
     """Render the household page. Members without an email/auth are flagged as
     needing login setup. new_link (if given) shows a freshly generated setup URL."""
     cursor = get_cursor()
     cursor.execute('SELECT id, name, invite_code FROM groups WHERE id = %s', (current_user.group_id,))
     grp = cursor.fetchone()
-    cursor.execute(
-        'SELECT id, name, email, auth_uid FROM users WHERE group_id = %s ORDER BY name',
-        (current_user.group_id,)
-    )
     members = [{
-        'id': row['id'],
-        'name': row['name'],
-        'needs_setup': row['email'] is None and row['auth_uid'] is None,
-    } for row in cursor.fetchall()]
+        'id': m['id'],
+        'name': m['name'],
+        'needs_setup': m['email'] is None and m['auth_uid'] is None,
+    } for m in get_roster(current_user.group_id)]
     return render_template('group.html', group=grp, members=members,
                            new_link=new_link, new_link_name=new_link_name)
 
@@ -1529,7 +4474,7 @@ def setup_account(token):
     db = get_db()
     cursor = get_cursor()
     cursor.execute(
-        "SELECT t.user_id, u.name, u.email, u.auth_uid FROM account_setup_tokens t "
+        "SELECT t.user_id, u.name, u.email, u.auth_uid, u.group_id FROM account_setup_tokens t "
         "JOIN users u ON u.id = t.user_id "
         "WHERE t.token = %s AND t.created_at > NOW() - (%s * INTERVAL '1 day')",
         (token, SETUP_TOKEN_MAX_AGE_DAYS)
@@ -1575,6 +4520,7 @@ def setup_account(token):
         # Attach the new login to the EXISTING user row (keeps id, name, history).
         cursor.execute('UPDATE users SET email = %s, auth_uid = %s WHERE id = %s',
                        (email, user.get('id'), row['user_id']))
+        bump_roster_version(cursor, row['group_id'])
         cursor.execute('DELETE FROM account_setup_tokens WHERE token = %s', (token,))
         db.commit()
         flash(f'Account set up! Confirm your email, then log in with username "{row["user_id"]}".', 'success')
@@ -1621,10 +4567,14 @@ def remove_member():
     cursor.execute(
         'UPDATE items SET assigned_to = %s '
         'WHERE assigned_to = %s AND receipt_id IN '
-        '(SELECT id FROM receipts WHERE group_id = %s)',
+        '(SELECT id FROM receipts WHERE group_id = %s) RETURNING receipt_id',
         ('shared', user_id, current_user.group_id)
     )
+    _refresh_receipt_summaries(cursor, {row['receipt_id'] for row in cursor.fetchall()})
     cursor.execute('UPDATE users SET group_id = NULL WHERE id = %s', (user_id,))
+    bump_roster_version(cursor, current_user.group_id)
+    # Items moved to shared and the split size changed: every month is stale.
+    _invalidate_snapshots(cursor, current_user.group_id)
     db.commit()
     flash('Member removed and their items reassigned to shared.')
     return redirect(url_for('group_page'))
@@ -1634,13 +4584,17 @@ def remove_member():
 @login_required
 def logout():
     logout_user()
+    session.pop('identity', None)
     flash('You have been logged out.', 'success')
     return redirect(url_for("login"))
 
 
-# Call init_db() when the app starts
-with app.app_context():
-     init_db()
+# Call init_db() when the app starts (OCR processes only run the extraction
+# code and skip it).
+if multiprocessing.parent_process() is None:
+    with app.app_context():
+        init_db()
+    start_snapshot_compactor()
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,313 @@
+"""Synthetic households and receipt corpora for the benchmarks.
+
+Everything is seeded and deterministic, and shaped like what the app reads
+or receives:
+
+  household()       members with join dates spread over the period
+  receipt_corpus()  years of receipts + items (Zipf-popular catalogue,
+                    lognormal prices, per-product habits, monthly settle-ups)
+  receipt_text()    OCR-style text of one receipt, for parse_bill_text
+  receipt_image()   a phone-photo-like PIL image of that text
+  picnic_pages()    Picnic-grid word lists (see tests/test_picnic.py)
+  picnic_pdf()      the same grid as a PDF with a real text layer
+  seed_database()   load a household + corpus into the app's tables
+"""
+import io
+import random
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageDraw, ImageFilter
+
+BRANDS = ['Ja!', 'Gut&Guenstig', 'Bio', 'Milbona', 'K-Classic', 'Rewe', 'Alnatura', 'Barilla',
+          'Dr.Oetker', 'Weihenstephan', 'Lindt', 'Haribo', 'Knorr', 'Kerrygold', 'Andechser']
+PRODUCTS = ['Milch', 'Butter', 'Joghurt', 'Gouda', 'Mozzarella', 'Eier', 'Vollkornbrot', 'Toast',
+            'Bananen', 'Aepfel', 'Tomaten', 'Gurke', 'Paprika', 'Zwiebeln', 'Kartoffeln', 'Spaghetti',
+            'Reis', 'Haferflocken', 'Muesli', 'Kaffee', 'Tee', 'Orangensaft', 'Mineralwasser', 'Bier',
+            'Schokolade', 'Chips', 'Hackfleisch', 'Haehnchenbrust', 'Lachs', 'Tofu', 'Hummus',
+            'Spuelmittel', 'Toilettenpapier', 'Zahnpasta', 'Shampoo', 'Waschmittel']
+VARIANTS = ['', '', '1L', '500g', '250g', 'Bio', 'laktosefrei', 'XXL', '6x1,5L', 'Classic']
+
+# How each product tends to be assigned: most groceries are shared, some
+# are one member's, a few get excluded (bought for someone outside).
+HABITS = (('shared', 0.6), ('member', 0.32), ('excluded', 0.08))
+
+START = datetime(2023, 1, 1)
+
+
+def catalogue(size=400, seed=1):
+    """size distinct products [(description, price_cents)], most popular first."""
+    rng = random.Random(seed)
+    names, seen = [], set()
+    while len(names) < size:
+        name = ' '.join(p for p in (rng.choice(BRANDS), rng.choice(PRODUCTS), rng.choice(VARIANTS)) if p)
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return [(name, max(19, min(4999, round(rng.lognormvariate(0.8, 0.7) * 100)))) for name in names]
+
+
+def household(n_members, years=3, seed=1):
+    """Members [{id, name, joined_at}]. Two founders predate the data (the
+    app's '2000-01-01' default); the rest join at random points in it."""
+    rng = random.Random(seed)
+    days = 365 * years
+    users = []
+    for k in range(n_members):
+        joined = datetime(2000, 1, 1) if k < 2 else START + timedelta(days=rng.randrange(days))
+        users.append({'id': f'bench{k}', 'name': f'Member {k:02d}', 'joined_at': joined})
+    return users
+
+
+def receipt_corpus(users, years=3, receipts_per_week=3, items_mean=14, catalogue_size=400, seed=1):
+    """(receipts, items) shaped for compute_balances: receipts {id, payer_id,
+    filename, receipt_date, is_settlement}, items {id, receipt_id,
+    description, price_cents, assigned_to}. Product popularity is Zipf-like,
+    each product has a habitual assignee that is followed ~85% of the time,
+    and the biggest debtor settles up with a payback receipt every month."""
+    rng = random.Random(seed)
+    products = catalogue(catalogue_size, seed)
+    weights = [1 / (rank + 1) ** 1.07 for rank in range(len(products))]
+    habits = {}
+    for name, _ in products:
+        kind = rng.choices([h for h, _ in HABITS], [w for _, w in HABITS])[0]
+        habits[name] = rng.choice(users)['id'] if kind == 'member' else kind
+
+    receipts, items = [], []
+    balance = {u['id']: 0 for u in users}
+    n_receipts = int(years * 52 * receipts_per_week)
+    span_seconds = years * 365 * 86400
+    month = None
+    for rid in range(1, n_receipts + 1):
+        when = START + timedelta(seconds=span_seconds * rid // (n_receipts + 1))
+        active = [u['id'] for u in users if u['joined_at'] <= when]
+
+        if month is not None and when.month != month:
+            debtor = min(active, key=balance.get)
+            creditor = max(active, key=balance.get)
+            owed = min(-balance[debtor], balance[creditor])
+            if owed > 0:
+                receipts.append({'id': rid, 'payer_id': debtor, 'filename': 'Settlement',
+                                 'receipt_date': when, 'is_settlement': True})
+                items.append({'id': len(items) + 1, 'receipt_id': rid, 'description': 'Settlement',
+                              'price_cents': owed, 'assigned_to': creditor})
+                balance[debtor] += owed
+                balance[creditor] -= owed
+                month = when.month
+                continue
+        month = when.month
+
+        payer = rng.choice(active)
+        receipts.append({'id': rid, 'payer_id': payer, 'filename': f'{when:%Y-%m-%d}_receipt_{rid}.jpg',
+                         'receipt_date': when, 'is_settlement': False})
+        count = max(1, round(rng.gauss(items_mean, items_mean / 3)))
+        for name, base in rng.choices(products, weights, k=count):
+            habit = habits[name]
+            assigned = habit if rng.random() < 0.85 else rng.choice(active + ['shared'])
+            if assigned not in ('shared', 'excluded') and assigned not in active:
+                assigned = 'shared'
+            cents = max(1, round(base * rng.uniform(0.9, 1.15)))
+            items.append({'id': len(items) + 1, 'receipt_id': rid, 'description': name,
+                          'price_cents': cents, 'assigned_to': assigned})
+            if assigned != 'excluded':
+                balance[payer] += cents
+                if assigned == 'shared':
+                    for uid in active:
+                        balance[uid] -= cents // len(active)
+                else:
+                    balance[assigned] -= cents
+    return receipts, items
+
+
+def learned_memory(items):
+    """{match_key: assigned_to} as get_assignment_memory() would learn it
+    (most frequent assignment per normalized description)."""
+    from app import _match_key
+    counts = {}
+    for item in items:
+        key = _match_key(item['description'])
+        by_assignee = counts.setdefault(key, {})
+        by_assignee[item['assigned_to']] = by_assignee.get(item['assigned_to'], 0) + 1
+    return {key: max(c.items(), key=lambda kv: kv[1])[0] for key, c in counts.items()}
+
+
+def ocr_noise(text, rng, rate=0.03):
+    """Typical Tesseract damage: dropped/doubled spaces, I/l/1 and O/0 swaps."""
+    swaps = {'l': '1', 'I': 'l', 'O': '0', 'o': '0', 'e': 'c', ' ': '  '}
+    return ''.join(swaps.get(ch, ch) if rng.random() < rate else ch for ch in text)
+
+
+def receipt_text(receipt_items, seed=1, noise=0.03):
+    """OCR-style text of one receipt: store header, one line per item with a
+    comma decimal and a VAT class, then the totals/payment block."""
+    rng = random.Random(seed)
+    lines = ['REWE Markt GmbH', 'Hauptstr. 12, 80331 Muenchen', 'UID Nr.: DE812706034', '', 'EUR']
+    for item in receipt_items:
+        cents = item['price_cents']
+        name = ocr_noise(item['description'].upper(), rng, noise)
+        lines.append(f"{name:<28} {cents // 100},{cents % 100:02d} {rng.choice('AB')}")
+        if rng.random() < 0.05:
+            lines.append(f"   2 Stk x {cents // 200},{cents // 2 % 100:02d}")
+    total = sum(i['price_cents'] for i in receipt_items)
+    lines += ['-' * 40, f"SUMME EUR {total // 100},{total % 100:02d}", '',
+              f"Geg. EC-Cash EUR {total // 100},{total % 100:02d}", 'Steuer % Netto Steuer Brutto',
+              'A= 19,0% 1,23 0,23 1,46', 'Datum: 01.02.2025 Uhrzeit: 18:03:12']
+    return '\n'.join(lines)
+
+
+def receipt_image(text, width=1240, tilt=2.5, seed=1):
+    """A photo-like render of receipt text: off-white paper, slight tilt,
+    uneven lighting and blur - enough for preprocess_image to do its full work."""
+    rng = random.Random(seed)
+    lines = text.split('\n')
+    line_height = 34
+    img = Image.new('L', (width, 120 + line_height * len(lines)), 236)
+    draw = ImageDraw.Draw(img)
+    for k, line in enumerate(lines):
+        draw.text((90, 60 + k * line_height), line, fill=30)
+    img = img.resize((width * 2, img.height * 2)).rotate(tilt, fillcolor=90, expand=True)
+    shade = Image.linear_gradient('L').resize(img.size).point(lambda v: 200 + v // 5)
+    img = Image.composite(img, shade, Image.new('L', img.size, 180))
+    noise = Image.effect_noise(img.size, 18)
+    img = Image.blend(img, noise, 0.08).filter(ImageFilter.GaussianBlur(rng.uniform(0.6, 1.2)))
+    return img.convert('RGB')
+
+
+# ── Picnic grid ──────────────────────────────────────────────────────────────
+# Same coordinates as tests/test_picnic.py: quantity at x=193, name at x=238
+# (size 8, second line 13px below), euros size 14 at x≈390, cents a size-8
+# superscript at x=398 (+4px) with the decimal point orphaned below, and a
+# discounted item's final price 24px under the struck original.
+
+PICNIC_PAGE_HEIGHT = 842
+PICNIC_ITEM_PITCH = 50
+PICNIC_ITEMS_PER_PAGE = 14
+PICNIC_NAME_WIDTH = 140
+
+
+def _word(text, x0, top, size):
+    return {'text': text, 'x0': x0, 'top': top, 'size': size}
+
+
+def _text_width(text, size):
+    return len(text) * size * 0.55
+
+
+def _name_rows(description):
+    rows, row, width = [], [], 0
+    for word in description.split():
+        w = _text_width(word, 8) + 3
+        if row and width + w > PICNIC_NAME_WIDTH and len(rows) < 1:
+            rows.append(row)
+            row, width = [], 0
+        row.append(word)
+        width += w
+    return rows + [row]
+
+
+def _price_words(cents, top):
+    euros = str(cents // 100)
+    return [_word(euros, 398 - 8 * len(euros), top, 14),
+            _word(f'{cents % 100:02d}', 398, top + 4, 8),
+            _word('.', 398, top + 10, 8)]
+
+
+def picnic_pages(receipt_items, discount_every=7, items_per_page=PICNIC_ITEMS_PER_PAGE):
+    """Pages of pdfplumber-style words for a Picnic receipt of these items,
+    plus the item list parse_picnic_words should return for them. A large
+    items_per_page makes one long page (words only; too tall for picnic_pdf)."""
+    pages, expected = [], []
+    words = [_word('Dein', 60, 40, 14), _word('Bon', 95, 40, 14)]
+    for k, item in enumerate(receipt_items):
+        slot = k % items_per_page
+        if k and slot == 0:
+            pages.append(words)
+            words = []
+        top = 100 + slot * PICNIC_ITEM_PITCH
+        rows = _name_rows(item['description'])
+        name_top = top - 10 if len(rows) > 1 else top  # a wrapped name straddles its price
+        for r, row in enumerate(rows):
+            x = 238
+            for token in row:
+                words.append(_word(token, x, name_top + 13 * r, 8))
+                x += _text_width(token, 8) + 3
+        words.append(_word('1', 193, top + 4, 8))
+        words.append(_word('Stueck', 238, name_top + 13 * len(rows) - 3, 6))
+        final = item['price_cents']
+        words += _price_words(final, top)
+        if discount_every and k % discount_every == discount_every - 1:
+            final = max(1, final * 3 // 4)
+            words += _price_words(final, top + 24)
+            words += [_word('25%', 300, top + 30, 6), _word('Rabatt', 320, top + 30, 6)]
+        expected.append({'description': item['description'], 'price': final / 100, 'is_valid': True})
+
+    top = 100 + (len(receipt_items) % items_per_page or items_per_page) * PICNIC_ITEM_PITCH
+    total = sum(round(i['price'] * 100) for i in expected)
+    words += [_word('Pfand', 210, top, 8), *_price_words(75, top),
+              _word('Zwischensumme', 262, top + 20, 8), *_price_words(total, top + 20)]
+    pages.append(words)
+    return pages, expected
+
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+# Helvetica's ascent (pdfminer's bbox top sits this far above the baseline).
+_HELVETICA_ASCENT = 0.718
+
+
+def picnic_pdf(pages):
+    """A minimal PDF (Helvetica, one content stream per page) placing each
+    word at its (x0, top, size), so pdfplumber reads back the same grid."""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None,
+               '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>']
+    kids = []
+    for words in pages:
+        ops = []
+        for w in words:
+            baseline = PICNIC_PAGE_HEIGHT - w['top'] - _HELVETICA_ASCENT * w['size']
+            ops.append(f"BT /F1 {w['size']} Tf 1 0 0 1 {w['x0']:.2f} {baseline:.2f} Tm "
+                       f"({_pdf_escape(w['text'])}) Tj ET")
+        stream = '\n'.join(ops)
+        objects.append(f'<< /Length {len(stream.encode("latin-1"))} >>\nstream\n{stream}\nendstream')
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 {PICNIC_PAGE_HEIGHT}] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>')
+        kids.append(f'{len(objects)} 0 R')
+    objects[1] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>'
+
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n')
+    offsets = []
+    for n, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(f'{n} 0 obj\n{body}\nendobj\n'.encode('latin-1'))
+    xref = out.tell()
+    out.write(f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode())
+    for offset in offsets:
+        out.write(f'{offset:010d} 00000 n \n'.encode())
+    out.write(f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode())
+    return out.getvalue()
+
+
+def seed_database(cursor, users, receipts, items, group_name='Benchmark'):
+    """Insert a household and its corpus (ids are reassigned by the
+    database) and build the receipt summaries. Returns the group id."""
+    import psycopg2.extras
+
+    from app import _refresh_receipt_summaries
+    cursor.execute("INSERT INTO groups (name, invite_code) VALUES (%s, md5(random()::text)) RETURNING id",
+                   (group_name,))
+    group_id = cursor.fetchone()['id']
+    psycopg2.extras.execute_values(
+        cursor, 'INSERT INTO users (id, name, group_id, joined_at) VALUES %s',
+        [(u['id'], u['name'], group_id, u['joined_at']) for u in users])
+    rows = psycopg2.extras.execute_values(
+        cursor, 'INSERT INTO receipts (payer_id, filename, bill_date, group_id) VALUES %s RETURNING id',
+        [(r['payer_id'], r['filename'], r['receipt_date'].date(), group_id) for r in receipts], fetch=True)
+    ids = {r['id']: row['id'] for r, row in zip(receipts, rows)}
+    psycopg2.extras.execute_values(
+        cursor, 'INSERT INTO items (receipt_id, description, price, assigned_to) VALUES %s',
+        [(ids[i['receipt_id']], i['description'], i['price_cents'] / 100, i['assigned_to']) for i in items],
+        template='(%s, %s, %s::numeric, %s)', page_size=1000)
+    _refresh_receipt_summaries(cursor, list(ids.values()))
+    return group_id
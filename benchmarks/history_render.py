@@ -0,0 +1,73 @@
+"""Measure /history HTML size and server render time, full vs compact view.
+
+Renders history.html for a synthetic household (no database needed):
+
+    python -m benchmarks.history_render --receipts 2000 --members 4
+"""
+import argparse
+import json
+import random
+import time
+from datetime import date, timedelta
+
+from app import app, history_payload, render_template
+
+
+def synthetic_history(n_receipts, members, items_per_receipt=12, seed=1):
+    """get_bill_history()-shaped receipts with random items and assignments."""
+    rng = random.Random(seed)
+    targets = members + ['shared', 'shared', 'excluded']
+    history, item_id = [], 0
+    for rid in range(n_receipts, 0, -1):
+        items = []
+        for _ in range(rng.randint(items_per_receipt // 2, items_per_receipt * 3 // 2)):
+            item_id += 1
+            items.append({'id': item_id, 'description': f'ITEM {rng.randint(1, 5000)} {rng.choice("ABCDEFG")}',
+                          'assigned_to': rng.choice(targets), 'price': rng.randint(19, 2999) / 100})
+        totals = {m: round(sum(i['price'] for i in items if i['assigned_to'] == m), 2) for m in members}
+        shared = round(sum(i['price'] for i in items if i['assigned_to'] == 'shared'), 2)
+        history.append({
+            'id': rid, 'upload_date': '2025-01-01 12:00', 'filename': f'bill_{rid}.jpg',
+            'is_settlement': rid % 25 == 0, 'date': date(2020, 1, 1) + timedelta(days=rid),
+            'payer': rng.choice(members), 'items': items, 'totals_by_user': totals,
+            'shared_total': shared, 'total': round(sum(totals.values()) + shared, 2),
+        })
+    return history
+
+
+def measure(receipts, all_users, compact, repeat=3):
+    best, html = float('inf'), ''
+    for _ in range(repeat):
+        with app.test_request_context('/history'):
+            start = time.perf_counter()
+            if compact:
+                html = render_template('history.html', receipts=receipts, current_sort='upload_date',
+                                       compact=True, payload=history_payload(receipts), all_users=all_users)
+            else:
+                html = render_template('history.html', receipts=receipts, current_sort='upload_date',
+                                       compact=False, all_users=all_users)
+            best = min(best, time.perf_counter() - start)
+    return {'bytes': len(html.encode()), 'render_ms': round(best * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--receipts', type=int, default=2000)
+    parser.add_argument('--members', type=int, default=4)
+    args = parser.parse_args()
+
+    members = [f'member{k}' for k in range(args.members)]
+    all_users = [{'id': m, 'name': m.title()} for m in members]
+    receipts = synthetic_history(args.receipts, members)
+    result = {
+        'receipts': args.receipts,
+        'items': sum(len(r['items']) for r in receipts),
+        'members': args.members,
+        'full': measure(receipts, all_users, compact=False),
+        'compact': measure(receipts, all_users, compact=True),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Compare the Python cost of per-receipt totals in get_bill_history.
+
+  rescan     - the old approach: for each receipt, rescan its items once per
+               member (O(items x members)) plus once for shared items
+  aggregated - shape rows as returned by the GROUP BY receipt_id, assigned_to
+               query (O(receipts x assignees))
+
+The database side of the GROUP BY is not measured here (no Postgres needed):
+
+    python -m benchmarks.history_totals --receipts 20000 --members 6
+"""
+import argparse
+import json
+import random
+import time
+
+from app import receipt_totals
+
+
+def synthetic_items(n_receipts, members, items_per_receipt, seed=1):
+    rng = random.Random(seed)
+    targets = members + ['shared', 'shared', 'excluded']
+    return {rid: [{'assigned_to': rng.choice(targets), 'price': rng.randint(19, 2999) / 100}
+                  for _ in range(items_per_receipt)]
+            for rid in range(n_receipts)}
+
+
+def rescan(items_by_receipt, user_ids):
+    out = {}
+    for rid, items in items_by_receipt.items():
+        totals_by_user = {uid: round(sum(i['price'] for i in items if i['assigned_to'] == uid), 2)
+                          for uid in user_ids}
+        shared_total = sum(i['price'] for i in items if i['assigned_to'] == 'shared')
+        out[rid] = (totals_by_user, round(shared_total, 2), round(sum(totals_by_user.values()) + shared_total, 2))
+    return out
+
+
+def group_by(items_by_receipt):
+    """What Postgres returns for the GROUP BY query (built outside the timer)."""
+    rows = {}
+    for rid, items in items_by_receipt.items():
+        sums = rows.setdefault(rid, {})
+        for i in items:
+            sums[i['assigned_to']] = sums.get(i['assigned_to'], 0) + round(i['price'] * 100)
+    return rows
+
+
+def aggregated(cents_by_receipt, user_ids):
+    return {rid: receipt_totals(cents, user_ids) for rid, cents in cents_by_receipt.items()}
+
+
+def best_of(fn, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--receipts', type=int, default=20000)
+    parser.add_argument('--members', type=int, default=6)
+    parser.add_argument('--items-per-receipt', type=int, default=15)
+    args = parser.parse_args()
+
+    members = [f'member{k}' for k in range(args.members)]
+    items = synthetic_items(args.receipts, members, args.items_per_receipt)
+    rows = group_by(items)
+    print(json.dumps({
+        'receipts': args.receipts,
+        'items': args.receipts * args.items_per_receipt,
+        'members': args.members,
+        'rescan_ms': best_of(rescan, items, members),
+        'aggregated_ms': best_of(aggregated, rows, members),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
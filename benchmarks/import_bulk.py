@@ -0,0 +1,101 @@
+"""Time a bulk import of a large export (CSV and NDJSON).
+
+  export  - export_csv_lines / export_ndjson_lines over the generated rows
+  parse   - parse_import: validation into receipt and item rows
+  load    - import_receipts: COPY into temp tables, set-based inserts and
+            the receipt summaries (only with --database-url, into a scratch
+            schema that is dropped afterwards)
+
+The export comes from a generated household (benchmarks/generators.py), cut
+at a receipt boundary once it holds --items items:
+
+    python -m benchmarks.import_bulk --items 100000
+    python -m benchmarks.import_bulk --items 100000 --database-url URL
+"""
+import argparse
+import io
+import json
+import math
+import time
+
+import app as app_module
+from app import export_csv_lines, export_ndjson_lines, import_receipts, parse_import
+from benchmarks import generators
+from benchmarks.suite import ScratchDatabase
+
+RECEIPTS_PER_WEEK = 3
+
+
+def export_rows(users, n_items, items_mean):
+    """Rows as iter_export_rows yields them, ordered by receipt, ~n_items items."""
+    years = math.ceil(n_items / (RECEIPTS_PER_WEEK * 52 * items_mean)) + 1
+    receipts, items = generators.receipt_corpus(users, years=years, receipts_per_week=RECEIPTS_PER_WEEK,
+                                                items_mean=items_mean)
+    by_receipt = {}
+    for item in items:
+        by_receipt.setdefault(item['receipt_id'], []).append(item)
+    rows = []
+    for r in receipts:
+        if len(rows) >= n_items:
+            break
+        receipt_items = by_receipt.get(r['id'], [])
+        base = {'receipt_id': r['id'], 'payer_id': r['payer_id'], 'bill_date': r['receipt_date'].date(),
+                'upload_date': r['receipt_date'], 'filename': r['filename'],
+                'total_cents': sum(i['price_cents'] for i in receipt_items)}
+        rows.extend({**base, 'item_id': i['id'], 'description': i['description'],
+                     'price_cents': i['price_cents'], 'assigned_to': i['assigned_to']} for i in receipt_items)
+    return rows
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, round(time.perf_counter() - start, 3)
+
+
+def load(users, receipt_rows, item_rows):
+    """import_receipts into a fresh household in the scratch schema (seconds)."""
+    conn = app_module.connect_db()
+    try:
+        with conn, conn.cursor(cursor_factory=app_module.psycopg2.extras.RealDictCursor) as cursor:
+            cursor.execute("INSERT INTO groups (name, invite_code) VALUES ('Import', md5(random()::text)) "
+                           "RETURNING id")
+            group_id = cursor.fetchone()['id']
+            app_module.psycopg2.extras.execute_values(
+                cursor, 'INSERT INTO users (id, name, group_id, joined_at) VALUES %s',
+                [(u['id'], u['name'], group_id, u['joined_at']) for u in users])
+            _, seconds = timed(import_receipts, cursor, group_id, receipt_rows, item_rows)
+    finally:
+        conn.close()
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--items-mean', type=int, default=40)
+    parser.add_argument('--members', type=int, default=4)
+    parser.add_argument('--database-url')
+    parser.add_argument('--sslmode', default='prefer')
+    args = parser.parse_args()
+
+    users = generators.household(args.members)
+    rows = export_rows(users, args.items, args.items_mean)
+    names = {u['id']: u['name'] for u in users}
+    names.update(shared='Shared', excluded='Excluded')
+    report = {'receipts': len({r['receipt_id'] for r in rows}), 'items': len(rows)}
+    parsed = {}
+    for fmt, to_lines in (('csv', export_csv_lines), ('ndjson', export_ndjson_lines)):
+        text, export_s = timed(lambda: ''.join(to_lines(rows, names)))
+        (receipt_rows, item_rows, errors), parse_s = timed(parse_import, io.StringIO(text), fmt, users)
+        assert not errors, errors[:5]
+        parsed[fmt] = receipt_rows, item_rows
+        report[fmt] = {'mb': round(len(text.encode()) / 1024 / 1024, 1), 'export_s': export_s, 'parse_s': parse_s}
+    if args.database_url:
+        with ScratchDatabase(args.database_url, args.sslmode):
+            report['csv']['load_s'] = load(users, *parsed['csv'])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""Load test: receipt uploads mixed with history/balances traffic.
+
+Virtual users (threads with their own session) loop over a weighted mix of
+pages and uploads for a fixed time and the run reports per-request-type
+latency percentiles. Either point it at a running server, or let it start
+gunicorn (gunicorn.conf.py) once per --topology against a scratch schema
+with a generated household, to compare serving setups on the same load:
+
+    python -m benchmarks.loadtest --database-url URL \\
+        --topology OCR_PROCESSES=0 --topology OCR_PROCESSES=2 \\
+        --topology "WEB_THREADS=4 OCR_PROCESSES=2"
+
+    python -m benchmarks.loadtest --url http://localhost:8000 --secret-key KEY --user-id eser
+
+Logins are cookies signed with the server's SECRET_KEY, so no auth service
+is involved. Uploads are synthetic Picnic PDFs (pdfminer layout analysis and
+page rendering) or, with --upload-kind image, receipt photos (needs
+Tesseract on the server).
+"""
+import argparse
+import io
+import json
+import os
+import random
+import re
+import secrets
+import shlex
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (request type, weight): a household mostly browses; uploads are the heavy tail.
+DEFAULT_MIX = (('history', 35), ('history_compact', 15), ('balances', 25), ('memory', 10), ('upload', 15))
+PATHS = {
+    'history': '/history?view=full',
+    'history_compact': '/history?view=compact',
+    'balances': '/balances',
+    'memory': '/memory',
+}
+CSRF_RE = re.compile(r'name="csrf_token" value="([^"]+)"')
+
+
+def session_cookie(secret_key, user_id):
+    """A Flask session cookie logging in user_id, as the server would sign it."""
+    signer = Flask('loadtest')
+    signer.secret_key = secret_key
+    serializer = SecureCookieSessionInterface().get_signing_serializer(signer)
+    return serializer.dumps({'_user_id': user_id, '_fresh': True})
+
+
+def upload_files(kind, count=6, items_per_receipt=25, seed=3):
+    """[(filename, bytes, mimetype)] of generated receipts to upload."""
+    from benchmarks import generators
+    users = generators.household(4, years=1, seed=seed)
+    receipts, items = generators.receipt_corpus(users, years=1, items_mean=items_per_receipt, seed=seed)
+    by_receipt = {}
+    for item in items:
+        by_receipt.setdefault(item['receipt_id'], []).append(item)
+    chosen = [r for r in receipts if not r['is_settlement']][:count]
+    files = []
+    for k, receipt in enumerate(chosen):
+        receipt_items = by_receipt[receipt['id']]
+        if kind == 'image' or (kind == 'mixed' and k % 2):
+            buf = io.BytesIO()
+            generators.receipt_image(generators.receipt_text(receipt_items), seed=k).save(buf, 'JPEG', quality=85)
+            files.append((f'2025-01-{k + 1:02d}_photo.jpg', buf.getvalue(), 'image/jpeg'))
+        else:
+            pages, _ = generators.picnic_pages(receipt_items)
+            files.append((f'2025-01-{k + 1:02d}_picnic.pdf', generators.picnic_pdf(pages), 'application/pdf'))
+    return files
+
+
+class VirtualUser(threading.Thread):
+    """Runs the request mix until the deadline, appending
+    (type, seconds, ok) to the shared results."""
+
+    def __init__(self, base_url, cookie, mix, files, think, deadline, results, seed):
+        super().__init__(daemon=True)
+        self.base_url, self.mix, self.files = base_url, mix, files
+        self.think, self.deadline, self.results = think, deadline, results
+        self.rng = random.Random(seed)
+        self.http = requests.Session()
+        # Same host/path as the server's Set-Cookie, so its updates replace it.
+        self.http.cookies.set('session', cookie, domain=urlsplit(base_url).hostname, path='/')
+        self.csrf = None
+
+    def request(self, kind):
+        if kind != 'upload':
+            return self.http.get(self.base_url + PATHS[kind], timeout=300)
+        if self.csrf is None:
+            self.csrf = CSRF_RE.search(self.http.get(self.base_url + '/', timeout=60).text).group(1)
+        name, body, mimetype = self.rng.choice(self.files)
+        return self.http.post(self.base_url + '/upload', data={'csrf_token': self.csrf},
+                              files={'bill_image': (name, body, mimetype)}, timeout=300)
+
+    def run(self):
+        kinds, weights = zip(*self.mix)
+        while time.monotonic() < self.deadline:
+            kind = self.rng.choices(kinds, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = self.request(kind)
+                ok = response.status_code == 200 and (kind != 'upload' or 'assignForm' in response.text)
+            except requests.RequestException:
+                ok = False
+            self.results.append((kind, time.perf_counter() - start, ok))
+            time.sleep(self.rng.uniform(0, 2 * self.think))
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list."""
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))]
+
+
+def summarize(results, elapsed):
+    by_kind = {}
+    for kind, seconds, ok in results:
+        by_kind.setdefault(kind, []).append((seconds, ok))
+    report = {}
+    for kind, rows in sorted(by_kind.items()):
+        times = sorted(s * 1000 for s, _ in rows)
+        report[kind] = {
+            'requests': len(rows),
+            'errors': sum(1 for _, ok in rows if not ok),
+            'p50_ms': round(statistics.median(times), 1),
+            'p95_ms': round(percentile(times, 0.95), 1),
+            'p99_ms': round(percentile(times, 0.99), 1),
+            'max_ms': round(times[-1], 1),
+        }
+    light = sorted(s * 1000 for kind, s, _ in results if kind != 'upload')
+    if light:
+        report['all_light'] = {'requests': len(light), 'p50_ms': round(statistics.median(light), 1),
+                               'p95_ms': round(percentile(light, 0.95), 1)}
+    report['throughput_rps'] = round(len(results) / elapsed, 2)
+    return report
+
+
+def run_load(base_url, cookie, args, files):
+    results = []
+    deadline = time.monotonic() + args.warmup + args.duration
+    users = [VirtualUser(base_url, cookie, args.mix, files, args.think, deadline, results, seed)
+             for seed in range(args.users)]
+    for user in users:
+        user.start()
+    time.sleep(args.warmup)
+    del results[:]  # drop the warm-up (cold caches, first OCR process start)
+    start = time.monotonic()
+    for user in users:
+        user.join()
+    return summarize(results, time.monotonic() - start)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """gunicorn with gunicorn.conf.py and the topology's environment, in a
+    temporary working directory (uploads land there)."""
+
+    def __init__(self, topology, database_url, sslmode, secret_key):
+        self.env = dict(os.environ, DATABASE_URL=database_url, DATABASE_SSLMODE=sslmode,
+                        SECRET_KEY=secret_key, PORT=str(_free_port()), SNAPSHOT_COMPACT_INTERVAL='0',
+                        PYTHONPATH=ROOT)
+        self.env.update(dict(pair.split('=', 1) for pair in shlex.split(topology)))
+        self.url = f"http://127.0.0.1:{self.env['PORT']}"
+
+    def __enter__(self):
+        self.workdir = tempfile.TemporaryDirectory(prefix='splight-load-')
+        self.log = open(os.path.join(self.workdir.name, 'gunicorn.log'), 'w')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', os.path.join(ROOT, 'gunicorn.conf.py'),
+             '--chdir', self.workdir.name, 'app:app'],
+            env=self.env, stdout=self.log, stderr=subprocess.STDOUT)
+        for _ in range(300):
+            try:
+                if requests.get(self.url + '/login', timeout=1).status_code == 200:
+                    return self
+            except requests.RequestException:
+                pass
+            if self.process.poll() is not None:
+                break
+            time.sleep(0.1)
+        self.__exit__()
+        raise RuntimeError(f'gunicorn did not start; see {self.log.name}')
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+        self.workdir.cleanup()
+
+
+def parse_mix(value):
+    mix = []
+    for part in value.split(','):
+        kind, weight = part.split('=')
+        if kind not in PATHS and kind != 'upload':
+            raise argparse.ArgumentTypeError(f'unknown request type {kind}')
+        mix.append((kind, float(weight)))
+    return tuple(mix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='load a running server instead of starting gunicorn')
+    parser.add_argument('--secret-key', default=os.environ.get('SECRET_KEY'), help="the server's SECRET_KEY (--url)")
+    parser.add_argument('--user-id', help='member to log in as (--url)')
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'))
+    parser.add_argument('--sslmode', default='prefer')
+    parser.add_argument('--topology', action='append',
+                        help='server environment, e.g. "OCR_PROCESSES=2 WEB_THREADS=8" (repeatable)')
+    parser.add_argument('--members', type=int, default=4)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--users', type=int, default=8, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='measured seconds per run')
+    parser.add_argument('--warmup', type=float, default=10)
+    parser.add_argument('--think', type=float, default=0.5, help='mean pause between requests (s)')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='e.g. "history=35,balances=25,upload=15"')
+    parser.add_argument('--upload-kind', choices=('pdf', 'image', 'mixed'), default='pdf')
+    args = parser.parse_args()
+
+    files = upload_files(args.upload_kind)
+    meta = {'users': args.users, 'duration_s': args.duration, 'think_s': args.think,
+            'mix': dict(args.mix), 'upload_kind': args.upload_kind, 'cpus': os.cpu_count()}
+
+    if args.url:
+        if not (args.secret_key and args.user_id):
+            parser.error('--url needs --secret-key and --user-id')
+        report = run_load(args.url.rstrip('/'), session_cookie(args.secret_key, args.user_id), args, files)
+        print(json.dumps({'meta': meta, 'runs': {args.url: report}}, indent=2))
+        return
+
+    if not args.database_url:
+        parser.error('give --url, or --database-url to start servers')
+
+    from benchmarks import generators
+    from benchmarks.suite import ScratchDatabase
+
+    import app as app_module
+    runs = {}
+    with ScratchDatabase(args.database_url, args.sslmode):
+        users = generators.household(args.members, args.years)
+        receipts, items = generators.receipt_corpus(users, args.years)
+        conn = app_module.connect_db()
+        with conn, conn.cursor(cursor_factory=app_module.psycopg2.extras.RealDictCursor) as cursor:
+            generators.seed_database(cursor, users, receipts, items)
+        conn.close()
+        meta.update(receipts=len(receipts), items=len(items))
+
+        secret_key = secrets.token_hex(32)
+        cookie = session_cookie(secret_key, users[0]['id'])
+        for topology in args.topology or ['']:
+            with Server(topology, app_module.DATABASE_URL, args.sslmode, secret_key) as server:
+                runs[topology or 'default'] = run_load(server.url, cookie, args, files)
+            print(f"{topology or 'default'}: {json.dumps(runs[topology or 'default'])}", file=sys.stderr)
+    print(json.dumps({'meta': meta, 'runs': runs}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
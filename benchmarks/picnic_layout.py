@@ -0,0 +1,109 @@
+"""Compare Picnic word parsing with and without the layout index.
+
+  scan   - the old approach: every euro token scans all cents tokens, every
+           price scans all name rows, every word scans all rows so far
+           (quadratic in the lines on a page)
+  index  - parse_picnic_words as shipped (LayoutIndex bisection windows)
+
+Runs on synthetic single-page receipts (benchmarks/generators.py):
+
+    python -m benchmarks.picnic_layout --lines 500
+"""
+import argparse
+import json
+import time
+
+from app import parse_picnic_words
+from benchmarks import generators
+
+
+def scan_cluster_name_rows(words, x_lo, x_hi, size_min):
+    toks = [w for w in words if w.get('size', 0) >= size_min and x_lo <= w['x0'] <= x_hi]
+    rows = []
+    for w in sorted(toks, key=lambda w: (round(w['top']), w['x0'])):
+        for r in rows:
+            if abs(r['top'] - w['top']) <= 4:
+                r['w'].append(w)
+                break
+        else:
+            rows.append({'top': w['top'], 'w': [w]})
+    return [{'top': r['top'],
+             'text': ' '.join(x['text'] for x in sorted(r['w'], key=lambda x: x['x0']))}
+            for r in sorted(rows, key=lambda r: r['top'])]
+
+
+def scan_parse_picnic_words(pages_words):
+    """parse_picnic_words before the layout index (reference for tests)."""
+    items = []
+    for words in pages_words:
+        smalls = [w for w in words if w['text'].isdigit() and w.get('size', 0) < 12 and w['x0'] > 393]
+        clusters = []
+        for w in words:
+            if w['text'].isdigit() and w.get('size', 0) >= 12 and w['x0'] > 350:
+                cand = [s for s in smalls if -3 <= (s['top'] - w['top']) <= 9]
+                cents = int(min(cand, key=lambda s: abs(s['top'] - w['top']))['text']) if cand else 0
+                clusters.append({'top': w['top'], 'price': int(w['text']) + cents / 100.0})
+        clusters.sort(key=lambda c: c['top'])
+
+        name_rows = scan_cluster_name_rows(words, 230, 380, 7.5)
+        totals_tops = [w['top'] for w in words
+                       if 'summe' in w['text'].lower() or w['text'].lower() in ('pfand', 'gesamtbetrag', 'mwst')]
+        stop_top = min(totals_tops) if totals_tops else float('inf')
+
+        used = [False] * len(clusters)
+        for k, c in enumerate(clusters):
+            if c['top'] >= stop_top - 4:
+                break
+            if used[k]:
+                continue
+            final = c['price']
+            if k + 1 < len(clusters) and 0 < clusters[k + 1]['top'] - c['top'] <= 30:
+                final = clusters[k + 1]['price']
+                used[k + 1] = True
+            names = sorted((nr for nr in name_rows if c['top'] - 15 <= nr['top'] <= c['top'] + 6),
+                           key=lambda nr: nr['top'])
+            desc = ' '.join(nr['text'] for nr in names).strip()
+            if not any(ch.isalpha() for ch in desc):
+                continue
+            items.append({'description': desc, 'price': round(final, 2), 'is_valid': True})
+    return items
+
+
+def synthetic_pages(lines, seed=1):
+    """One page with `lines` Picnic items."""
+    users = generators.household(3, years=1, seed=seed)
+    _, items = generators.receipt_corpus(users, years=2, seed=seed)
+    items = [i for i in items if i['description'] != 'Settlement'][:lines]
+    pages, _ = generators.picnic_pages(items, items_per_page=lines)
+    return pages
+
+
+def best_of(fn, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=500)
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.lines)
+    assert parse_picnic_words(pages) == scan_parse_picnic_words(pages)
+    scan_ms = best_of(scan_parse_picnic_words, pages)
+    index_ms = best_of(parse_picnic_words, pages)
+    print(json.dumps({
+        'lines': args.lines,
+        'words': sum(len(p) for p in pages),
+        'scan_ms': scan_ms,
+        'index_ms': index_ms,
+        'lines_per_second': round(args.lines / index_ms * 1000),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
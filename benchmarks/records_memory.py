@@ -0,0 +1,125 @@
+"""Memory of history and balance shaping: dict rows vs compact records.
+
+  dicts    - the old path: one dict per fetched row (RealDictCursor), copied
+             into another dict per history item; receipts and summary
+             pseudo-items as dicts for the balance math
+  records  - as shipped: the group snapshot's columns (integer columns as
+             arrays), ItemRecord / ReceiptRecord (__slots__) per row
+
+Measured with tracemalloc on a generated household (benchmarks/generators.py),
+from the fetched rows/columns to the shaped result:
+
+    python -m benchmarks.records_memory --members 6 --years 10 --items-mean 40
+
+peak_mb is the high-water mark while shaping, retained_mb what the result
+keeps alive once the fetched rows are dropped.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from app import (ITEM_COLUMNS, RECEIPT_COLUMNS, GroupSnapshot, bill_history, cents_to_euros, compute_balances,
+                 is_settlement_filename, receipt_totals, _summary_items)
+from benchmarks import generators
+
+
+def corpus(members, years, items_mean, seed=1):
+    """(users, receipt rows, item rows) shaped like the database's rows."""
+    users = generators.household(members, years=years, seed=seed)
+    receipts, items = generators.receipt_corpus(users, years=years, items_mean=items_mean, seed=seed)
+    sums = {}
+    for item in items:
+        by_assignee = sums.setdefault(item['receipt_id'], {})
+        by_assignee[item['assigned_to']] = by_assignee.get(item['assigned_to'], 0) + item['price_cents']
+    receipt_rows = [{'id': r['id'], 'upload_date': r['receipt_date'], 'payer_id': r['payer_id'],
+                     'filename': r['filename'], 'bill_date': r['receipt_date'].date(), 'total': None,
+                     'assignee_cents': sums.get(r['id'], {}), 'receipt_date': r['receipt_date']}
+                    for r in receipts]
+    item_rows = [{c: i[c] for c in ITEM_COLUMNS} for i in items]
+    return users, receipt_rows, item_rows
+
+
+def dict_bill_history(receipt_rows, item_rows, user_ids):
+    """get_bill_history before the records (reference for tests)."""
+    rows = [dict(r) for r in item_rows]  # what fetchall() held
+    items_by_receipt = {r['id']: [] for r in receipt_rows}
+    for row in rows:
+        items_by_receipt[row['receipt_id']].append(
+            {'id': row['id'], 'description': row['description'], 'assigned_to': row['assigned_to'],
+             'price_cents': row['price_cents'], 'price': cents_to_euros(row['price_cents'])})
+    del rows
+    history = []
+    for r in sorted(receipt_rows, key=lambda r: r['upload_date'], reverse=True):
+        history.append({
+            'id': r['id'],
+            'upload_date': r['upload_date'].strftime('%Y-%m-%d %H:%M'),
+            'filename': r['filename'],
+            'is_settlement': is_settlement_filename(r['filename']),
+            'date': r['bill_date'],
+            'payer': r['payer_id'],
+            'items': items_by_receipt[r['id']],
+            **receipt_totals(r['assignee_cents'], user_ids),
+        })
+    return history
+
+
+def record_bill_history(receipt_rows, item_rows, user_ids):
+    """bill_history from array_agg-style columns, as get_bill_history runs."""
+    snapshot = GroupSnapshot(0, 'all', {c: [r[c] for r in receipt_rows] for c in RECEIPT_COLUMNS},
+                             {c: [i[c] for i in item_rows] for c in ITEM_COLUMNS})
+    return bill_history(snapshot, user_ids)
+
+
+def dict_balances(users, receipt_rows):
+    receipts = [{'id': r['id'], 'payer_id': r['payer_id'], 'filename': r['filename'],
+                 'receipt_date': r['receipt_date'], 'assignee_cents': r['assignee_cents'],
+                 'is_settlement': is_settlement_filename(r['filename'])} for r in receipt_rows]
+    items = [{'receipt_id': r['id'], 'assigned_to': a, 'price_cents': c}
+             for r in receipts for a, c in r['assignee_cents'].items()]
+    return compute_balances(users, receipts, items), (receipts, items)
+
+
+def record_balances(users, receipt_rows):
+    snapshot = GroupSnapshot(0, 'all', {c: [r[c] for r in receipt_rows] for c in RECEIPT_COLUMNS}, None)
+    receipts = snapshot.receipt_rows()
+    items = _summary_items(None, receipts)
+    return compute_balances(users, receipts, items), (receipts, items)
+
+
+def traced(fn, *args):
+    """(result, peak MB, retained MB, seconds) of fn(*args)."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    mb = 1024 * 1024
+    return result, round((peak - before) / mb, 2), round((current - before) / mb, 2), round(seconds, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=6)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--items-mean', type=int, default=40)
+    args = parser.parse_args()
+
+    users, receipt_rows, item_rows = corpus(args.members, args.years, args.items_mean)
+    user_ids = [u['id'] for u in users]
+    report = {'receipts': len(receipt_rows), 'items': len(item_rows)}
+    for name, fn, fn_args in (('history_dicts', dict_bill_history, (receipt_rows, item_rows, user_ids)),
+                              ('history_records', record_bill_history, (receipt_rows, item_rows, user_ids)),
+                              ('balances_dicts', dict_balances, (users, receipt_rows)),
+                              ('balances_records', record_balances, (users, receipt_rows))):
+        result, peak, retained, seconds = traced(fn, *fn_args)
+        report[name] = {'peak_mb': peak, 'retained_mb': retained, 'seconds': seconds}
+        del result
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""End-to-end benchmark suite over synthetic households and receipts.
+
+Times the balance math, assignment memory, the receipt parsers and image
+preprocessing on generated data (see benchmarks/generators.py); with
+--database-url it also loads a household into a scratch schema and times
+get_memory_entries and full requests through the Flask test client.
+
+    python -m benchmarks.suite                          # pure cases
+    python -m benchmarks.suite --database-url URL       # + database and routes
+    python -m benchmarks.suite --save-baseline          # record benchmarks/baseline.json
+    python -m benchmarks.suite --compare                # exit 1 on a regression
+
+Prints one JSON document: meta (machine, parameters) and per case the
+median/min milliseconds per call. Baselines are only comparable on the
+machine they were recorded on.
+"""
+import argparse
+import copy
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import pdfplumber
+
+import app as app_module
+from benchmarks import generators
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_THRESHOLD = 0.20  # fail when a median is more than 20% above baseline
+
+
+def measure(fn, repeat=7, number=1):
+    """Call fn once to warm up, then `repeat` timed rounds of `number`
+    calls. Returns per-call {'median_ms', 'min_ms'}."""
+    fn()
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number * 1000)
+    return {'median_ms': round(statistics.median(rounds), 3), 'min_ms': round(min(rounds), 3),
+            'repeat': repeat, 'number': number}
+
+
+def pure_cases(args):
+    """{name: (fn, number)} for everything that runs without a database."""
+    users = generators.household(args.members, args.years)
+    receipts, items = generators.receipt_corpus(users, args.years)
+    memory = generators.learned_memory(items)
+
+    # Settle-up suggestions for a big household: random nets that sum to zero.
+    nets = [((k * 7919) % 20001) - 10000 for k in range(199)]
+    many = [{'id': f'm{k}', 'name': f'M{k}', 'net_cents': c} for k, c in enumerate(nets + [-sum(nets)])]
+
+    # A freshly OCR'd upload: recent receipts, descriptions damaged by OCR noise.
+    by_receipt = {}
+    for item in items:
+        by_receipt.setdefault(item['receipt_id'], []).append(item)
+    recent = [r for r in receipts if not r['is_settlement']][-args.upload_receipts:]
+    rng = random.Random(2)
+    parsed = [{'parsed_items': [{'description': generators.ocr_noise(i['description'].upper(), rng),
+                                 'price': i['price_cents'] / 100} for i in by_receipt[r['id']]]}
+              for r in recent]
+
+    long_receipt = [i for r in recent for i in by_receipt[r['id']]][:args.receipt_items]
+    text = generators.receipt_text(long_receipt)
+    image = generators.receipt_image(text)
+    pages, _ = generators.picnic_pages(long_receipt)
+    pdf_bytes = generators.picnic_pdf(pages)
+
+    def parse_picnic_pdf():
+        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+            return app_module.parse_picnic_pdf(pdf)
+
+    return {
+        'compute_balances': (lambda: app_module.compute_balances(users, receipts, items), 1),
+        'compute_settlements': (lambda: app_module.compute_settlements(many), 20),
+        'apply_assignment_memory': (
+            lambda: app_module._apply_assignment_memory(copy.deepcopy(parsed), None, memory=memory), 1),
+        'parse_bill_text': (lambda: app_module.parse_bill_text(text), 20),
+        'parse_picnic_words': (lambda: app_module.parse_picnic_words(pages), 5),
+        'parse_picnic_pdf': (parse_picnic_pdf, 1),
+        'preprocess_image': (lambda: app_module.preprocess_image(image), 1),
+    }
+
+
+def _with_search_path(url, schema):
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query['options'] = f'-csearch_path={schema}'
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class ScratchDatabase:
+    """The app pointed at a fresh schema (init_db applied) holding one
+    generated household; the schema is dropped on exit."""
+
+    def __init__(self, url, sslmode):
+        self.url, self.sslmode = url, sslmode
+        self.schema = f'splight_bench_{uuid.uuid4().hex[:8]}'
+
+    def __enter__(self):
+        self.admin = app_module.psycopg2.connect(self.url, sslmode=self.sslmode)
+        self.admin.autocommit = True
+        self.admin.cursor().execute(f'CREATE SCHEMA {self.schema}')
+        self.saved = app_module.DATABASE_URL, app_module.DATABASE_SSLMODE
+        app_module.DATABASE_URL = _with_search_path(self.url, self.schema)
+        app_module.DATABASE_SSLMODE = self.sslmode
+        app_module.init_db()
+        return self
+
+    def __exit__(self, *exc):
+        app_module.DATABASE_URL, app_module.DATABASE_SSLMODE = self.saved
+        self.admin.cursor().execute(f'DROP SCHEMA {self.schema} CASCADE')
+        self.admin.close()
+
+
+def database_cases(args):
+    """{name: (fn, number)} against the scratch database (must be entered)."""
+    users = generators.household(args.members, args.years)
+    receipts, items = generators.receipt_corpus(users, args.years)
+    conn = app_module.connect_db()
+    with conn, conn.cursor(cursor_factory=app_module.psycopg2.extras.RealDictCursor) as cursor:
+        group_id = generators.seed_database(cursor, users, receipts, items)
+    conn.close()
+
+    def memory_entries():
+        with app_module.app.test_request_context('/memory'):
+            return app_module.get_memory_entries(group_id)
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = users[0]['id']
+        sess['_fresh'] = True
+
+    def route(path):
+        def call():
+            response = client.get(path)
+            assert response.status_code == 200, (path, response.status_code)
+        return call
+
+    return {
+        'get_memory_entries': (memory_entries, 1),
+        'route_balances': (route('/balances'), 1),
+        'route_history': (route('/history?view=full'), 1),
+        'route_history_compact': (route('/history?view=compact'), 1),
+        'route_memory': (route('/memory'), 1),
+    }
+
+
+def run(cases, repeat):
+    results = {}
+    for name, (fn, number) in cases.items():
+        results[name] = measure(fn, repeat=repeat, number=number)
+        print(f'{name:<26} {results[name]["median_ms"]:>10.3f} ms', file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Per case present in both: median ratio to the baseline. Returns
+    (ratios, regressions) where regressions exceed 1 + threshold."""
+    ratios = {}
+    for name, result in results.items():
+        before = baseline.get('cases', {}).get(name)
+        if before and before['median_ms'] > 0:
+            ratios[name] = round(result['median_ms'] / before['median_ms'], 3)
+    regressions = sorted(name for name, ratio in ratios.items() if ratio > 1 + threshold)
+    return ratios, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=6)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--upload-receipts', type=int, default=5, help='receipts in the memory case')
+    parser.add_argument('--receipt-items', type=int, default=40, help='items on the parsed receipts')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--only', help='comma-separated case names')
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'))
+    parser.add_argument('--sslmode', default='prefer')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    wanted = set(args.only.split(',')) if args.only else None
+
+    def select(cases):
+        return {k: v for k, v in cases.items() if wanted is None or k in wanted}
+
+    results = run(select(pure_cases(args)), args.repeat)
+    if args.database_url:
+        with ScratchDatabase(args.database_url, args.sslmode):
+            results.update(run(select(database_cases(args)), args.repeat))
+
+    report = {
+        'meta': {
+            'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'cpus': os.cpu_count(),
+            'params': {'members': args.members, 'years': args.years, 'upload_receipts': args.upload_receipts,
+                       'receipt_items': args.receipt_items, 'repeat': args.repeat},
+        },
+        'cases': results,
+    }
+
+    status = 0
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta']['params'] != report['meta']['params']:
+            print('warning: baseline was recorded with different parameters', file=sys.stderr)
+        ratios, regressions = compare(results, baseline, args.threshold)
+        report['comparison'] = {'baseline': os.path.relpath(args.baseline), 'threshold': args.threshold,
+                                'ratios': ratios, 'regressions': regressions}
+        status = 1 if regressions else 0
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+
+    print(json.dumps(report, indent=2))
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
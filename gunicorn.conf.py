@@ -0,0 +1,37 @@
+"""Gunicorn settings, read from the environment (Dockerfile/Procfile use this).
+
+The app keeps streamed-upload jobs, the roster cache and the thumbnail cache
+in its process, so by default it runs as a single worker process and serves
+concurrent requests from threads. CPU-heavy receipt extraction should go to
+OCR processes (OCR_PROCESSES, see app.py) rather than to more web workers:
+that keeps light pages responsive without splitting the in-process state.
+benchmarks/loadtest.py measures these settings against each other. On a
+one-CPU host the light-page p95 was the same with 0, 1 or 2 OCR processes
+(the core itself is the bottleneck), while 4 threads instead of 8 roughly
+tripled it for /balances; hence 8 threads, and OCR_PROCESSES set to the
+spare cores on bigger hosts.
+
+  WEB_WORKERS       worker processes (1; more needs sticky sessions for SSE)
+  WORKER_CLASS      gthread (default) or gevent (needs gevent + psycogreen)
+  WEB_THREADS       threads per gthread worker (8)
+  WORKER_CONNECTIONS  concurrent greenlets per gevent worker (100)
+  WEB_TIMEOUT       seconds before a silent worker is restarted (300)
+"""
+import os
+
+bind = f":{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_WORKERS', '1'))
+worker_class = os.environ.get('WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('WEB_THREADS', '8'))
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', '100'))
+timeout = int(os.environ.get('WEB_TIMEOUT', '300'))
+graceful_timeout = 30
+keepalive = 5
+
+
+def post_fork(server, worker):
+    # Under gevent, psycopg2 would block the whole worker on every query
+    # unless its wait callback yields to the event loop.
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -0,0 +1,113 @@
+"""Database fixtures: a throwaway Postgres for the DB-backed tests.
+
+Uses TEST_DATABASE_URL when set (tests run in a fresh schema that is dropped
+afterwards), else starts a temporary cluster with initdb/pg_ctl from PATH.
+Tests that need it are skipped when neither is available."""
+import os
+import shutil
+import socket
+import subprocess
+import uuid
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import psycopg2
+import psycopg2.extras
+import pytest
+from flask import g, request, request_finished
+
+import app as app_module
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _with_search_path(url, schema):
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query['options'] = f'-csearch_path={schema}'
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+@pytest.fixture(scope='session')
+def postgres_url(tmp_path_factory):
+    url = os.environ.get('TEST_DATABASE_URL')
+    if url:
+        yield url
+        return
+    initdb, pg_ctl = shutil.which('initdb'), shutil.which('pg_ctl')
+    if not (initdb and pg_ctl):
+        pytest.skip('no Postgres: set TEST_DATABASE_URL or put initdb/pg_ctl on PATH')
+    if hasattr(os, 'geteuid') and os.geteuid() == 0:
+        pytest.skip('initdb refuses to run as root: set TEST_DATABASE_URL')
+    data = tmp_path_factory.mktemp('pgdata')
+    port = _free_port()
+    subprocess.run([initdb, '-D', str(data), '-U', 'postgres', '-A', 'trust', '--no-sync'],
+                   check=True, capture_output=True)
+    subprocess.run([pg_ctl, '-D', str(data), '-l', str(data / 'server.log'), '-w', 'start',
+                    '-o', f'-p {port} -k {data} -c listen_addresses=127.0.0.1 -F'],
+                   check=True, capture_output=True)
+    try:
+        yield f'postgresql://postgres@127.0.0.1:{port}/postgres'
+    finally:
+        subprocess.run([pg_ctl, '-D', str(data), '-m', 'immediate', 'stop'], capture_output=True)
+
+
+@pytest.fixture(scope='session')
+def pg_database(postgres_url):
+    """The app pointed at a fresh schema with init_db() applied."""
+    schema = f'splight_test_{uuid.uuid4().hex[:8]}'
+    admin = psycopg2.connect(postgres_url, sslmode='disable')
+    admin.autocommit = True
+    admin.cursor().execute(f'CREATE SCHEMA {schema}')
+    saved = app_module.DATABASE_URL, app_module.DATABASE_SSLMODE
+    app_module.DATABASE_URL = _with_search_path(postgres_url, schema)
+    app_module.DATABASE_SSLMODE = 'disable'
+    try:
+        app_module.init_db()
+        yield app_module.DATABASE_URL
+    finally:
+        app_module.DATABASE_URL, app_module.DATABASE_SSLMODE = saved
+        admin.cursor().execute(f'DROP SCHEMA {schema} CASCADE')
+        admin.close()
+
+
+@pytest.fixture
+def db(pg_database):
+    """Autocommit RealDict cursor on the test schema; receipts are emptied
+    and caches reset for each test."""
+    conn = app_module.connect_db()
+    conn.autocommit = True
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.execute('TRUNCATE receipts, items, balance_snapshot_months, assignment_overrides CASCADE')
+    app_module._roster_cache.clear()
+    yield cursor
+    conn.close()
+
+
+@pytest.fixture
+def member_client(db, monkeypatch):
+    """Test client logged in as the seeded member 'eser', CSRF off."""
+    monkeypatch.setitem(app_module.app.config, 'WTF_CSRF_ENABLED', False)
+    with app_module.app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['_user_id'] = 'eser'
+            sess['_fresh'] = True
+        yield client
+
+
+@pytest.fixture
+def query_log(monkeypatch):
+    """Statements run by each request made during the test:
+    a list of (endpoint, [sql, ...])."""
+    monkeypatch.setitem(app_module.app.config, 'RECORD_QUERIES', True)
+    log = []
+
+    def record(sender, response, **extra):
+        log.append((request.endpoint, list(g.query_log or [])))
+
+    request_finished.connect(record, app_module.app)
+    yield log
+    request_finished.disconnect(record, app_module.app)
@@ -1,7 +1,9 @@
 """Tests for the pure balance math (compute_balances / compute_settlements)."""
 from datetime import date
 
-from app import compute_balances, compute_settlements
+from app import (compute_balances, compute_settlements, split_cents, to_cents,
+                 accumulate_by_month, _accumulate_balances, _add_totals, _empty_totals,
+                 _summary_items)
 
 EARLY = date(2000, 1, 1)  # founding-member sentinel
 
@@ -129,3 +131,80 @@ def test_compute_settlements_ignores_settled_balances():
         {'id': 'b', 'name': 'B', 'net': 0.0},
     ]
     assert compute_settlements(balances) == []
+
+
+def test_three_way_split_is_exact_to_the_cent():
+    # €10.00 shared three ways can't divide evenly: shares must still add up
+    # to exactly 1000 cents, and the nets to exactly zero.
+    users = [_user('a'), _user('b'), _user('c')]
+    receipts = [{'id': 1, 'payer_id': 'a', 'receipt_date': date(2025, 1, 1)}]
+    items = [{'price': 10.0, 'assigned_to': 'shared', 'receipt_id': 1}]
+    result = compute_balances(users, receipts, items)
+    shares = sorted(u['shared_share'] for u in result['users'])
+    assert shares == [3.33, 3.33, 3.34]
+    assert sum(u['net_cents'] for u in result['users']) == 0
+    # Whatever a is owed is paid back in full, to the cent.
+    owed_to_a = next(u['net'] for u in result['users'] if u['id'] == 'a')
+    assert round(sum(s['amount'] for s in result['settlements']), 2) == owed_to_a
+
+
+def test_odd_cents_rotate_between_receipts():
+    # The leftover cent should not always land on the same member.
+    users = [_user('a'), _user('b')]
+    receipts = [{'id': rid, 'payer_id': 'a', 'receipt_date': date(2025, 1, 1)} for rid in (1, 2)]
+    items = [{'price': 0.01, 'assigned_to': 'shared', 'receipt_id': rid} for rid in (1, 2)]
+    shares = share_by_id(compute_balances(users, receipts, items))
+    assert shares == {'a': 0.01, 'b': 0.01}
+
+
+def test_price_cents_and_float_prices_agree():
+    users = [_user('a'), _user('b')]
+    receipts = [{'id': 1, 'payer_id': 'b', 'receipt_date': date(2025, 1, 1)}]
+    as_float = [{'price': 0.1, 'assigned_to': 'shared', 'receipt_id': 1},
+                {'price': 0.2, 'assigned_to': 'a', 'receipt_id': 1}]
+    as_cents = [{'price_cents': 10, 'assigned_to': 'shared', 'receipt_id': 1},
+                {'price_cents': 20, 'assigned_to': 'a', 'receipt_id': 1}]
+    assert compute_balances(users, receipts, as_float) == compute_balances(users, receipts, as_cents)
+
+
+def test_split_cents_and_to_cents():
+    assert split_cents(100, 3) == [34, 33, 33]
+    assert split_cents(100, 3, offset=2) == [33, 33, 34]
+    assert sum(split_cents(-7, 2)) == -7
+    assert to_cents(0.1 + 0.2) == 30
+    assert to_cents('2.675') == 268  # half away from zero, like Postgres ROUND
+
+
+def test_monthly_totals_add_up_to_full_replay():
+    # Snapshots rely on per-month accumulations summing to the all-time totals,
+    # including members who join part-way through.
+    users = [_user('a'), _user('b', joined_at=date(2025, 2, 1))]
+    receipts = [{'id': i, 'payer_id': 'ab'[i % 2], 'receipt_date': date(2025, 1 + i % 3, 1 + i % 27),
+                 'is_settlement': i % 7 == 0} for i in range(1, 40)]
+    items = [{'price_cents': 100 + 7 * i, 'assigned_to': ('shared', 'a', 'b', 'excluded')[i % 4],
+              'receipt_id': 1 + i % 39} for i in range(200)]
+    by_month = accumulate_by_month(users, receipts, items)
+    assert sorted(by_month) == [date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1)]
+    total = _empty_totals(len(users))
+    for acc in by_month.values():
+        _add_totals(total, acc)
+    assert total == _accumulate_balances(users, receipts, items)
+
+
+def test_receipt_summaries_replay_like_items():
+    # Balances read per-assignee receipt summaries instead of items; both must
+    # give identical results, settlements and odd-cent splits included.
+    users = [_user('a'), _user('b'), _user('c', joined_at=date(2025, 2, 1))]
+    receipts = [{'id': i, 'payer_id': 'abc'[i % 3], 'receipt_date': date(2025, 1 + i % 2, 1 + i),
+                 'is_settlement': i % 5 == 0} for i in range(1, 20)]
+    items = [{'price_cents': 13 * i + 1, 'assigned_to': ('shared', 'a', 'b', 'c', 'excluded')[i % 5],
+              'receipt_id': 1 + i % 19} for i in range(120)]
+    for r in receipts:
+        summary = {}
+        for item in items:
+            if item['receipt_id'] == r['id']:
+                summary[item['assigned_to']] = summary.get(item['assigned_to'], 0) + item['price_cents']
+        r['assignee_cents'] = summary
+    pseudo = _summary_items(None, receipts)
+    assert len(pseudo) < len(items)
+    assert compute_balances(users, receipts, pseudo) == compute_balances(users, receipts, items)
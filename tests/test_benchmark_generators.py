@@ -0,0 +1,44 @@
+"""The benchmark generators must produce data the app reads as intended:
+a synthetic Picnic receipt parses back to its items, both as words and as a
+PDF, and a generated household's balances still sum to zero."""
+import io
+
+import pdfplumber
+
+from app import compute_balances, parse_bill_text, parse_picnic_pdf, parse_picnic_words
+from benchmarks import generators
+
+
+def _corpus():
+    users = generators.household(5, years=1)
+    return users, *generators.receipt_corpus(users, years=1)
+
+
+def test_picnic_grid_round_trips_through_parser():
+    _, receipts, items = _corpus()
+    chosen = items[:40]  # several pages, discounts and wrapped names
+    pages, expected = generators.picnic_pages(chosen)
+    assert len(pages) > 1
+    assert parse_picnic_words(pages) == expected
+    with pdfplumber.open(io.BytesIO(generators.picnic_pdf(pages))) as pdf:
+        assert 'dein bon' in pdf.pages[0].extract_text().lower()
+        assert parse_picnic_pdf(pdf) == expected
+
+
+def test_corpus_balances_sum_to_zero():
+    users, receipts, items = _corpus()
+    assert any(r['is_settlement'] for r in receipts)
+    assert any(u['joined_at'] > receipts[0]['receipt_date'] for u in users)
+    result = compute_balances(users, receipts, items)
+    assert sum(u['net_cents'] for u in result['users']) == 0
+
+
+def test_receipt_text_parses_as_item_lines():
+    _, _, items = _corpus()
+    chosen = items[:20]
+    parsed = parse_bill_text(generators.receipt_text(chosen, noise=0))
+    # Every parsed line is one of the items, in order, and the totals block
+    # is not. (Some names trip the keyword filter, e.g. 'BARILLA' for 'bar'.)
+    expected = iter((i['description'].upper(), i['price_cents']) for i in chosen)
+    assert all((p['description'], round(p['price'] * 100)) in expected for p in parsed)
+    assert len(parsed) >= len(chosen) * 3 // 4
@@ -0,0 +1,83 @@
+"""Tests for the streaming history export (pure line generators)."""
+import csv
+import io
+import json
+import tracemalloc
+from datetime import date
+
+from app import (EXPORT_COLUMNS, export_csv_lines, export_ndjson_lines, format_cents,
+                 iter_export_rows)
+
+NAMES = {'u1': 'Ann', 'u2': 'Ben', 'shared': 'Shared'}
+
+
+class FakeExportCursor:
+    """Stands in for the named cursor: generates rows lazily, batch by batch."""
+
+    def __init__(self, n_receipts, items_per_receipt):
+        self.rows = self._generate(n_receipts, items_per_receipt)
+        self.batches = 0
+
+    @staticmethod
+    def _generate(n_receipts, items_per_receipt):
+        item_id = 0
+        for rid in range(1, n_receipts + 1):
+            for k in range(items_per_receipt):
+                item_id += 1
+                yield {'receipt_id': rid, 'bill_date': date(2025, 1, 1 + rid % 28), 'upload_date': None,
+                       'payer_id': 'u1', 'filename': f'bill-{rid}.pdf', 'total_cents': 1234,
+                       'item_id': item_id, 'description': f'Item {k}', 'price_cents': 99 + k,
+                       'assigned_to': ('shared', 'u1', 'u2')[k % 3]}
+
+    def fetchmany(self, size):
+        self.batches += 1
+        return [row for _, row in zip(range(size), self.rows)]
+
+
+def _rows(*rows):
+    base = {'bill_date': None, 'upload_date': None, 'payer_id': 'u1', 'filename': 'f.pdf',
+            'total_cents': 300, 'description': 'x', 'price_cents': 150, 'assigned_to': 'shared'}
+    return [{**base, **row} for row in rows]
+
+
+def test_format_cents_is_exact():
+    assert format_cents(0) == '0.00'
+    assert format_cents(1005) == '10.05'
+    assert format_cents(-7) == '-0.07'
+    assert format_cents(None) == ''
+
+
+def test_csv_has_header_names_and_empty_receipts():
+    rows = _rows({'receipt_id': 1, 'item_id': 1}, {'receipt_id': 1, 'item_id': 2, 'assigned_to': 'u2'},
+                 {'receipt_id': 2, 'item_id': None, 'description': None, 'price_cents': None,
+                  'assigned_to': None})
+    parsed = list(csv.reader(io.StringIO(''.join(export_csv_lines(rows, NAMES)))))
+    assert tuple(parsed[0]) == EXPORT_COLUMNS
+    assert parsed[1][3] == 'Ann' and parsed[1][8] == '1.50' and parsed[1][9] == 'Shared'
+    assert parsed[2][9] == 'Ben'
+    assert parsed[3][:1] == ['2'] and parsed[3][6:] == ['', '', '', '']
+
+
+def test_ndjson_groups_items_per_receipt():
+    rows = _rows({'receipt_id': 1, 'item_id': 1}, {'receipt_id': 1, 'item_id': 2},
+                 {'receipt_id': 2, 'item_id': None})
+    lines = list(export_ndjson_lines(rows, NAMES))
+    receipts = [json.loads(line) for line in lines]
+    assert [r['id'] for r in receipts] == [1, 2]
+    assert [i['id'] for i in receipts[0]['items']] == [1, 2]
+    assert receipts[1]['items'] == [] and receipts[0]['total'] == '3.00'
+
+
+def test_export_memory_stays_bounded():
+    # 60k items: materialising them would take ~10x the bound; streaming must not.
+    for to_lines in (export_csv_lines, export_ndjson_lines):
+        cursor = FakeExportCursor(n_receipts=6_000, items_per_receipt=10)
+        tracemalloc.start()
+        written = 0
+        for chunk in to_lines(iter_export_rows(cursor, batch_size=500), NAMES):
+            written += len(chunk)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert cursor.batches > 100
+        assert written > 3_000_000
+        assert peak < 1_000_000, f'{to_lines.__name__} peaked at {peak} bytes'
@@ -0,0 +1,124 @@
+"""Tests for the group snapshot loader and monthly balance snapshots,
+against a real Postgres (see conftest.py)."""
+import threading
+from datetime import date
+
+import psycopg2.extras
+
+import app as app_module
+from app import app, g
+
+
+def _household(db):
+    db.execute("SELECT id FROM groups WHERE name = 'Household'")
+    return db.fetchone()['id']
+
+
+def _receipt(db, group_id, payer, bill_date, items, filename='bill.pdf'):
+    db.execute('INSERT INTO receipts (payer_id, filename, bill_date, group_id) VALUES (%s, %s, %s, %s) RETURNING id',
+               (payer, filename, bill_date, group_id))
+    receipt_id = db.fetchone()['id']
+    for description, price, assigned_to in items:
+        db.execute('INSERT INTO items (receipt_id, description, price, assigned_to) VALUES (%s, %s, %s, %s)',
+                   (receipt_id, description, price, assigned_to))
+    return receipt_id
+
+
+def _seed(db):
+    group_id = _household(db)
+    ids = [
+        _receipt(db, group_id, 'eser', date(2025, 1, 5), [('Milch', 1.19, 'shared'), ('Kaffee', 6.99, 'eser')]),
+        _receipt(db, group_id, 'david', None, [('Brot', 2.49, 'shared'), ('Bier', 4.5, 'excluded')]),
+        _receipt(db, group_id, 'david', date(2025, 2, 1), [('Milch', 1.19, 'david')]),
+        _receipt(db, group_id, 'eser', date(2025, 2, 3), [('Settlement payment', 3.0, 'david')], 'Settlement'),
+    ]
+    # The first two get summaries; the others look not yet backfilled.
+    app_module._refresh_receipt_summaries(db, ids[:2])
+    db.execute('UPDATE receipts SET assignee_cents = NULL, item_count = NULL WHERE id = ANY(%s)', (ids[2:],))
+    return group_id, ids
+
+
+def _request():
+    """A request context that counts statements like a real request."""
+    ctx = app.test_request_context('/')
+    ctx.push()
+    g.query_count, g.query_time, g.query_log = 0, 0.0, []
+    return ctx
+
+
+def test_one_statement_serves_history_memory_and_balances(db):
+    group_id, ids = _seed(db)
+    ctx = _request()
+    try:
+        history = app_module.get_bill_history('bill_date', group_id)
+        app_module.get_memory_entries(group_id)
+        app_module.calculate_balances_detailed(group_id)
+        app_module.get_roster(group_id)
+        # The snapshot (roster included), the overrides and the item sums of
+        # the two receipts without a summary.
+        assert len(g.query_log) == 3, g.query_log
+        assert g.query_log[0].startswith('WITH rs AS')
+    finally:
+        ctx.pop()
+
+    # Unknown bill dates first, then newest, like ORDER BY bill_date DESC.
+    assert [r['id'] for r in history] == [ids[1], ids[3], ids[2], ids[0]]
+    by_id = {r['id']: r for r in history}
+    assert [i['description'] for i in by_id[ids[0]]['items']] == ['Milch', 'Kaffee']
+    assert by_id[ids[0]]['totals_by_user'] == {'david': 0, 'eser': 6.99} and by_id[ids[0]]['total'] == 8.18
+    assert by_id[ids[2]]['totals_by_user'] == {'david': 1.19, 'eser': 0}   # summed from its items
+    assert by_id[ids[1]]['total'] == 2.49 and by_id[ids[3]]['is_settlement']
+
+
+def test_all_time_balances_from_the_snapshot_match_a_full_replay(db):
+    group_id, _ = _seed(db)
+    app_module.compact_balance_snapshots(db, group_id)   # January and February are closed
+    _receipt(db, group_id, 'david', date.today(), [('Käse', 3.33, 'shared')])
+    ctx = _request()
+    try:
+        assert app_module.get_balances_as_of(group_id) == app_module.calculate_balances_detailed(group_id)
+        tail = app_module.load_group_snapshot(group_id, scope='unsnapshotted')
+        assert len(tail) == 2   # this month's: the new one and the undated one (uploaded today)
+    finally:
+        ctx.pop()
+
+
+def test_memory_learns_from_snapshot_items(db):
+    group_id, _ = _seed(db)
+    ctx = _request()
+    try:
+        entries = {e['match_key']: e for e in app_module.get_memory_entries(group_id)}
+    finally:
+        ctx.pop()
+    # Two 'Milch' items: shared, then david; the tie goes to the most recent.
+    assert entries['milch']['count'] == 2 and entries['milch']['learned'] == 'david'
+    assert 'bier' not in entries   # only assigned to 'excluded'
+
+
+def test_compaction_waits_for_an_edit_that_invalidates_its_month(db):
+    group_id, ids = _seed(db)
+    writer = app_module.connect_db()
+    compactor = app_module.connect_db()
+    try:
+        wcur = writer.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        # An edit in January, not yet committed: its invalidation finds no snapshot.
+        app_module._invalidate_snapshots(wcur, group_id, ids[0])
+        wcur.execute("UPDATE items SET assigned_to = 'david' WHERE receipt_id = %s", (ids[0],))
+        app_module._refresh_receipt_summaries(wcur, [ids[0]])
+
+        def compact():
+            with compactor, compactor.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                app_module.compact_balance_snapshots(cur, group_id)
+        thread = threading.Thread(target=compact)
+        thread.start()
+        thread.join(0.5)
+        assert thread.is_alive()   # blocked on the group's snapshot lock
+        writer.commit()
+        thread.join(5)
+    finally:
+        writer.close()
+        compactor.close()
+
+    db.execute("SELECT shared_total_cents FROM balance_snapshot_months WHERE group_id = %s AND month = '2025-01-01'",
+               (group_id,))
+    assert db.fetchone()['shared_total_cents'] == 0   # built from the edited receipt
@@ -0,0 +1,130 @@
+"""Tests for the lean (compact) history rendering and the item edits."""
+import threading
+from datetime import date
+
+import psycopg2.extras
+import pytest
+
+import app as app_module
+from app import app, history_payload, render_template, _parse_batch_ops, receipt_totals
+from benchmarks.history_render import synthetic_history
+
+MEMBERS = [{'id': 'a', 'name': 'A'}, {'id': 'b', 'name': 'B'}]
+
+
+def render(receipts, compact):
+    with app.test_request_context('/history'):
+        kwargs = {'payload': history_payload(receipts)} if compact else {}
+        return render_template('history.html', receipts=receipts, current_sort='upload_date',
+                               compact=compact, all_users=MEMBERS, **kwargs)
+
+
+def test_payload_items_are_compact_rows():
+    receipts = synthetic_history(2, ['a', 'b'])
+    payload = history_payload(receipts)
+    first = receipts[0]['items'][0]
+    assert payload[0]['items'][0] == [first['id'], first['description'], first['price'], first['assigned_to']]
+    assert payload[0]['date'] == receipts[0]['date'].isoformat()
+
+
+def test_compact_view_has_no_per_item_forms():
+    receipts = synthetic_history(50, ['a', 'b'])
+    full, compact = render(receipts, False), render(receipts, True)
+    assert full.count('name="item_id"') > 100
+    assert compact.count('name="item_id"') == 0
+    assert compact.count('id="itemEditor"') == 1   # the single shared editor
+    assert len(compact) < len(full) / 5
+
+
+def test_batch_ops_parse_all_kinds():
+    ops, error = _parse_batch_ops([
+        {'op': 'reassign', 'item_id': '7', 'assigned_to': 'a'},
+        {'op': 'delete', 'item_id': 8},
+        {'op': 'add', 'receipt_id': 3, 'description': ' Milk ', 'price': '1.99', 'assigned_to': 'shared'},
+        {'op': 'redate', 'receipt_id': 3, 'bill_date': '2025-02-01'},
+    ], {'a', 'b'})
+    assert error is None
+    assert ops[0] == {'op': 'reassign', 'item_id': 7, 'assigned_to': 'a'}
+    assert ops[2]['description'] == 'Milk' and ops[2]['price_cents'] == 199
+    assert ops[3]['bill_date'] == date(2025, 2, 1)
+
+
+def test_batch_ops_reject_bad_input():
+    members = {'a'}
+    assert _parse_batch_ops([], members)[1] == 'No operations given.'
+    assert 'invalid assignment' in _parse_batch_ops(
+        [{'op': 'reassign', 'item_id': 1, 'assigned_to': 'mallory'}], members)[1]
+    assert 'invalid assignment' in _parse_batch_ops(   # can't add an excluded item
+        [{'op': 'add', 'receipt_id': 1, 'description': 'x', 'price': 1, 'assigned_to': 'excluded'}], members)[1]
+    assert 'malformed' in _parse_batch_ops([{'op': 'redate', 'receipt_id': 1, 'bill_date': 'soon'}], members)[1]
+    assert 'malformed' in _parse_batch_ops([{'op': 'add', 'receipt_id': 1}], members)[1]
+    assert 'unknown op' in _parse_batch_ops([{'op': 'merge'}], members)[1]
+
+
+def test_receipt_totals_ignore_excluded_and_removed_members():
+    totals = receipt_totals({'a': 150, 'shared': 300, 'excluded': 999, 'gone': 50}, ['a', 'b'])
+    assert totals == {'totals_by_user': {'a': 1.5, 'b': 0.0}, 'shared_total': 3.0, 'total': 4.5}
+
+
+def test_batch_rejects_non_object_bodies(db, member_client):
+    for body in ([], 3, 'ops'):
+        resp = member_client.post('/history/batch', json=body)
+        assert resp.status_code == 400 and 'error' in resp.get_json()
+
+
+def test_batch_totals_of_receipts_without_summary(db, member_client):
+    db.execute("SELECT id FROM groups WHERE name = 'Household'")
+    group_id = db.fetchone()['id']
+    db.execute("INSERT INTO receipts (payer_id, filename, group_id, assignee_cents) "
+               "VALUES ('eser', 'old.jpg', %s, NULL) RETURNING id", (group_id,))
+    receipt_id = db.fetchone()['id']
+    db.execute("INSERT INTO items (receipt_id, description, price, assigned_to) VALUES "
+               "(%s, 'Milch', 1.19, 'shared'), (%s, 'Kaffee', 6.99, 'eser')", (receipt_id, receipt_id))
+    resp = member_client.post('/history/batch', json={'ops': [
+        {'op': 'redate', 'receipt_id': receipt_id, 'bill_date': '2025-02-01'}]})
+    assert resp.status_code == 200, resp.get_json()
+    (receipt,) = resp.get_json()['receipts']
+    assert receipt['total'] == 8.18 and receipt['shared_total'] == 1.19 and receipt['date'] == '2025-02-01'
+
+
+@pytest.mark.parametrize('route,body,rival_sql', [
+    ('/remove_item', lambda i: {'data': {'item_id': i}}, 'DELETE FROM items WHERE id = %s'),
+    ('/update_item', lambda i: {'data': {'item_id': i, 'assigned_to': 'david'}},
+     "UPDATE items SET assigned_to = 'eser' WHERE id = %s"),
+    ('/history/batch', lambda i: {'json': {'ops': [{'op': 'delete', 'item_id': i}]}},
+     'DELETE FROM items WHERE id = %s'),
+    ('/history/batch', lambda i: {'json': {'ops': [{'op': 'reassign', 'item_id': i, 'assigned_to': 'david'}]}},
+     "UPDATE items SET assigned_to = 'eser' WHERE id = %s"),
+], ids=['remove', 'update', 'batch-delete', 'batch-reassign'])
+def test_concurrent_item_edits_keep_receipt_summaries_exact(db, member_client, route, body, rival_sql):
+    db.execute("SELECT id FROM groups WHERE name = 'Household'")
+    group_id = db.fetchone()['id']
+    db.execute("INSERT INTO receipts (payer_id, filename, group_id) VALUES ('eser', 'r.jpg', %s) RETURNING id",
+               (group_id,))
+    receipt_id = db.fetchone()['id']
+    db.execute("INSERT INTO items (receipt_id, description, price, assigned_to) VALUES "
+               "(%s, 'Brot', 2.00, 'shared'), (%s, 'Wein', 3.00, 'shared') RETURNING id", (receipt_id, receipt_id))
+    item_id = db.fetchone()['id']
+    app_module._refresh_receipt_summaries(db, [receipt_id])
+
+    # The same edit, from another request that hasn't committed yet.
+    rival = app_module.connect_db()
+    try:
+        cur = rival.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute(rival_sql, (item_id,))
+        app_module._refresh_receipt_summaries(cur, [receipt_id])
+
+        def post():
+            client = app.test_client()   # its own: a request context can't cross threads
+            with client.session_transaction() as sess:
+                sess['_user_id'] = 'eser'
+            client.post(route, **body(item_id))
+        thread = threading.Thread(target=post)
+        thread.start()
+        thread.join(0.5)
+        rival.commit()
+        thread.join(5)
+    finally:
+        rival.close()
+
+    assert app_module.find_inconsistent_receipt_summaries(db) == []
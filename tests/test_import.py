@@ -0,0 +1,81 @@
+"""Tests for bulk import parsing (the DB side is COPY + set-based SQL)."""
+import io
+from datetime import date, datetime
+
+from app import copy_buffer, export_csv_lines, export_ndjson_lines, parse_import
+
+MEMBERS = [{'id': 'u1', 'name': 'Ann'}, {'id': 'u2', 'name': 'Ben'}]
+NAMES = {'u1': 'Ann', 'u2': 'Ben', 'shared': 'Shared', 'excluded': 'Excluded'}
+
+
+def _export_rows():
+    base = {'bill_date': date(2025, 3, 4), 'upload_date': datetime(2025, 3, 5, 12, 0),
+            'filename': 'bill.pdf', 'total_cents': 0, 'description': 'Milk'}
+    return [
+        {**base, 'receipt_id': 7, 'payer_id': 'u1', 'item_id': 1, 'price_cents': 129, 'assigned_to': 'shared'},
+        {**base, 'receipt_id': 7, 'payer_id': 'u1', 'item_id': 2, 'price_cents': 250, 'assigned_to': 'u2'},
+        {**base, 'receipt_id': 9, 'payer_id': 'u2', 'item_id': None, 'description': None,
+         'price_cents': None, 'assigned_to': None, 'filename': 'Settlement'},
+    ]
+
+
+def test_csv_and_ndjson_exports_round_trip():
+    expected_receipts = [(1, 'u1', 'bill.pdf', date(2025, 3, 4), datetime(2025, 3, 5, 12, 0)),
+                         (2, 'u2', 'Settlement', date(2025, 3, 4), datetime(2025, 3, 5, 12, 0))]
+    expected_items = [(1, 'Milk', '1.29', 'shared'), (1, 'Milk', '2.50', 'u2')]
+    for fmt, to_lines in (('csv', export_csv_lines), ('ndjson', export_ndjson_lines)):
+        text = ''.join(to_lines(_export_rows(), NAMES))
+        receipts, items, errors = parse_import(io.StringIO(text), fmt, MEMBERS)
+        assert errors == []
+        assert receipts == expected_receipts
+        assert items == expected_items
+
+
+def test_invalid_rows_are_reported_with_line_numbers():
+    text = ('receipt_id,payer,description,price,assigned_to\n'
+            '1,Zed,Milk,1.00,shared\n'
+            '2,ann,Milk,abc,shared\n'
+            '3,Ann,Milk,1.00,Carl\n'
+            '4,shared,Milk,1.00,shared\n')
+    receipts, items, errors = parse_import(io.StringIO(text), 'csv', MEMBERS)
+    assert items == []
+    assert errors == ["Line 2: unknown payer 'Zed'", "Line 3: invalid price 'abc'",
+                      "Line 4: unknown assignee 'Carl'", "Line 5: unknown payer 'shared'"]
+
+
+def test_copy_buffer_escapes_text_format():
+    buf = copy_buffer([(1, 'a\tb\\c\nd', None, date(2025, 1, 2))])
+    assert buf.read() == '1\ta\\tb\\\\c\\nd\t\\N\t2025-01-02\n'
+
+
+def test_ndjson_lines_that_are_not_receipt_objects_are_reported():
+    text = '[]\n3\n"x"\n{"payer": "Ann", "items": [1]}\n{oops\n'
+    receipts, items, errors = parse_import(io.StringIO(text), 'ndjson', MEMBERS)
+    assert receipts == [] and items == []
+    assert errors == ['Line 1: expected a JSON object (one receipt per line)',
+                      'Line 2: expected a JSON object (one receipt per line)',
+                      'Line 3: expected a JSON object (one receipt per line)',
+                      "Line 4: 'items' must be a list of objects", 'Line 5: not valid JSON']
+
+
+def test_joint_payer_from_an_export_is_rejected_explicitly():
+    rows = _export_rows()
+    rows[2]['payer_id'] = 'both'
+    names = {**NAMES, 'both': 'Both'}
+    for fmt, to_lines, line_no in (('csv', export_csv_lines, 4), ('ndjson', export_ndjson_lines, 2)):
+        receipts, items, errors = parse_import(io.StringIO(''.join(to_lines(rows, names))), fmt, MEMBERS)
+        assert [r[1] for r in receipts] == ['u1'] and len(items) == 2
+        assert errors == [f"Line {line_no}: payer 'Both' (a joint payment) can't be imported; set the member who paid"]
+
+
+def test_non_finite_and_out_of_range_prices_are_reported():
+    prices = ['NaN', 'nan', 'Infinity', '-inf', '1e400', '1000000.01']
+    text = 'receipt_id,payer,description,price,assigned_to\n' + ''.join(
+        f'{k},Ann,Milk,{price},shared\n' for k, price in enumerate(prices))
+    receipts, items, errors = parse_import(io.StringIO(text), 'csv', MEMBERS)
+    assert items == []
+    assert errors == [f"Line {k + 2}: invalid price '{price}'" for k, price in enumerate(prices)]
+    line = '{"payer": "Ann", "items": [{"description": "Milk", "price": NaN}]}\n'
+    assert parse_import(io.StringIO(line), 'ndjson', MEMBERS)[2] == ["Line 1: invalid price 'nan'"]
+    ok = parse_import(io.StringIO('payer,description,price\nAnn,Car,-1000000.00\n'), 'csv', MEMBERS)
+    assert ok[1] == [(1, 'Car', '-1000000.00', 'shared')] and ok[2] == []
@@ -0,0 +1,69 @@
+"""Tests for request timing, spans, Prometheus output and the profiler."""
+import threading
+import time
+
+import app as app_module
+from app import Histogram, SamplingProfiler, app, fold_stack, prometheus_histogram, span
+
+
+def test_prometheus_histogram_text_format():
+    hist = Histogram(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 2.0):
+        hist.observe(seconds)
+    lines = prometheus_histogram('x_seconds', 'Help.', {'/a"b': hist}, 'route')
+    assert lines[:2] == ['# HELP x_seconds Help.', '# TYPE x_seconds histogram']
+    assert 'x_seconds_bucket{route="/a\\"b",le="0.1"} 1' in lines
+    assert 'x_seconds_bucket{route="/a\\"b",le="1.0"} 2' in lines
+    assert 'x_seconds_bucket{route="/a\\"b",le="+Inf"} 3' in lines
+    assert 'x_seconds_count{route="/a\\"b"} 3' in lines
+    assert prometheus_histogram('y', 'H.', Histogram())[-1] == 'y_count 0'
+
+
+def test_requests_get_server_timing_and_metrics(monkeypatch):
+    monkeypatch.setattr(app_module, 'SERVER_TIMING', True)
+    monkeypatch.setattr(app_module, 'METRICS_TOKEN', 's3cret')
+    with app.test_client() as client:
+        resp = client.get('/login')
+        assert 'db;dur=' in resp.headers['Server-Timing']
+        body = client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).get_data(as_text=True)
+    assert 'splight_request_duration_seconds_count{route="/login"}' in body
+    assert 'splight_request_queries_bucket{route="/login",le="1"}' in body
+
+
+def test_server_timing_only_for_members_unless_enabled(db, member_client):
+    with app.test_client() as anonymous:
+        assert 'Server-Timing' not in anonymous.get('/login').headers
+    assert 'db;dur=' in member_client.get('/').headers['Server-Timing']
+
+
+def test_metrics_token(monkeypatch):
+    with app.test_client() as client:
+        assert client.get('/metrics').status_code == 404   # no token configured: never served
+        monkeypatch.setattr(app_module, 'METRICS_TOKEN', 's3cret')
+        assert client.get('/metrics').status_code == 404
+        assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 404
+        assert client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+
+
+def test_span_records_into_request_and_histogram():
+    with app.test_request_context('/'):
+        app.preprocess_request()
+        with span('unit_test_stage'):
+            time.sleep(0.01)
+        assert [name for name, _ in app_module.g.spans] == ['unit_test_stage']
+    assert app_module.span_latency['unit_test_stage'].snapshot()['count'] >= 1
+
+
+def test_sampling_profiler_collects_folded_stacks():
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start(threading.get_ident())
+
+    def busy_leaf():
+        end = time.perf_counter() + 0.1
+        while time.perf_counter() < end:
+            pass
+
+    busy_leaf()
+    samples = profiler.stop(threading.get_ident())
+    assert samples and any(stack.endswith('busy_leaf (test_instrumentation.py)') for stack in samples)
+    assert fold_stack(None) == ''
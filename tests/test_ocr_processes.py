@@ -0,0 +1,44 @@
+"""Receipt extraction in the OCR process pool (OCR_PROCESSES > 0)."""
+import pytest
+
+import app as app_module
+from benchmarks import generators
+
+
+@pytest.fixture
+def ocr_pool(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # the OCR process writes previews to ./uploads
+    monkeypatch.setattr(app_module, 'OCR_PROCESSES', 1)
+    monkeypatch.setattr(app_module, '_ocr_pool', None)
+    yield
+    if app_module._ocr_pool is not None:
+        app_module._ocr_pool.shutdown()
+
+
+def _picnic_pdf():
+    items = [{'description': f'Bio Product {k}', 'price_cents': 100 + k} for k in range(6)]
+    pages, expected = generators.picnic_pages(items)
+    return generators.picnic_pdf(pages), expected
+
+
+def test_extraction_runs_in_a_separate_process(ocr_pool, monkeypatch):
+    monkeypatch.setattr(app_module, 'span_latency', {})
+    pdf, expected = _picnic_pdf()
+    stages = []
+    result = app_module.run_extraction('2025-02-03_picnic.pdf', pdf, on_stage=stages.append)
+    assert result['parsed_items'] == expected
+    assert result['bill_date'] == '2025-02-03'
+    assert stages == ['received', 'preprocessed', 'ocr']
+    # Spans measured in the OCR process are recorded in this one.
+    assert {'ocr_queue', 'pdf_text', 'digital_parser'} <= set(app_module.span_latency)
+
+
+def test_extraction_errors_cross_the_process_boundary(ocr_pool):
+    with pytest.raises(app_module.ReceiptExtractionError, match='Unsupported file type'):
+        app_module.run_extraction('notes.txt', b'hello')
+
+
+def test_in_process_by_default(monkeypatch):
+    monkeypatch.setattr(app_module, '_extract_receipt', lambda *args: 'in-process')
+    assert app_module.OCR_PROCESSES == 0
+    assert app_module.run_extraction('x.pdf', b'') == 'in-process'
@@ -0,0 +1,97 @@
+"""PDF extraction: page cap, page-1 vendor detection, scanned pages."""
+import io
+import json
+import os
+
+import pdfplumber
+import pytest
+from PIL import Image
+
+import app as app_module
+from benchmarks import generators
+
+
+@pytest.fixture(autouse=True)
+def upload_folder(monkeypatch, tmp_path):
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+
+
+@pytest.fixture
+def text_reads(monkeypatch):
+    """Count page.extract_text() calls."""
+    calls = []
+    original = pdfplumber.page.Page.extract_text
+
+    def counting(page, *args, **kwargs):
+        calls.append(page.page_number)
+        return original(page, *args, **kwargs)
+
+    monkeypatch.setattr(pdfplumber.page.Page, 'extract_text', counting)
+    return calls
+
+
+def _scanned_pdf(pages):
+    images = [Image.new('RGB', (300, 400), 'white') for _ in range(pages)]
+    buf = io.BytesIO()
+    images[0].save(buf, 'PDF', save_all=True, append_images=images[1:])
+    return buf.getvalue()
+
+
+def test_long_pdf_is_refused_before_reading_pages(monkeypatch, text_reads):
+    monkeypatch.setattr(app_module, 'MAX_PDF_PAGES', 3)
+    with pytest.raises(app_module.ReceiptExtractionError, match='4 pages.*at most 3'):
+        app_module._extract_receipt('statement.pdf', _scanned_pdf(4))
+    assert text_reads == []
+
+
+def test_digital_vendor_reads_only_the_first_page_text(text_reads):
+    items = [{'description': f'Bio Product {k}', 'price_cents': 150 + k} for k in range(30)]
+    pages, expected = generators.picnic_pages(items)
+    result = app_module._extract_receipt('picnic.pdf', generators.picnic_pdf(pages))
+    assert result['parsed_items'] == expected
+    assert text_reads == [1]
+    assert len(result['image_files']) == len(pages)
+
+
+def test_digital_vendor_without_items_falls_back_to_the_text(monkeypatch, text_reads):
+    items = [{'description': f'Bio Product {k}', 'price_cents': 150 + k} for k in range(30)]
+    pages, _ = generators.picnic_pages(items)
+    picnic = app_module.detect_vendor('picnic')
+    monkeypatch.setattr(picnic, 'parse_pdf', lambda pdf: [])
+    texts = []
+    monkeypatch.setattr(app_module, 'parse_bill_text',
+                        lambda text: texts.append(text) or [{'description': 'Parsed', 'price': 1.0}])
+    result = app_module._extract_receipt('picnic.pdf', generators.picnic_pdf(pages))
+    assert text_reads == list(range(1, len(pages) + 1))
+    assert texts[0].count('--PAGE BREAK--') == len(pages)
+    assert result['parsed_items'] == [{'description': 'Parsed', 'price': 1.0}]
+
+
+def test_scanned_pdf_pages_go_through_ocr(monkeypatch):
+    with open(os.path.join(os.path.dirname(__file__), 'fixtures', 'vendors', 'rewe.json')) as f:
+        rewe = json.load(f)
+    ocr_inputs = []
+
+    def fake_ocr(img, **kwargs):
+        ocr_inputs.append(img.size)
+        return rewe['text'] if len(ocr_inputs) == 1 else ''
+
+    monkeypatch.setattr(app_module.pytesseract, 'image_to_string', fake_ocr)
+    monkeypatch.setattr(app_module, 'SCANNED_PDF_DPI', 144)
+    stages = []
+    result = app_module._extract_receipt('scan.pdf', _scanned_pdf(2), on_stage=stages.append)
+    assert len(ocr_inputs) == 2 and len(result['image_files']) == 2
+    assert ocr_inputs[0][0] == 600  # 300pt page rendered at 144 DPI
+    assert [i['description'] for i in result['parsed_items']] == [i['description'] for i in rewe['items']]
+    assert stages == ['received', 'preprocessed', 'ocr']
+
+
+def test_scanned_a4_page_renders_no_larger_than_ocr_uses(monkeypatch):
+    monkeypatch.setattr(app_module.pytesseract, 'image_to_string', lambda *a, **k: '')
+    rendered = []
+    prepare = app_module._prepare_for_ocr
+    monkeypatch.setattr(app_module, '_prepare_for_ocr', lambda img: rendered.append(img.size) or prepare(img))
+    buf = io.BytesIO()
+    Image.new('RGB', (595, 842), 'white').save(buf, 'PDF')   # A4 in points at 72 DPI
+    app_module._extract_receipt('scan.pdf', buf.getvalue())
+    assert max(rendered[0]) == app_module.OCR_MAX_DIM   # ~154 DPI, not the 200 DPI cap
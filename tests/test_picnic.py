@@ -7,7 +7,7 @@ import os
 
 import pytest
 
-from app import parse_picnic_words, parse_picnic_pdf, DIGITAL_PDF_PARSERS
+from app import parse_picnic_words, parse_picnic_pdf, detect_vendor
 
 
 def w(text, x0, top, size):
@@ -66,9 +66,8 @@ def test_sum_of_items():
 
 
 def test_detector_matches_picnic_text():
-    detect = DIGITAL_PDF_PARSERS[0][0]
-    assert detect('… Dein Bon … Picnic GmbH …') is True
-    assert detect('EDEKA Filiale 1234 Bergmannstraße') is False
+    assert detect_vendor('… Dein Bon … Picnic GmbH …').name == 'picnic'
+    assert detect_vendor('EDEKA Filiale 1234 Bergmannstraße').name != 'picnic'
 
 
 def test_multiple_pages_concatenate():
@@ -76,6 +75,23 @@ def test_multiple_pages_concatenate():
     assert len(items) == 6
 
 
+def test_layout_index_matches_full_scan():
+    # Long single pages with jittered coordinates (ties, near-misses at the
+    # window edges) parse exactly as the old full-scan implementation did.
+    import random
+
+    from benchmarks.picnic_layout import scan_parse_picnic_words, synthetic_pages
+    rng = random.Random(7)
+    for lines in (1, 30, 200):
+        page = synthetic_pages(lines, seed=lines)[0]
+        for jitter in (0, 0.5, 2.5):
+            words = [dict(word, top=word['top'] + rng.choice((0, rng.uniform(-jitter, jitter)))) for word in page]
+            words += [w(str(rng.randint(0, 99)), 398, rng.choice(words)['top'] + rng.choice((-3, 9)), 8)
+                      for _ in range(lines // 10)]
+            assert parse_picnic_words([words]) == scan_parse_picnic_words([words])
+    assert parse_picnic_words([_synthetic_page()]) == scan_parse_picnic_words([_synthetic_page()])
+
+
 # Optional end-to-end smoke test against the real receipt, kept OUT of git.
 # Drop the file at tests/fixtures/picnic_sample.pdf to run it locally.
 _FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'picnic_sample.pdf')
@@ -0,0 +1,104 @@
+"""Query budgets per route, against a real Postgres (see conftest.py).
+
+Each route has a fixed statement budget, and its statement count must not
+grow with the amount of history - a per-receipt or per-item query (N+1)
+fails here long before it shows up in production latency."""
+import io
+from datetime import date
+
+import pytest
+from PIL import Image
+
+import app as app_module
+
+# Statements per warm request (session identity and roster cached), with one
+# receipt for save_details. History, balances and memory read the roster,
+# receipts and items through one group snapshot statement.
+BUDGETS = {
+    'history': 1,
+    'history_compact': 1,
+    'balances': 4,
+    'memory': 2,
+    'upload_bill': 3,
+    'save_details': 6,
+}
+
+
+def seed(db, n_receipts, items_per_receipt):
+    """n_receipts receipts over a few months, paid alternately by the two
+    seeded members, with a mix of shared/personal/excluded items."""
+    db.execute("SELECT id FROM groups WHERE name = 'Household'")
+    group_id = db.fetchone()['id']
+    for k in range(n_receipts):
+        db.execute(
+            'INSERT INTO receipts (payer_id, filename, bill_date, group_id) VALUES (%s, %s, %s, %s) RETURNING id',
+            (('eser', 'david')[k % 2], f'bill-{k}.pdf', date(2025, 1 + k % 6, 1 + k % 28), group_id)
+        )
+        receipt_id = db.fetchone()['id']
+        app_module.psycopg2.extras.execute_values(
+            db, 'INSERT INTO items (receipt_id, description, price, assigned_to) VALUES %s',
+            [(receipt_id, f'Item {j}', 1 + j * 0.25, ('shared', 'eser', 'david', 'excluded')[j % 4])
+             for j in range(items_per_receipt)]
+        )
+    db.execute('SELECT id FROM receipts')
+    app_module._refresh_receipt_summaries(db, [r['id'] for r in db.fetchall()])
+
+
+def _pdf_upload():
+    buf = io.BytesIO()
+    Image.new('RGB', (600, 800), 'white').save(buf, 'PDF')
+    buf.seek(0)
+    return buf
+
+
+def _save_form(n_receipts, items_per_receipt):
+    form = {'receipt_count': str(n_receipts)}
+    for r in range(n_receipts):
+        form.update({f'r{r}_filename': f'up-{r}.pdf', f'r{r}_bill_date': '2025-03-01', f'r{r}_payer_id': 'eser'})
+        for j in range(items_per_receipt):
+            form.update({f'r{r}_item_description_{j}': f'Thing {j}', f'r{r}_item_price_{j}': '2.50',
+                         f'r{r}_assigned_to_{j}': ('shared', 'eser', 'david')[j % 3]})
+    return form
+
+
+ROUTES = {
+    'history': lambda c: c.get('/history?view=full'),
+    'history_compact': lambda c: c.get('/history?view=compact'),
+    'balances': lambda c: c.get('/balances'),
+    'memory': lambda c: c.get('/memory'),
+    'upload_bill': lambda c: c.post('/upload', data={'bill_image': (_pdf_upload(), 'scan.pdf')},
+                                    content_type='multipart/form-data'),
+}
+
+
+def _statements(query_log, client, call, warm_up=True):
+    """Statements of one request, after an identical warm-up request (so the
+    session identity and roster caches are populated, as in steady state)."""
+    if warm_up:
+        call(client)
+    query_log.clear()
+    response = call(client)
+    assert response.status_code in (200, 302), response.status_code
+    (_, statements), = query_log
+    return statements
+
+
+@pytest.mark.parametrize('route', sorted(ROUTES))
+def test_route_query_budget_is_flat(route, db, member_client, query_log, tmp_path, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    seed(db, 3, 4)
+    small = _statements(query_log, member_client, ROUTES[route])
+    seed(db, 60, 12)
+    large = _statements(query_log, member_client, ROUTES[route])
+    assert len(large) <= BUDGETS[route], '\n'.join(large)
+    assert len(large) == len(small), f'{route} grows with history: {len(small)} -> {len(large)}'
+
+
+def test_save_details_query_budget_is_flat(db, member_client, query_log):
+    seed(db, 3, 4)
+    few = _statements(query_log, member_client, lambda c: c.post('/save_details', data=_save_form(1, 2)))
+    many = _statements(query_log, member_client, lambda c: c.post('/save_details', data=_save_form(1, 40)))
+    assert len(many) <= BUDGETS['save_details'], '\n'.join(many)
+    assert len(many) == len(few), f'save_details grows with items: {len(few)} -> {len(many)}'
+    db.execute("SELECT item_count, total FROM receipts WHERE filename = 'up-0.pdf' ORDER BY id")
+    assert {(r['item_count'], float(r['total'])) for r in db.fetchall()} == {(2, 5.0), (40, 100.0)}
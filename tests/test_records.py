@@ -0,0 +1,55 @@
+"""Tests for the compact records and snapshot-backed history shaping (pure,
+no database)."""
+from array import array
+
+import pytest
+
+from app import GroupSnapshot, ItemRecord, ReceiptRecord
+from benchmarks.records_memory import (corpus, dict_balances, dict_bill_history, record_balances,
+                                       record_bill_history, traced)
+
+
+@pytest.fixture(scope='module')
+def household():
+    users, receipt_rows, item_rows = corpus(members=4, years=2, items_mean=20)
+    return users, receipt_rows, item_rows, [u['id'] for u in users]
+
+
+def test_records_read_like_dict_rows():
+    item = ItemRecord(7, 3, 'Milch', 119, 'shared')
+    assert item['price'] == item.price == 1.19 and item['price_cents'] == 119
+    assert item.get('assigned_to') == 'shared' and item.get('nope', 0) == 0
+    with pytest.raises(KeyError):
+        item['nope']
+    assert not hasattr(item, '__dict__')
+    receipt = ReceiptRecord(3, 'a', 'Settlement', None, {})
+    assert receipt['is_settlement'] and receipt == ReceiptRecord(3, 'a', 'Settlement', None, {})
+
+
+def test_snapshot_integer_columns_are_arrays():
+    snapshot = GroupSnapshot(1, 'all', {'id': [2, 1], 'payer_id': ['a', 'b']},
+                             {'id': [5], 'receipt_id': [2], 'price_cents': [250], 'description': ['X']})
+    assert isinstance(snapshot.receipts['id'], array) and isinstance(snapshot.items['price_cents'], array)
+    assert isinstance(snapshot.receipts['payer_id'], list) and len(snapshot) == 2
+
+
+def test_history_from_records_matches_dict_rows(household):
+    users, receipt_rows, item_rows, user_ids = household
+    expected = dict_bill_history(receipt_rows, item_rows, user_ids)
+    history = record_bill_history(receipt_rows, item_rows, user_ids)
+    assert [r['id'] for r in history] == [r['id'] for r in expected]
+    for got, want in zip(history, expected):
+        items = [{f: i[f] for f in ('id', 'description', 'assigned_to', 'price_cents', 'price')} for i in got['items']]
+        assert {**got, 'items': items} == want
+
+
+def test_balances_from_records_match_dict_rows(household):
+    users, receipt_rows, _, _ = household
+    assert record_balances(users, receipt_rows)[0] == dict_balances(users, receipt_rows)[0]
+
+
+def test_records_use_less_memory(household):
+    users, receipt_rows, item_rows, user_ids = household
+    _, dict_peak, dict_retained, _ = traced(dict_bill_history, receipt_rows, item_rows, user_ids)
+    _, peak, retained, _ = traced(record_bill_history, receipt_rows, item_rows, user_ids)
+    assert retained < dict_retained / 2 and peak < dict_peak / 2
@@ -0,0 +1,129 @@
+"""Tests for the pooled Supabase (GoTrue) client, against a local stub server."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app
+
+
+class StubGoTrue(BaseHTTPRequestHandler):
+    """Replies from a per-test script of (status, body) and records each
+    request's path, apikey header and client port."""
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self.server.seen.append((self.path, self.headers.get('apikey'), self.client_address[1]))
+        status, body = self.server.script.pop(0) if self.server.script else (200, {'ok': True})
+        if status is None:   # drop the connection after the request arrived
+            self.close_connection = True
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def gotrue(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubGoTrue)
+    server.seen, server.script = [], []
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    monkeypatch.setattr(app, 'SUPABASE_URL', f'http://127.0.0.1:{server.server_port}')
+    monkeypatch.setattr(app, 'SUPABASE_ANON_KEY', 'anon-test-key')
+    monkeypatch.setattr(app, '_auth_http', app._new_auth_session())
+    monkeypatch.setattr(app, '_auth_breaker', app.CircuitBreaker(threshold=2, cooldown=60))
+    monkeypatch.setattr(app, '_retry_delay', lambda attempt: 0)
+    monkeypatch.setattr(app, 'auth_latency', {})
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_returns_status_and_json(gotrue):
+    gotrue.script = [(400, {'error_description': 'Email not confirmed'})]
+    status, data = app.supabase_auth('POST', '/token?grant_type=password', json={'email': 'a@b.c'})
+    assert status == 400
+    assert data == {'error_description': 'Email not confirmed'}
+    assert gotrue.seen[0][:2] == ('/auth/v1/token?grant_type=password', 'anon-test-key')
+
+
+def test_connection_is_reused_between_calls(gotrue):
+    for _ in range(3):
+        assert app.supabase_auth('POST', '/resend', json={})[0] == 200
+    ports = {port for _, _, port in gotrue.seen}
+    assert len(gotrue.seen) == 3 and len(ports) == 1
+
+
+def test_gateway_errors_are_retried(gotrue):
+    gotrue.script = [(503, {}), (502, {}), (200, {'id': 'u1'})]
+    assert app.supabase_auth('POST', '/signup', json={}) == (200, {'id': 'u1'})
+    assert len(gotrue.seen) == 3
+
+
+def test_post_is_not_retried_when_it_may_have_been_processed(gotrue):
+    gotrue.script = [(504, {}), (200, {'id': 'u1'})]
+    assert app.supabase_auth('POST', '/signup', json={})[0] == 503
+    gotrue.script = [(None, None), (200, {'id': 'u1'})]   # connection aborted mid-request
+    assert app.supabase_auth('POST', '/recover', json={})[0] == 503
+    assert len(gotrue.seen) == 2
+
+
+def test_idempotent_calls_retry_any_gateway_failure(gotrue):
+    gotrue.script = [(504, {}), (None, None), (200, {'id': 'u1'})]
+    assert app.supabase_auth('GET', '/user') == (200, {'id': 'u1'})
+    assert len(gotrue.seen) == 3
+
+
+def test_connect_failures_are_retried_for_posts(gotrue, monkeypatch):
+    monkeypatch.setattr(app, 'SUPABASE_URL', 'http://127.0.0.1:9')   # nothing listens there
+    assert app.supabase_auth('POST', '/signup', json={})[0] == 503
+    assert app.auth_latency['/signup'].snapshot()['count'] == app.SUPABASE_MAX_RETRIES + 1
+
+
+def test_pool_holds_a_connection_per_web_thread():
+    assert app._new_auth_session().get_adapter('https://x')._pool_maxsize == app.WEB_THREADS
+
+
+def test_client_errors_are_not_retried(gotrue):
+    gotrue.script = [(422, {'msg': 'weak password'})]
+    assert app.supabase_auth('POST', '/signup', json={}) == (422, {'msg': 'weak password'})
+    assert len(gotrue.seen) == 1
+
+
+def test_breaker_opens_and_fails_fast(gotrue):
+    gotrue.script = [(503, {})] * 6  # two calls x three attempts
+    for _ in range(2):
+        assert app.supabase_auth('POST', '/recover', json={})[0] == 503
+    calls = len(gotrue.seen)
+    status, data = app.supabase_auth('POST', '/recover', json={})
+    assert status == 503 and 'unavailable' in data['error_description']
+    assert len(gotrue.seen) == calls  # rejected without touching the network
+
+
+def test_latency_recorded_per_endpoint(gotrue):
+    app.supabase_auth('POST', '/token?grant_type=password', json={})
+    app.supabase_auth('POST', '/token?grant_type=password', json={})
+    app.supabase_auth('POST', '/resend', json={})
+    assert app.auth_latency['/token'].snapshot()['count'] == 2
+    assert app.auth_latency['/resend'].snapshot()['count'] == 1
+
+
+def test_breaker_half_open_allows_one_trial():
+    breaker = app.CircuitBreaker(threshold=1, cooldown=0)
+    breaker.record_failure()
+    assert breaker.allow() is True    # trial call
+    assert breaker.allow() is False   # only one at a time
+    breaker.record_success()
+    assert breaker.allow() is True
@@ -0,0 +1,93 @@
+"""Tests for the thumbnail endpoint, its LRU disk cache and single-flight."""
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import app as app_module
+from app import ThumbnailCache, app, snap_thumb_width, store_preview
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.config, 'LOGIN_DISABLED', True)
+    with app.app_context():
+        name = store_preview(Image.new('L', (1200, 1600), 180))
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['pending_previews'] = [name]
+        client.preview = name
+        yield client
+
+
+def test_widths_snap_to_configured_sizes():
+    assert [snap_thumb_width(w) for w in (1, 160, 161, 500, 5000)] == [160, 160, 320, 640, 640]
+
+
+def test_thumbnail_is_resized_and_cacheable(client):
+    resp = client.get(f'/uploads/{client.preview}/thumb?w=300')
+    assert resp.status_code == 200
+    with Image.open(os.path.join(app.config['UPLOAD_FOLDER'], 'thumbs',
+                                 client.preview.replace('.', '_w320.'))) as thumb:
+        assert thumb.size == (320, 427)
+    assert 'immutable' in resp.headers['Cache-Control']
+    assert client.get(f'/uploads/{client.preview}/thumb?w=300',
+                      headers={'If-None-Match': resp.headers['ETag']}).status_code == 304
+
+
+def test_lru_cache_evicts_to_budget(tmp_path):
+    cache = ThumbnailCache(str(tmp_path), budget=250)
+    for name in ('a', 'b', 'c'):
+        cache.put(name, b'x' * 100)
+    assert cache.get('a') is None and sorted(os.listdir(tmp_path)) == ['b', 'c']
+    cache.get('b')                       # b is now most recent
+    cache.put('d', b'x' * 100)
+    assert sorted(os.listdir(tmp_path)) == ['b', 'd'] and cache.total_bytes == 200
+
+
+def test_concurrent_requests_render_once(client, monkeypatch):
+    calls = []
+    real = app_module.render_thumbnail
+
+    def slow_render(path, width):
+        calls.append(width)
+        time.sleep(0.2)
+        return real(path, width)
+
+    monkeypatch.setattr(app_module, 'render_thumbnail', slow_render)
+    statuses = []
+
+    def fetch():
+        with app.test_client() as c:
+            with c.session_transaction() as sess:
+                sess['pending_previews'] = [client.preview]
+            statuses.append(c.get(f'/uploads/{client.preview}/thumb?w=160').status_code)
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert statuses == [200] * 8
+    assert calls == [160]
+
+
+def test_render_failure_serves_the_full_preview(client, monkeypatch):
+    def broken_render(path, width):
+        raise OSError('decoder crashed')
+
+    monkeypatch.setattr(app_module, 'render_thumbnail', broken_render)
+    resp = client.get(f'/uploads/{client.preview}/thumb?w=160')
+    assert resp.status_code == 200
+    assert resp.data == client.get(f'/uploads/{client.preview}').data
+    assert 'immutable' not in resp.headers['Cache-Control'] and 'no-cache' in resp.headers['Cache-Control']
+
+
+def test_thumbnail_evicted_before_sending_serves_the_full_preview(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'get_thumbnail', lambda filename, width: 'gone_w160.webp')
+    resp = client.get(f'/uploads/{client.preview}/thumb?w=160')
+    assert resp.status_code == 200
+    assert resp.data == client.get(f'/uploads/{client.preview}').data
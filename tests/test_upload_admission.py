@@ -0,0 +1,143 @@
+"""Tests for upload admission: the per-household rate limit, the fair
+scheduler and the 429 responses (OCR stubbed)."""
+import io
+import threading
+
+import pytest
+
+import app as app_module
+from app import FairScheduler, RateLimiter, TokenBucket, UploadRejected
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_and_reports_retry_after():
+    clock = Clock()
+    bucket = TokenBucket(rate=0.5, burst=4, clock=clock)
+    assert bucket.take(3) == 0
+    assert bucket.take(3) == pytest.approx(4.0)   # 1 left, 2 more at 0.5/s
+    clock.now = 4.0
+    assert bucket.take(3) == 0
+    clock.now = 100.0
+    assert bucket.take(10) == 0                    # capped at the bucket: a full bucket admits it
+    assert bucket.take(1) == pytest.approx(2.0)
+
+
+def test_rate_limiter_keeps_a_bucket_per_household():
+    limiter = RateLimiter(per_minute=60, burst=2, clock=Clock())
+    assert limiter.take(1, 2) == 0
+    assert limiter.take(1, 1) == pytest.approx(1.0)
+    assert limiter.take(2, 2) == 0
+    limiter.refund(1, 5)                       # capped at the bucket
+    assert limiter.take(1, 2) == 0 and limiter.take(1, 1) > 0
+
+
+def _blocked_scheduler(**kwargs):
+    """A one-worker scheduler whose worker is stuck on a first call until
+    the returned event is set."""
+    order = []
+    release, started = threading.Event(), threading.Event()
+    scheduler = FairScheduler(1, kwargs.get('max_queued', 100), kwargs.get('max_queued_per_key', 100),
+                              on_wait=kwargs.get('on_wait'), name='test-upload')
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    scheduler.submit('blocker', block)
+    started.wait(5)
+    return scheduler, order, release
+
+
+def test_scheduler_takes_households_round_robin():
+    scheduler, order, release = _blocked_scheduler()
+    futures = scheduler.submit_many('big', [(order.append, (f'big{k}',)) for k in range(5)])
+    futures += scheduler.submit_many('small', [(order.append, (f'small{k}',)) for k in range(2)])
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert order == ['big0', 'small0', 'big1', 'small1', 'big2', 'big3', 'big4']
+
+
+def test_scheduler_bounds_queue_depth():
+    scheduler, _, release = _blocked_scheduler(max_queued=5, max_queued_per_key=3)
+    scheduler.submit_many('a', [(len, ('x',))] * 3)
+    with pytest.raises(UploadRejected) as e:
+        scheduler.submit('a', len, 'x')
+    assert e.value.reason == 'household_queue_full' and e.value.retry_after >= 1
+    scheduler.submit_many('b', [(len, ('x',))] * 2)
+    with pytest.raises(UploadRejected) as e:
+        scheduler.submit('c', len, 'x')
+    assert e.value.reason == 'queue_full'
+    # All or nothing: a batch that doesn't fit queues none of its files.
+    assert scheduler.queued() == 5 and scheduler.queued('c') == 0
+    release.set()
+
+
+def test_scheduler_reports_queue_wait_and_errors():
+    waits = []
+    scheduler, _, release = _blocked_scheduler(on_wait=lambda key, seconds: waits.append((key, seconds)))
+    future = scheduler.submit('a', int, 'not a number')
+    release.set()
+    with pytest.raises(ValueError):
+        future.result(5)
+    assert [key for key, _ in waits] == ['blocker', 'a'] and waits[1][1] > 0
+
+
+def _fake_extract(filename, file_bytes, on_stage=None):
+    return {'filename': filename, 'bill_date': 'Unknown Date', 'total_sum': 2.5, 'image_files': [],
+            'parsed_items': [{'description': 'Milk', 'price': 2.5}]}
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    monkeypatch.setattr(app_module, '_extract_receipt', _fake_extract)
+    monkeypatch.setattr(app_module, '_upload_limiter', RateLimiter(per_minute=6, burst=2))
+
+
+def _files(n):
+    return {'bill_image': [(io.BytesIO(b'x'), f'r{k}.png') for k in range(n)]}
+
+
+def test_streamed_upload_over_the_rate_gets_429(limited, member_client, monkeypatch):
+    monkeypatch.setattr(app_module, 'METRICS_TOKEN', 's3cret')
+    assert member_client.post('/upload/async', data=_files(2)).status_code == 200
+    resp = member_client.post('/upload/async', data=_files(1))
+    assert resp.status_code == 429
+    assert resp.headers['Retry-After'] == '10'
+    assert 'faster than they can be processed' in resp.get_json()['error']
+    metrics = member_client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).get_data(as_text=True)
+    assert 'splight_upload_rejected_total{reason="rate_limited"}' in metrics
+    assert 'splight_upload_queue_wait_seconds_count{household=' in metrics
+
+
+def test_plain_upload_runs_on_the_scheduler_and_gets_429(limited, member_client):
+    resp = member_client.post('/upload', data=_files(2))
+    assert resp.status_code == 200 and b'r1.png' in resp.data
+    resp = member_client.post('/upload', data=_files(1))
+    assert resp.status_code == 429 and int(resp.headers['Retry-After']) >= 1
+    assert b'faster than they can be processed' in resp.data
+
+
+def test_plain_upload_waiting_slots_per_household(limited, member_client, monkeypatch):
+    monkeypatch.setattr(app_module, 'UPLOAD_WAITING_PER_GROUP', 0)
+    resp = member_client.post('/upload', data=_files(1))
+    assert resp.status_code == 429 and b'still being processed' in resp.data
+
+
+def test_uploads_turned_away_later_cost_no_tokens(limited, member_client, monkeypatch):
+    monkeypatch.setattr(app_module, 'UPLOAD_WAITING_PER_GROUP', 0)
+    assert member_client.post('/upload', data=_files(2)).status_code == 429
+    monkeypatch.setattr(app_module, 'UPLOAD_WAITING_PER_GROUP', 2)
+    scheduler = app_module._upload_scheduler
+    monkeypatch.setattr(app_module, '_upload_scheduler', FairScheduler(1, 100, 0, name='test-upload'))
+    resp = member_client.post('/upload/async', data=_files(2))
+    assert resp.status_code == 429 and 'many receipts' in resp.get_json()['error']
+    monkeypatch.setattr(app_module, '_upload_scheduler', scheduler)
+    assert member_client.post('/upload', data=_files(2)).status_code == 200   # the burst is still there
@@ -0,0 +1,63 @@
+"""Tests for /uploads caching headers (authorization via the pending-preview
+session list; the household lookup needs the database)."""
+import pytest
+from PIL import Image
+
+import app as app_module
+from app import app, store_preview
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.config, 'LOGIN_DISABLED', True)
+    monkeypatch.setitem(app.config, 'WTF_CSRF_ENABLED', False)
+    with app.app_context():
+        name = store_preview(Image.new('L', (300, 400), 200))
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['pending_previews'] = [name]
+        client.preview = name
+        yield client
+
+
+def test_preview_is_cached_forever_with_hash_etag(client):
+    resp = client.get(f'/uploads/{client.preview}')
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] == f'"{client.preview.rsplit(".", 1)[0]}"'
+    cache = resp.headers['Cache-Control']
+    assert 'immutable' in cache and 'private' in cache and 'max-age=31536000' in cache
+
+
+def test_conditional_and_range_requests(client):
+    etag = client.get(f'/uploads/{client.preview}').headers['ETag']
+    assert client.get(f'/uploads/{client.preview}', headers={'If-None-Match': etag}).status_code == 304
+    partial = client.get(f'/uploads/{client.preview}', headers={'Range': 'bytes=0-9'})
+    assert partial.status_code == 206 and len(partial.data) == 10
+
+
+def test_x_accel_redirect_hands_off_to_proxy(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'UPLOAD_SENDFILE', 'x-accel')
+    resp = client.get(f'/uploads/{client.preview}')
+    assert resp.headers['X-Accel-Redirect'] == f'/_uploads/{client.preview}'
+    assert resp.data == b'' and 'immutable' in resp.headers['Cache-Control']
+    etag = resp.headers['ETag']
+    assert client.get(f'/uploads/{client.preview}', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_names_outside_the_store_are_not_served(client):
+    assert client.get('/uploads/..%2Fapp.py').status_code == 404
+    assert client.get('/uploads/legacy-upload.png').status_code == 404
+
+
+def test_streamed_preview_stays_viewable_after_its_job_expires(member_client, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    with app.app_context():
+        name = store_preview(Image.new('L', (300, 400), 100))
+    job = app_module.UploadJob('eser', None, ['bill.png'])
+    job.previews.add(name)
+    monkeypatch.setitem(app_module._upload_jobs, job.id, job)
+    assert member_client.get(f'/uploads/{name}').status_code == 200
+    del app_module._upload_jobs[job.id]
+    assert member_client.get(f'/uploads/{name}').status_code == 200
+    assert member_client.get(f'/uploads/{name}/thumb?w=160').status_code == 200
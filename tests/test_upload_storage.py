@@ -0,0 +1,51 @@
+"""Tests for content-addressed preview storage and upload GC."""
+import os
+import time
+
+import pytest
+from PIL import Image, ImageDraw
+
+import app as app_module
+from app import app, orphaned_uploads, preview_names, store_preview
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    return tmp_path
+
+
+def _receipt_image(width=2400, height=3200):
+    img = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(img)
+    for y in range(100, height, 60):
+        draw.text((100, y), 'MILCH 1,29 EUR', fill=0)
+    return img
+
+
+def test_same_content_is_stored_once(upload_dir):
+    first = store_preview(_receipt_image())
+    second = store_preview(_receipt_image())
+    assert first == second
+    assert os.listdir(upload_dir) == [first]
+    assert preview_names(f'{first},../etc/passwd,{first}') == [first, first]
+
+
+def test_preview_is_downscaled_and_compressed(upload_dir):
+    img = _receipt_image()
+    name = store_preview(img)
+    stored = Image.open(upload_dir / name)
+    assert stored.width == app_module.PREVIEW_MAX_WIDTH
+    assert stored.format in ('WEBP', 'JPEG')
+    png = upload_dir / 'lossless.png'
+    img.save(png)
+    assert os.path.getsize(upload_dir / name) < os.path.getsize(png) / 2
+
+
+def test_orphans_respect_references_and_retention(upload_dir):
+    old = time.time() - 3 * 86400
+    for name in ('kept.webp', 'orphan.webp', 'fresh.webp', '.gitkeep'):
+        (upload_dir / name).write_bytes(b'x')
+        if name != 'fresh.webp':
+            os.utime(upload_dir / name, (old, old))
+    assert orphaned_uploads(str(upload_dir), {'kept.webp'}, time.time() - 86400) == ['orphan.webp']
@@ -0,0 +1,71 @@
+"""Tests for streamed uploads: job events and the SSE stream (OCR stubbed)."""
+import json
+import time
+
+import pytest
+
+import app as app_module
+from app import app, render_template
+
+
+def _fake_extract(filename, file_bytes, on_stage=None):
+    on_stage('received')
+    if filename.endswith('.txt'):
+        raise app_module.ReceiptExtractionError('Unsupported file type: txt')
+    time.sleep(0.3 if filename.startswith('slow') else 0)
+    on_stage('preprocessed')
+    on_stage('ocr')
+    return {'filename': filename, 'bill_date': 'Unknown Date', 'total_sum': 2.5, 'image_files': [],
+            'parsed_items': [{'description': 'Milk', 'price': 2.5}]}
+
+
+@pytest.fixture
+def stubbed(monkeypatch):
+    monkeypatch.setattr(app_module, '_extract_receipt', _fake_extract)
+    monkeypatch.setattr(app_module, 'get_assignment_memory', lambda group_id: {'milk': 'u1'})
+
+
+def _messages(job, position=0):
+    with app.test_request_context('/'):
+        out = []
+        for chunk in app_module._upload_event_stream(job, position):
+            if chunk.startswith(':'):
+                continue
+            fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+            out.append((fields['event'], json.loads(fields['data']), fields.get('id')))
+        return out
+
+
+def test_receipts_stream_in_completion_order(stubbed):
+    job = app_module._start_upload_job('u1', 1, [('slow.pdf', b''), ('fast.png', b''), ('bad.txt', b'')])
+    messages = _messages(job)
+    receipts = [data for event, data, _ in messages if event == 'receipt']
+    assert [r['file'] for r in receipts] == [1, 0]        # fastest first
+    assert 'name="r1_filename" value="fast.png"' in receipts[0]['html']
+    assert 'remembered' in receipts[0]['html']            # memory applied
+    failed = [data for event, data, _ in messages if data.get('stage') == 'failed']
+    assert failed == [{'file': 2, 'stage': 'failed', 'elapsed': failed[0]['elapsed'],
+                       'error': 'Unsupported file type: txt'}]
+    stages = [data['stage'] for event, data, _ in messages if event == 'stage' and data['file'] == 0]
+    assert stages == ['received', 'preprocessed', 'ocr']
+    event, done, _ = messages[-1]
+    assert event == 'done' and 0 < done['first_receipt'] < 0.3
+
+
+def test_stream_resumes_after_last_event_id(stubbed):
+    job = app_module._start_upload_job('u1', 1, [('a.png', b''), ('b.png', b'')])
+    first = _messages(job)
+    ids = [int(i) for _, _, i in first if i is not None]
+    assert ids == list(range(len(ids)))
+    resumed = _messages(job, position=ids[-2] + 1)
+    assert [(event, i) for event, _, i in resumed] == [(event, i) for event, _, i in first[-2:]]
+
+
+def test_review_page_placeholders_per_file():
+    job = app_module.UploadJob('u1', 1, ['a.pdf', 'b.pdf'])
+    with app.test_request_context('/'):
+        html = render_template('bill_details.html', receipts=[], job=job,
+                               upload_stages=app_module.UPLOAD_STAGES)
+    assert html.count('class="receipt-slot"') == 2
+    assert 'name="receipt_count" value="2"' in html
+    assert f'/upload/job/{job.id}/events' in html
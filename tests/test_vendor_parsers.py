@@ -0,0 +1,107 @@
+"""Vendor parser registry: fingerprint dispatch and per-vendor fixtures."""
+import io
+import json
+import os
+import random
+
+import pytest
+from PIL import Image
+
+import app as app_module
+from app import VENDOR_PARSERS, TokenAutomaton, detect_vendor
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'vendors')
+
+
+class FixturePdf:
+    """Just enough of a pdfplumber PDF for parse_pdf: pages of stored words."""
+
+    class Page:
+        def __init__(self, words):
+            self.words = words
+
+        def extract_words(self, extra_attrs=None):
+            return self.words
+
+    def __init__(self, pages):
+        self.pages = [self.Page(words) for words in pages]
+
+
+def _fixture_cases():
+    return [pytest.param(parser, name, id=f'{parser.name}-{name}')
+            for parser in VENDOR_PARSERS for name in parser.fixtures]
+
+
+@pytest.mark.parametrize('parser,fixture', _fixture_cases())
+def test_fixture_is_detected_and_parsed(parser, fixture):
+    with open(os.path.join(FIXTURES, fixture)) as f:
+        case = json.load(f)
+    assert detect_vendor(case['text']) is parser
+    if case['source'] == 'pdf':
+        items = parser.parse_pdf(FixturePdf(case['pages']))
+    else:
+        items = parser.parse_text(case['text'])
+    assert [{'description': i['description'], 'price': i['price']} for i in items] == case['items']
+
+
+def test_every_parser_is_complete():
+    names = [p.name for p in VENDOR_PARSERS]
+    assert len(set(names)) == len(names)
+    for parser in VENDOR_PARSERS:
+        assert parser.version and parser.fingerprints and parser.fixtures, parser
+        assert parser.parse_pdf or parser.parse_text, parser
+
+
+def test_automaton_finds_the_same_tokens_as_substring_search():
+    tokens = ['he', 'she', 'his', 'hers', 'rewe markt', 'markt', 'a', 'aab']
+    automaton = TokenAutomaton(tokens)
+    rng = random.Random(5)
+    for _ in range(300):
+        text = ''.join(rng.choice('hersiab mkt') for _ in range(rng.randint(0, 40)))
+        assert automaton.matches(text) == {t for t in tokens if t in text}
+
+
+def test_most_matching_fingerprints_win(monkeypatch):
+    monkeypatch.setattr(app_module, 'VENDOR_PARSERS', [])
+    monkeypatch.setattr(app_module, '_vendor_automaton', None)
+    one = app_module.register_vendor_parser(app_module.VendorParser('one', '1', ('shop', 'alpha')))
+    two = app_module.register_vendor_parser(app_module.VendorParser('two', '1', ('shop', 'beta', 'gamma')))
+    assert detect_vendor('SHOP alpha') is one
+    assert detect_vendor('shop beta gamma alpha') is two
+    assert detect_vendor('shop') is one  # tie: registered first
+    assert detect_vendor('nothing here') is None
+
+
+def test_ocr_text_uses_the_vendor_parser(monkeypatch, tmp_path):
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    with open(os.path.join(FIXTURES, 'rewe.json')) as f:
+        case = json.load(f)
+    monkeypatch.setattr(app_module.pytesseract, 'image_to_string', lambda *a, **k: case['text'])
+    buf = io.BytesIO()
+    Image.new('RGB', (200, 300), 'white').save(buf, 'PNG')
+    result = app_module._extract_receipt('rewe.png', buf.getvalue())
+    # parse_bill_text would have dropped BARILLA ('bar') and HAEHNCHENBRUST ('ust').
+    assert [i['description'] for i in result['parsed_items']] == [i['description'] for i in case['items']]
+
+
+def _parser(name):
+    return next(p for p in VENDOR_PARSERS if p.name == name)
+
+
+def test_vat_class_lines_with_ocr_period_decimals():
+    text = ('REWE Markt GmbH\nBio Vollmilch 1.19 A\nBARILLA Spaghetti 1,49 B\n'
+            'Lose Bananen\n0.642 kg x 2.99 EUR/kg 1.92 A\nSUMME 4.60\n')
+    items = app_module.parse_receipt_text(text, detect_vendor(text))
+    assert [(i['description'], i['price']) for i in items] == [
+        ('Bio Vollmilch', 1.19), ('BARILLA Spaghetti', 1.49), ('Lose Bananen', 1.92)]
+
+
+def test_vendor_parser_without_items_falls_back_to_generic_parsing():
+    text = 'REWE Markt GmbH\nMilch 1,19\nKaffee 6,99\n'
+    assert _parser('rewe').parse_text(text) == []
+    items = app_module.parse_receipt_text(text, _parser('rewe'))
+    assert items and items == app_module.parse_bill_text(text)
+
+
+def test_generic_receipt_words_pick_no_vendor():
+    assert detect_vendor('Bestellnummer 302-1234567\nSumme 12,00\nGesamt 12,00') is None